@@ -0,0 +1,177 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+"""
+Admission Control
+
+Bounds the number of agent runs in flight per worker. Each run holds a model
+connection, a buffered request body and a streaming response, so accepting
+every request during a burst slows all of them down until timeouts cascade.
+
+- at most ADMISSION_MAX_CONCURRENT runs execute at once
+- up to ADMISSION_MAX_QUEUE requests wait for a slot, at most ADMISSION_QUEUE_TIMEOUT seconds
+- when the queue is full the request is rejected right away with 429 and Retry-After
+- queued requests are granted fairly across clients, keyed by the APIM subscription
+  header (ADMISSION_CLIENT_HEADER); ADMISSION_PER_CLIENT_LIMIT optionally caps the
+  runs a single client may hold at once
+"""
+
+import asyncio
+import math
+import os
+import time
+from collections import defaultdict, deque
+
+import metrics
+from asgi_utils import client_key, send_json
+
+_ADMITTED_PATHS = ("/runs", "/responses")
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted (queue full or wait timed out)."""
+
+
+class AdmissionController:
+    """Concurrency limiter with a bounded, per-client fair wait queue."""
+
+    def __init__(
+        self,
+        max_concurrent: int = 8,
+        max_queue: int = 32,
+        queue_timeout: float = 30.0,
+        per_client_limit: int = 0,
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.per_client_limit = per_client_limit
+        self._active = 0
+        self._active_by_client: dict[str, int] = defaultdict(int)
+        self._waiting: dict[str, deque[asyncio.Future]] = defaultdict(deque)
+        self._queued = 0
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController | None":
+        """Create a controller from ADMISSION_* environment variables, or None if disabled."""
+        max_concurrent = int(os.getenv("ADMISSION_MAX_CONCURRENT", "8"))
+        if max_concurrent <= 0:
+            return None
+        return cls(
+            max_concurrent=max_concurrent,
+            max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", "32")),
+            queue_timeout=float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "30")),
+            per_client_limit=int(os.getenv("ADMISSION_PER_CLIENT_LIMIT", "0")),
+        )
+
+    def _can_run(self, client: str) -> bool:
+        return not self.per_client_limit or self._active_by_client.get(client, 0) < self.per_client_limit
+
+    def _grant(self, client: str) -> None:
+        self._active += 1
+        self._active_by_client[client] += 1
+        metrics.gauge("admission.active").set(self._active)
+
+    async def acquire(self, client: str) -> None:
+        """Wait for a run slot; raises AdmissionRejected when the queue is full or the wait times out."""
+        started = time.perf_counter()
+        # Free slots are always handed to eligible waiters first (see _dispatch), so any
+        # request still queued while a slot is free is held by its per-client limit
+        if self._active < self.max_concurrent and self._can_run(client):
+            self._grant(client)
+            metrics.histogram("admission.wait_ms").observe(0.0)
+            return
+
+        if self._queued >= self.max_queue:
+            metrics.counter("admission.rejected").inc()
+            raise AdmissionRejected("queue full")
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiting[client].append(future)
+        self._queued += 1
+        metrics.gauge("admission.queue_depth").set(self._queued)
+        try:
+            await asyncio.wait({future}, timeout=self.queue_timeout)
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release(client)  # Slot granted but the caller went away
+            raise
+        finally:
+            if not future.done():
+                # Timed out or the caller was cancelled: leave the queue
+                future.cancel()
+                self._waiting[client].remove(future)
+                if not self._waiting[client]:
+                    del self._waiting[client]
+                self._queued -= 1
+                metrics.gauge("admission.queue_depth").set(self._queued)
+        if future.cancelled():
+            metrics.counter("admission.rejected").inc()
+            raise AdmissionRejected("timed out waiting for a slot")
+        metrics.histogram("admission.wait_ms").observe((time.perf_counter() - started) * 1000)
+
+    def release(self, client: str) -> None:
+        """Free a run slot and hand it to the next eligible waiter."""
+        self._active -= 1
+        self._active_by_client[client] -= 1
+        if not self._active_by_client[client]:
+            del self._active_by_client[client]
+        metrics.gauge("admission.active").set(self._active)
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Grant free slots to waiting clients, fewest active runs first."""
+        while self._active < self.max_concurrent:
+            eligible = [c for c, queue in self._waiting.items() if queue and self._can_run(c)]
+            if not eligible:
+                return
+            client = min(eligible, key=lambda c: self._active_by_client.get(c, 0))
+            future = self._waiting[client].popleft()
+            if not self._waiting[client]:
+                del self._waiting[client]
+            self._queued -= 1
+            metrics.gauge("admission.queue_depth").set(self._queued)
+            self._grant(client)
+            future.set_result(None)
+
+    def retry_after(self) -> int:
+        """Estimate how many seconds a rejected client should wait before retrying."""
+        typical_run = metrics.histogram("admission.run_ms").percentile(50) or 1000.0
+        waves = (self._queued + 1) / self.max_concurrent
+        return max(1, math.ceil(typical_run / 1000 * waves))
+
+
+class AdmissionMiddleware:
+    """Raw ASGI middleware applying an AdmissionController to POST /runs and /responses."""
+
+    def __init__(self, app, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+        self.client_header = os.getenv("ADMISSION_CLIENT_HEADER", "ocp-apim-subscription-key")
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope.get("method") != "POST"
+            or scope.get("path") not in _ADMITTED_PATHS
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        client = client_key(scope, self.client_header)
+        try:
+            await self.controller.acquire(client)
+        except AdmissionRejected as exc:
+            await send_json(
+                send,
+                429,
+                {"code": "rate_limit_error", "message": f"Server busy: {exc}"},
+                headers={"retry-after": str(self.controller.retry_after())},
+            )
+            return
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            metrics.histogram("admission.run_ms").observe((time.perf_counter() - started) * 1000)
+            self.controller.release(client)
@@ -0,0 +1,492 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+"""
+Artifact Store
+
+Content-addressed store for large tool outputs (generated files, migration
+guides). Instead of putting the full text into the model context, a tool
+stores it here and returns a short handle plus a summary; the model reads
+slices with the ``fetch_artifact`` tool and clients download the artifact from
+``GET /artifacts/{handle}``.
+
+Clients also upload source code here (``POST /uploads``) and then reference it
+as ``code_ref=sha256:...`` in prompts and tool arguments instead of resending
+the file every turn; the tools resolve references locally. Both endpoints
+require ARTIFACTS_TOKEN as a bearer token; without a token configured only
+loopback clients are allowed.
+
+Handles are ``sha256:<hex digest>`` of the content, so storing the same content
+twice is free. Artifacts live in a size-bounded in-memory LRU with a disk tier
+(ARTIFACT_DIR, default .cache/artifacts) shared by every worker. The disk tier
+is bounded too: a background sweep deletes files unused for ARTIFACT_TTL_DAYS
+and then the least recently used ones until it fits in ARTIFACT_DISK_MB (reads
+refresh a file's modification time).
+"""
+
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from urllib.parse import parse_qs, unquote
+
+import metrics
+from asgi_utils import bearer_authorized, get_header, send_bytes, send_json
+
+HANDLE_PREFIX = "sha256:"
+_HANDLE_PATTERN = re.compile(r"^sha256:[0-9a-f]{64}$")
+_CODE_REF_PATTERN = re.compile(r"^\s*(?:code_ref\s*=\s*)?(sha256:[0-9a-f]{64})\s*$")
+_HEADING_PATTERN = re.compile(r"^#{1,3} .+")
+_DEFINITION_PATTERN = re.compile(r"^(?:async )?def \w+|^class \w+")
+# A sweep starts after this share of the disk cap has been written, or this often
+_SWEEP_WRITE_SHARE = 0.1
+_SWEEP_INTERVAL_SECONDS = 600
+# A sweep evicts down to this share of the disk cap, so it does not run on every write
+_SWEEP_TARGET_SHARE = 0.9
+
+logger = logging.getLogger("artifacts")
+
+
+class ArtifactTooLargeError(ValueError):
+    """Raised when content fits in neither tier of the store."""
+
+
+class ArtifactStore:
+    """Content-addressed text store with a memory LRU and a disk tier."""
+
+    def __init__(
+        self,
+        directory: str | None = None,
+        max_memory_bytes: int = 32 * 1024 * 1024,
+        max_disk_bytes: int = 2048 * 1024 * 1024,
+        ttl_seconds: float = 7 * 86400,
+    ):
+        self.directory = Path(directory) if directory else None
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.ttl_seconds = ttl_seconds
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._written = 0
+        self._last_sweep = 0.0
+        self._sweeping = False
+
+    @classmethod
+    def from_env(cls) -> "ArtifactStore":
+        default_dir = Path(__file__).with_name(".cache") / "artifacts"
+        directory = os.getenv("ARTIFACT_DIR", str(default_dir))
+        return cls(
+            directory=directory or None,
+            max_memory_bytes=int(os.getenv("ARTIFACT_MEMORY_MB", "32")) * 1024 * 1024,
+            max_disk_bytes=int(os.getenv("ARTIFACT_DISK_MB", "2048")) * 1024 * 1024,
+            ttl_seconds=float(os.getenv("ARTIFACT_TTL_DAYS", "7")) * 86400,
+        )
+
+    def _path(self, digest: str) -> Path:
+        return self.directory / digest[:2] / digest
+
+    def put(self, content: str | bytes) -> str:
+        """Store content and return its handle.
+
+        Raises ArtifactTooLargeError when the content exceeds the memory tier
+        and there is no disk tier, or exceeds the disk cap.
+        """
+        data = content.encode("utf-8") if isinstance(content, str) else content
+        limit = self.max_memory_bytes if self.directory is None else self.max_disk_bytes
+        if len(data) > limit:
+            metrics.counter("artifacts.rejected").inc()
+            raise ArtifactTooLargeError(
+                f"Artifact of {len(data)} bytes exceeds the store limit of {limit} bytes"
+            )
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            cached = digest in self._memory
+            if cached:
+                self._memory.move_to_end(digest)
+            else:
+                self._remember(digest, data)
+        # A sweep (of any worker) may have deleted the disk copy of a cached artifact
+        if cached and (self.directory is None or self._touch(self._path(digest))):
+            metrics.counter("artifacts.dedup_hits").inc()
+            return HANDLE_PREFIX + digest
+        if self.directory is not None:
+            path = self._path(digest)
+            if not self._touch(path):
+                path.parent.mkdir(parents=True, exist_ok=True)
+                # Write then rename so readers in other workers never see a partial file
+                tmp = path.with_suffix(f".{os.getpid()}.tmp")
+                tmp.write_bytes(data)
+                os.replace(tmp, path)
+                with self._lock:
+                    self._written += len(data)
+            self._maybe_sweep()
+        metrics.counter("artifacts.stored").inc()
+        metrics.histogram("artifacts.size_bytes").observe(len(data))
+        return HANDLE_PREFIX + digest
+
+    def get_bytes(self, handle: str) -> bytes | None:
+        """Return the stored content, or None for an unknown or malformed handle."""
+        if not _HANDLE_PATTERN.match(handle or ""):
+            return None
+        digest = handle[len(HANDLE_PREFIX):]
+        with self._lock:
+            data = self._memory.get(digest)
+            if data is not None:
+                self._memory.move_to_end(digest)
+                return data
+        if self.directory is None:
+            return None
+        path = self._path(digest)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        self._touch(path)
+        with self._lock:
+            self._remember(digest, data)
+        return data
+
+    def in_memory(self, handle: str) -> bool:
+        """True if the content is held in the memory tier."""
+        if not _HANDLE_PATTERN.match(handle or ""):
+            return False
+        with self._lock:
+            return handle[len(HANDLE_PREFIX):] in self._memory
+
+    def contains(self, handle: str) -> bool:
+        if not _HANDLE_PATTERN.match(handle or ""):
+            return False
+        digest = handle[len(HANDLE_PREFIX):]
+        with self._lock:
+            if digest in self._memory:
+                return True
+        return self.directory is not None and self._path(digest).exists()
+
+    def size(self, handle: str) -> int | None:
+        """Size in bytes of the stored content without reading it, or None if unknown."""
+        if not _HANDLE_PATTERN.match(handle or ""):
+            return None
+        digest = handle[len(HANDLE_PREFIX):]
+        with self._lock:
+            data = self._memory.get(digest)
+            if data is not None:
+                return len(data)
+        if self.directory is None:
+            return None
+        try:
+            return self._path(digest).stat().st_size
+        except FileNotFoundError:
+            return None
+
+    def get(self, handle: str) -> str | None:
+        data = self.get_bytes(handle)
+        return data.decode("utf-8", errors="replace") if data is not None else None
+
+    @staticmethod
+    def _touch(path: Path) -> bool:
+        """Mark a disk artifact as recently used; False if it does not exist."""
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _maybe_sweep(self) -> None:
+        """Start a background sweep of the disk tier when enough was written or time passed."""
+        now = time.monotonic()
+        with self._lock:
+            due = self._written >= self.max_disk_bytes * _SWEEP_WRITE_SHARE or (
+                now - self._last_sweep >= _SWEEP_INTERVAL_SECONDS
+            )
+            if not due or self._sweeping:
+                return
+            self._sweeping = True
+            self._written = 0
+            self._last_sweep = now
+        threading.Thread(target=self._sweep, name="artifact-sweep", daemon=True).start()
+
+    def _sweep(self) -> None:
+        try:
+            self.sweep()
+        except OSError:
+            logger.exception("Artifact sweep failed")
+        finally:
+            self._sweeping = False
+
+    def sweep(self) -> int:
+        """Delete expired, then least recently used, disk artifacts; returns the bytes freed."""
+        if self.directory is None or not self.directory.exists():
+            return 0
+        now = time.time()
+        files = []
+        for path in self.directory.glob("*/*"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        target = self.max_disk_bytes * _SWEEP_TARGET_SHARE
+        freed = 0
+        for mtime, size, path in files:
+            expired = self.ttl_seconds > 0 and now - mtime > self.ttl_seconds
+            # Leftover temporary files of interrupted writes are dropped after a while
+            stale_tmp = path.name.endswith(".tmp") and now - mtime > 3600
+            if not expired and not stale_tmp and total - freed <= target:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            freed += size
+            metrics.counter("artifacts.evicted").inc()
+        metrics.gauge("artifacts.disk_bytes").set(total - freed)
+        return freed
+
+    def _remember(self, digest: str, data: bytes) -> None:
+        if len(data) > self.max_memory_bytes:
+            return
+        if digest not in self._memory:
+            self._memory_bytes += len(data)
+        self._memory[digest] = data
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+
+_store: ArtifactStore | None = None
+
+
+def get_store() -> ArtifactStore:
+    """Return the process-wide artifact store, created from the environment on first use."""
+    global _store
+    if _store is None:
+        _store = ArtifactStore.from_env()
+    return _store
+
+
+def outline(text: str, max_items: int = 12) -> list[str]:
+    """Return the markdown headings and top-level definitions of a text."""
+    items = []
+    in_code = False
+    for line in text.splitlines():
+        if line.startswith("```"):
+            in_code = not in_code
+            continue
+        # Inside code blocks '#' starts a comment, not a heading
+        match = _DEFINITION_PATTERN.match(line) if in_code else _HEADING_PATTERN.match(line)
+        if match is None and not in_code:
+            match = _DEFINITION_PATTERN.match(line)
+        if match:
+            items.append(match.group(0))
+            if len(items) >= max_items:
+                break
+    return items
+
+
+def store_if_large(text: str, description: str) -> str:
+    """Return `text` unchanged if small, otherwise store it and return a handle plus summary."""
+    inline_chars = int(os.getenv("ARTIFACT_INLINE_CHARS", "2000"))
+    if inline_chars <= 0 or len(text) <= inline_chars:
+        return text
+    try:
+        handle = get_store().put(text)
+    except ArtifactTooLargeError:
+        return text
+    line_count = len(text.splitlines())
+    items = outline(text) or text.splitlines()[:8]
+    summary = "\n".join(f"- {item}" for item in items)
+    return (
+        f"{description} stored as artifact `{handle}` ({len(text)} characters, {line_count} lines).\n"
+        f"Outline:\n{summary}\n"
+        f"Call fetch_artifact with this handle and a line range (e.g. '1-80') to read it."
+    )
+
+
+def parse_code_ref(value: str) -> str | None:
+    """Return the handle of a ``code_ref=sha256:...`` (or bare handle) value, else None."""
+    match = _CODE_REF_PATTERN.match(value or "")
+    return match.group(1) if match else None
+
+
+def resolve_code_ref(value: str) -> str | None:
+    """Resolve a ``code_ref=sha256:...`` (or bare handle) argument to the uploaded code.
+
+    Values that are not references are returned unchanged; unknown references
+    return None.
+    """
+    handle = parse_code_ref(value)
+    if handle is None:
+        return value
+    metrics.counter("artifacts.code_refs").inc()
+    return get_store().get(handle)
+
+
+def parse_line_range(value: str, line_count: int) -> tuple[int, int]:
+    """Parse a 1-based inclusive 'start-end' line range (either side optional)."""
+    value = (value or "").strip()
+    if not value:
+        return 1, line_count
+    start_text, _, end_text = value.partition("-")
+    start = int(start_text) if start_text.strip() else 1
+    end = int(end_text) if end_text.strip() else (line_count if "-" in value else start)
+    return max(1, start), min(line_count, end)
+
+
+def read_lines(handle: str, line_range: str = "", max_chars: int = 8000) -> str:
+    """Return a line slice of an artifact, capped at `max_chars`."""
+    text = get_store().get(handle)
+    if text is None:
+        return f"Unknown artifact handle: {handle}"
+    lines = text.splitlines()
+    try:
+        start, end = parse_line_range(line_range, len(lines))
+    except ValueError:
+        return f"Invalid line range '{line_range}'. Use 'start-end', e.g. '1-80'."
+    selected = []
+    size = 0
+    last = start - 1
+    for number in range(start, end + 1):
+        line = lines[number - 1]
+        if size + len(line) + 1 > max_chars and selected:
+            break
+        selected.append(line)
+        size += len(line) + 1
+        last = number
+    header = f"[{handle} lines {start}-{last} of {len(lines)}]"
+    if last < end:
+        header += f" (truncated; continue with '{last + 1}-{end}')"
+    return header + "\n" + "\n".join(selected)
+
+
+class ArtifactsMiddleware:
+    """Raw ASGI middleware for POST /uploads and GET/HEAD /artifacts/{handle}.
+
+    Downloads support a single byte Range and a ?lines= slice. Callers must
+    send ARTIFACTS_TOKEN as a bearer token; without a token configured only
+    loopback clients are allowed.
+    """
+
+    def __init__(self, app, store: ArtifactStore | None = None):
+        self.app = app
+        self.store = store or get_store()
+        self.max_upload_bytes = int(os.getenv("UPLOAD_MAX_MB", "20")) * 1024 * 1024
+        self.token = os.getenv("ARTIFACTS_TOKEN", "")
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "")
+        method = scope.get("method")
+        upload = scope["type"] == "http" and method == "POST" and path == "/uploads"
+        download = scope["type"] == "http" and method in ("GET", "HEAD") and path.startswith("/artifacts/")
+        if not upload and not download:
+            await self.app(scope, receive, send)
+            return
+        if not bearer_authorized(scope, self.token):
+            metrics.counter("artifacts.unauthorized").inc()
+            await send_json(send, 401, {"code": "unauthorized", "message": "Artifacts are not allowed for this client"})
+            return
+        if upload:
+            await self._upload(scope, receive, send)
+            return
+
+        handle = unquote(path[len("/artifacts/"):])
+        data = self.store.get_bytes(handle)
+        if data is None:
+            await send_json(send, 404, {"code": "not_found", "message": "Artifact not found"})
+            return
+        if method == "HEAD":
+            # Lets clients check whether a file is already uploaded before sending it
+            await send({
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [(b"content-length", str(len(data)).encode("latin-1")), (b"etag", f'"{handle}"'.encode("latin-1"))],
+            })
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        headers = {
+            "etag": f'"{handle}"',
+            "cache-control": "public, max-age=31536000, immutable",
+            "accept-ranges": "bytes",
+        }
+        content_type = "text/plain; charset=utf-8"
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        if "lines" in query:
+            lines = data.decode("utf-8", errors="replace").splitlines(keepends=True)
+            try:
+                start, end = parse_line_range(query["lines"][0], len(lines))
+            except ValueError:
+                await send_json(send, 400, {"code": "invalid_request_error", "message": "Invalid lines range"})
+                return
+            await send_bytes(send, 200, "".join(lines[start - 1:end]).encode("utf-8"), content_type, headers)
+            return
+
+        byte_range = _parse_byte_range(get_header(scope, "range"), len(data))
+        if byte_range is None:
+            await send_bytes(send, 200, data, content_type, headers)
+            return
+        start, end = byte_range
+        if start >= len(data) or start > end:
+            await send_json(send, 416, {"code": "range_not_satisfiable", "message": "Invalid range"},
+                            headers={"content-range": f"bytes */{len(data)}"})
+            return
+        headers["content-range"] = f"bytes {start}-{end}/{len(data)}"
+        await send_bytes(send, 206, data[start:end + 1], content_type, headers)
+
+    async def _upload(self, scope, receive, send) -> None:
+        """Store the raw request body (UTF-8 source code) and return its reference."""
+        declared = get_header(scope, "content-length")
+        if declared and declared.isdigit() and int(declared) > self.max_upload_bytes:
+            await send_json(send, 413, {"code": "payload_too_large", "message": "Upload exceeds UPLOAD_MAX_MB"})
+            return
+        parts = []
+        size = 0
+        while True:
+            message = await receive()
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if size > self.max_upload_bytes:
+                await send_json(send, 413, {"code": "payload_too_large", "message": "Upload exceeds UPLOAD_MAX_MB"})
+                return
+            parts.append(chunk)
+            if not message.get("more_body", False):
+                break
+        data = b"".join(parts)
+        try:
+            data.decode("utf-8")
+        except UnicodeDecodeError:
+            await send_json(send, 400, {"code": "invalid_request_error", "message": "Uploads must be UTF-8 text"})
+            return
+
+        digest = hashlib.sha256(data).hexdigest()
+        existed = self.store.contains(HANDLE_PREFIX + digest)
+        try:
+            handle = self.store.put(data)
+        except ArtifactTooLargeError as exc:
+            await send_json(send, 413, {"code": "payload_too_large", "message": str(exc)})
+            return
+        metrics.counter("uploads.deduplicated" if existed else "uploads.stored").inc()
+        await send_json(
+            send,
+            200 if existed else 201,
+            {"ref": handle, "size": len(data), "deduplicated": existed},
+            headers={"location": f"/artifacts/{handle}"},
+        )
+
+
+def _parse_byte_range(value: str | None, size: int) -> tuple[int, int] | None:
+    """Parse a single 'bytes=start-end' Range header; None when absent or unsupported."""
+    match = re.fullmatch(r"bytes=(\d*)-(\d*)", (value or "").strip())
+    if not match or not any(match.groups()):
+        return None
+    start_text, end_text = match.groups()
+    if not start_text:
+        # Suffix range: the last N bytes
+        return max(0, size - int(end_text)), size - 1
+    end = int(end_text) if end_text else size - 1
+    return int(start_text), min(end, size - 1)
@@ -0,0 +1,93 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+"""
+ASGI Helpers
+
+Small helpers shared by the raw ASGI middlewares that wrap the agent server app.
+"""
+
+import hashlib
+import hmac
+import json
+
+
+async def read_body(receive) -> bytes:
+    """Buffer the full request body."""
+    body_parts = []
+    while True:
+        message = await receive()
+        body_parts.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            break
+    return b"".join(body_parts)
+
+
+def replay_body(raw_body: bytes, receive=None):
+    """Return a `receive` callable that yields an already-buffered body once.
+
+    Later calls are passed to the original `receive`, which waits for the
+    client to disconnect; without it they report a disconnect right away.
+    """
+    body_sent = False
+
+    async def replayed_receive():
+        nonlocal body_sent
+        if not body_sent:
+            body_sent = True
+            return {"type": "http.request", "body": raw_body, "more_body": False}
+        if receive is not None:
+            # Streamed responses listen for the disconnect while they send
+            return await receive()
+        return {"type": "http.disconnect"}
+
+    return replayed_receive
+
+
+def get_header(scope, name: str) -> str | None:
+    """Return a request header value (case-insensitive), or None."""
+    target = name.lower().encode("latin-1")
+    for key, value in scope.get("headers", []):
+        if key.lower() == target:
+            return value.decode("latin-1")
+    return None
+
+
+def client_key(scope, header: str) -> str:
+    """Identify the calling client by a hash of a header such as the APIM subscription key."""
+    value = get_header(scope, header)
+    if not value:
+        return "anonymous"
+    # Never keep raw subscription keys in memory or metrics
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()[:12]
+
+
+def bearer_authorized(scope, token: str) -> bool:
+    """Check `Authorization: Bearer <token>`; without a token configured allow loopback clients only."""
+    if token:
+        return hmac.compare_digest(get_header(scope, "authorization") or "", f"Bearer {token}")
+    client = scope.get("client")
+    return client is not None and client[0] in ("127.0.0.1", "::1")
+
+
+async def send_json(send, status: int, payload, headers: dict[str, str] | None = None) -> None:
+    """Send a complete JSON response."""
+    body = json.dumps(payload).encode("utf-8")
+    await send_bytes(send, status, body, "application/json", headers)
+
+
+async def send_bytes(
+    send,
+    status: int,
+    body: bytes,
+    content_type: str,
+    headers: dict[str, str] | None = None,
+) -> None:
+    """Send a complete response with the given body."""
+    raw_headers = [
+        (b"content-type", content_type.encode("latin-1")),
+        (b"content-length", str(len(body)).encode("latin-1")),
+    ]
+    for key, value in (headers or {}).items():
+        raw_headers.append((key.lower().encode("latin-1"), value.encode("latin-1")))
+    await send({"type": "http.response.start", "status": status, "headers": raw_headers})
+    await send({"type": "http.response.body", "body": body, "more_body": False})
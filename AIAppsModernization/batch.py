@@ -0,0 +1,425 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+"""
+Batch Modernization
+
+Converts many files without the interactive loop:
+
+    python main.py modernize src/ "legacy/**/*.py" agent.py --concurrency 8 --output-dir migrated
+
+Inputs are files, glob patterns or directories (searched recursively for
+``*.py``); files that import neither Semantic Kernel nor AutoGen are skipped.
+At most ``--concurrency`` files (BATCH_CONCURRENCY) go through the stages at
+a time:
+1. analyze: the local analysis tool, no model call
+2. generate: one agent run with the code and its analysis
+3. validate: the static checks of ``validation.py`` (parses, known
+   agent_framework imports, no SK/AutoGen left, Annotated tools); valid code
+   is written next to the original as ``<name>_maf.py`` or under ``--output-dir`` with the same
+   relative layout
+
+Files are converted after the files of the batch they import
+(``import_graph.py``), whose modernized code is referenced in their prompt so
+shared clients and tools stay consistent; files that do not depend on each
+other run in parallel.
+
+Each completed stage is checkpointed in the run manifest (``manifest.py``),
+so rerunning the same command skips finished files and continues partial ones
+from their last stage; several processes can work through the same files.
+When a file changes, it and the files whose imports' modernized code changed
+as a result are converted again; the rest is left alone.
+Progress and throughput are printed as files finish; the exit code is 1 if
+any file failed.
+"""
+
+import asyncio
+import glob
+import hashlib
+import os
+import re
+import sys
+import time
+from pathlib import Path
+
+from artifacts import get_store, outline
+from import_graph import ImportIndex, build_graph, components
+from manifest import FINAL_STATES, RunManifest
+from tools import analyze_code_patterns, detect_framework
+from validation import Validator
+
+# Directories never searched when a directory is given
+_EXCLUDED_DIRS = frozenset({".git", ".venv", "venv", "__pycache__", "node_modules", ".cache", ".tox"})
+
+_VALIDATION_ERROR = "Generated code failed validation:"
+# Seconds between lease renewals of a file being converted
+_RENEW_INTERVAL = 10.0
+# Seconds before a file held by another worker is looked at again
+_RECLAIM_INTERVAL = 5.0
+
+_CODE_BLOCK_PATTERN = re.compile(r"```(?:python|py)?[ \t]*\n(.*?)```", re.DOTALL)
+
+CONVERSION_PROMPT = """Modernize this {framework} file to Microsoft Agent Framework: {path}
+
+The file is uploaded as code_ref={handle}; pass that reference as the code argument of
+the tools instead of copying the code. It has already been analyzed:
+
+{analysis}
+
+Reply with the complete modernized file in one ```python code block, followed by at most
+a few lines of notes.
+
+```python
+{code}
+```"""
+
+DEPENDENCIES_PROMPT = """
+
+It imports these files of the same project, which are already modernized. Use their
+clients, tools and names as they are now (read them with fetch_artifact if needed):
+{modules}"""
+
+
+class FileTask:
+    """One file of a batch: where it is read from and written to, and how it went."""
+
+    def __init__(self, source: Path, output: Path):
+        self.source = source
+        self.output = output
+        self.input_hash = ""
+        self.dependencies: list[FileTask] = []
+        self.framework: str | None = None
+        self.note: str | None = None
+        self.status = "pending"
+        self.error: str | None = None
+        self.seconds = 0.0
+
+    @property
+    def key(self) -> tuple[str, str]:
+        """The file's key in the run manifest."""
+        return str(self.source), str(self.output)
+
+
+def _expand(pattern: str, excluded: set[Path]) -> list[Path]:
+    """Return the Python files named by a file path, glob pattern or directory."""
+    path = Path(pattern)
+    if path.is_dir():
+        found = []
+        for root, dirs, files in os.walk(path):
+            root_path = Path(root)
+            dirs[:] = sorted(d for d in dirs if d not in _EXCLUDED_DIRS and (root_path / d).resolve() not in excluded)
+            found.extend(root_path / name for name in sorted(files) if name.endswith(".py"))
+        return found
+    if path.is_file():
+        return [path]
+    return sorted(Path(match) for match in glob.glob(pattern, recursive=True) if match.endswith(".py"))
+
+
+def find_files(inputs: list[str], excluded: set[Path] = frozenset()) -> list[Path]:
+    """Resolve files, glob patterns and directories to the Python files they name, once each."""
+    found: dict[Path, None] = {}
+    for pattern in inputs:
+        for path in _expand(pattern, excluded):
+            resolved = path.resolve()
+            if not any(parent in excluded for parent in resolved.parents):
+                found.setdefault(resolved)
+    return list(found)
+
+
+def plan(inputs: list[str], output_dir: str | None = None, suffix: str = "_maf") -> list[FileTask]:
+    """Resolve the inputs to the files to convert and their output paths."""
+    excluded = {Path(output_dir).resolve()} if output_dir else set()
+    # Outputs of an earlier run are not inputs
+    sources = [path for path in find_files(inputs, excluded) if not path.stem.endswith(suffix)]
+    if not sources:
+        return []
+
+    root = Path(os.path.commonpath([str(path.parent) for path in sources]))
+    tasks = []
+    for source in sources:
+        if output_dir:
+            output = Path(output_dir).resolve() / source.relative_to(root)
+        else:
+            output = source.with_name(f"{source.stem}{suffix}{source.suffix}")
+        tasks.append(FileTask(source, output))
+    return tasks
+
+
+def extract_code(text: str) -> str | None:
+    """Return the longest fenced Python block of an answer, or None."""
+    blocks = [match.group(1) for match in _CODE_BLOCK_PATTERN.finditer(text or "")]
+    return max(blocks, key=len) if blocks else None
+
+
+def _deps_key(dependencies: list[tuple[FileTask, str]]) -> str:
+    """Key of the generated code of a file's dependencies, to notice when it changes."""
+    handles = ",".join(sorted(handle for _, handle in dependencies))
+    return hashlib.sha256(handles.encode("utf-8")).hexdigest()[:16]
+
+
+class _Schedule:
+    """Releases the files of a batch once the files they import are finished.
+
+    Files that import each other (a cycle) are released together.
+    """
+
+    def __init__(self, tasks: list[FileTask], graph: dict[Path, set[Path]]):
+        self._tasks = {task.source: task for task in tasks}
+        self._graph = graph
+        self._units = components(graph)
+        self._unit_of = {path: number for number, unit in enumerate(self._units) for path in unit}
+        self._left = [len(unit) for unit in self._units]
+        self._waiting = [0] * len(self._units)
+        self._dependents: list[set[int]] = [set() for _ in self._units]
+        for path, dependencies in graph.items():
+            unit = self._unit_of[path]
+            for dependency in dependencies:
+                other = self._unit_of[dependency]
+                if other != unit and unit not in self._dependents[other]:
+                    self._dependents[other].add(unit)
+                    self._waiting[unit] += 1
+
+    def dependencies(self, task: FileTask) -> list[FileTask]:
+        """The files `task` imports that finish before it (not those in a cycle with it)."""
+        unit = self._unit_of[task.source]
+        return [self._tasks[path] for path in sorted(self._graph[task.source]) if self._unit_of[path] != unit]
+
+    def _release(self, unit: int) -> list[FileTask]:
+        return [self._tasks[path] for path in self._units[unit]]
+
+    def ready(self) -> list[FileTask]:
+        """The files that import no other file of the batch."""
+        return [task for unit, waiting in enumerate(self._waiting) if not waiting for task in self._release(unit)]
+
+    def finish(self, task: FileTask) -> list[FileTask]:
+        """Mark a file finished; returns the files this makes ready."""
+        unit = self._unit_of[task.source]
+        self._left[unit] -= 1
+        if self._left[unit]:
+            return []
+        released = []
+        for dependent in sorted(self._dependents[unit]):
+            self._waiting[dependent] -= 1
+            if not self._waiting[dependent]:
+                released.extend(self._release(dependent))
+        return released
+
+
+def _display(path: Path) -> str:
+    try:
+        return str(path.relative_to(Path.cwd()))
+    except ValueError:
+        return str(path)
+
+
+class BatchRunner:
+    """Converts the files of a batch with one agent, a bounded number at a time.
+
+    Every stage is checkpointed in the run manifest: a rerun (or another
+    worker) continues each file from its last completed stage.
+    """
+
+    def __init__(
+        self,
+        agent,
+        manifest: RunManifest,
+        concurrency: int = 4,
+        timeout: float | None = 900.0,
+        validator: Validator | None = None,
+        index: ImportIndex | None = None,
+        fresh: bool = False,
+        out=sys.stderr,
+    ):
+        self.agent = agent
+        self.manifest = manifest
+        self.validator = validator or Validator()
+        self.index = index
+        self.concurrency = max(1, concurrency)
+        self.timeout = timeout if timeout and timeout > 0 else None
+        self.fresh = fresh
+        self.out = out
+        self._done = 0
+        self._total = 0
+        self._started = 0.0
+
+    async def _analyze(self, task: FileTask, code: str) -> None:
+        # Imports agent_framework, which the validate command does without
+        from tool_engine import run_tool
+
+        task.framework = detect_framework(code)
+        if task.framework is None:
+            await asyncio.to_thread(self.manifest.advance, *task.key, "skipped")
+            return
+        analysis = await run_tool(analyze_code_patterns, task.input_hash)
+        await asyncio.to_thread(
+            self.manifest.advance, *task.key, "analyzed", framework=task.framework, analysis=get_store().put(analysis)
+        )
+
+    async def _dependencies(self, task: FileTask) -> list[tuple[FileTask, str]]:
+        """The files `task` imports that are modernized, with their generated code's handle."""
+        modernized = []
+        for dependency in task.dependencies:
+            row = await asyncio.to_thread(self.manifest.get, *dependency.key)
+            if row and row["state"] == "validated" and row["artifact"]:
+                modernized.append((dependency, row["artifact"]))
+        return modernized
+
+    async def _generate(self, task: FileTask, code: str, row: dict, dependencies: list[tuple[FileTask, str]]) -> None:
+        prompt = CONVERSION_PROMPT.format(
+            framework=row["framework"].replace("_", " ").title(),
+            path=_display(task.source),
+            handle=task.input_hash,
+            analysis=get_store().get(row["analysis"]) or "",
+            code=code,
+        )
+        if dependencies:
+            lines = []
+            for dependency, handle in dependencies:
+                defines = ", ".join(outline(get_store().get(handle) or ""))
+                lines.append(f"- {_display(dependency.source)} (code_ref={handle}): {defines or 'no definitions'}")
+            prompt += DEPENDENCIES_PROMPT.format(modules="\n".join(lines))
+        if (row["error"] or "").startswith(_VALIDATION_ERROR):
+            prompt += f"\n\nA previous answer was rejected, fix this: {row['error']}"
+        response = await asyncio.wait_for(self.agent.run(prompt), self.timeout)
+        modernized = extract_code(response.text)
+        if modernized is None:
+            raise ValueError("The answer has no Python code block")
+        await asyncio.to_thread(
+            self.manifest.advance,
+            *task.key,
+            "generated",
+            artifact=get_store().put(modernized),
+            deps_key=_deps_key(dependencies),
+        )
+
+    async def _validate(self, task: FileTask, modernized: str) -> None:
+        problems = await asyncio.to_thread(self.validator.validate, modernized, str(task.output))
+        if problems:
+            # Generate again on the next attempt, with the problems in the prompt
+            await asyncio.to_thread(self.manifest.advance, *task.key, "analyzed")
+            raise ValueError(f"{_VALIDATION_ERROR} {'; '.join(problems[:5])}")
+        task.output.parent.mkdir(parents=True, exist_ok=True)
+        task.output.write_text(modernized, encoding="utf-8")
+        await asyncio.to_thread(self.manifest.advance, *task.key, "validated")
+
+    async def convert(self, task: FileTask) -> bool:
+        """Bring one claimed file to a final state; returns False if another worker holds it."""
+        row = await asyncio.to_thread(self.manifest.claim, *task.key)
+        if row is None:
+            return False
+        renewal = asyncio.create_task(self._hold_lease(task))
+        error = None
+        ran = False
+        try:
+            task.note = f"resumed from {row['state']}" if row["state"] != "pending" else None
+            dependencies = await self._dependencies(task)
+            stale = row["deps_key"] is not None and row["deps_key"] != _deps_key(dependencies)
+            if row["state"] in ("generated", "validated") and stale:
+                # A file it imports was modernized differently since: generate it again
+                await asyncio.to_thread(self.manifest.advance, *task.key, "analyzed")
+                task.note = "dependency changed"
+            code = task.source.read_text(encoding="utf-8")
+            while True:
+                row = await asyncio.to_thread(self.manifest.get, *task.key)
+                state = row["state"]
+                if state == "generated" and get_store().get(row["artifact"]) is None:
+                    # The artifact store lost the generated code (e.g. memory only)
+                    state = "analyzed"
+                if state == "validated" and not task.output.exists():
+                    state = "generated"
+                if state in FINAL_STATES:
+                    break
+                ran = True
+                if state == "pending":
+                    await self._analyze(task, code)
+                elif state == "analyzed":
+                    await self._generate(task, code, row, dependencies)
+                else:
+                    await self._validate(task, get_store().get(row["artifact"]))
+            task.framework = row["framework"]
+            if state == "skipped":
+                task.status = "skipped"
+            else:
+                task.status = "converted" if ran else "unchanged"
+        except Exception as exc:
+            error = str(exc) or type(exc).__name__
+            raise
+        finally:
+            renewal.cancel()
+            await asyncio.to_thread(self.manifest.release, *task.key, error)
+        return True
+
+    async def _hold_lease(self, task: FileTask) -> None:
+        while True:
+            await asyncio.sleep(_RENEW_INTERVAL)
+            await asyncio.to_thread(self.manifest.renew, *task.key)
+
+    def _report(self, task: FileTask) -> None:
+        self._done += 1
+        elapsed = time.perf_counter() - self._started
+        rate = self._done / elapsed * 60 if elapsed else 0.0
+        width = len(str(self._total))
+        line = f"[{self._done:>{width}}/{self._total}] {task.status:<9} {_display(task.source)}"
+        if task.status == "converted":
+            line += f" -> {_display(task.output)}"
+            if task.note:
+                line += f" ({task.note})"
+        elif task.status == "failed":
+            line += f": {task.error}"
+        print(f"{line} ({task.seconds:.1f}s, {rate:.1f} files/min)", file=self.out, flush=True)
+
+    async def _worker(self, queue: asyncio.Queue, schedule: _Schedule, workers: int) -> None:
+        while (task := await queue.get()) is not None:
+            started = time.perf_counter()
+            try:
+                claimed = await self.convert(task)
+            except asyncio.TimeoutError:
+                claimed, task.status, task.error = True, "failed", f"timed out after {self.timeout:g}s"
+            except Exception as exc:
+                claimed, task.status, task.error = True, "failed", str(exc) or type(exc).__name__
+            if not claimed:
+                # Another worker holds the file: look again once it may have finished
+                await asyncio.sleep(_RECLAIM_INTERVAL)
+                queue.put_nowait(task)
+                continue
+            task.seconds = time.perf_counter() - started
+            self._report(task)
+            # Dependents run even if this file failed; they are regenerated once it succeeds
+            for ready in schedule.finish(task):
+                queue.put_nowait(ready)
+            if self._done == self._total:
+                for _ in range(workers):
+                    queue.put_nowait(None)
+
+    async def run(self, tasks: list[FileTask]) -> int:
+        """Convert all tasks, each after the files it imports; returns the process exit code."""
+        files = []
+        for task in tasks:
+            data = task.source.read_bytes()
+            task.input_hash = get_store().put(data)
+            self.manifest.register(*task.key, task.input_hash, fresh=self.fresh)
+            files.append((task.source, task.input_hash, data.decode("utf-8", errors="replace")))
+        schedule = _Schedule(tasks, build_graph(files, self.index))
+        for task in tasks:
+            task.dependencies = schedule.dependencies(task)
+
+        queue: asyncio.Queue = asyncio.Queue()
+        for task in schedule.ready():
+            queue.put_nowait(task)
+        self._total = len(tasks)
+        self._done = 0
+        self._started = time.perf_counter()
+        workers = min(self.concurrency, len(tasks))
+        await asyncio.gather(*(self._worker(queue, schedule, workers) for _ in range(workers)))
+        elapsed = time.perf_counter() - self._started
+
+        statuses = ("converted", "unchanged", "skipped", "failed")
+        counts = {status: sum(task.status == status for task in tasks) for status in statuses}
+        print(
+            "\n" + ", ".join(f"{counts[status]} {status}" for status in statuses)
+            + f" in {elapsed:.1f}s ({len(tasks) / elapsed * 60 if elapsed else 0.0:.1f} files/min)",
+            file=self.out,
+        )
+        for task in tasks:
+            if task.status == "failed":
+                print(f"  FAILED {_display(task.source)}: {task.error}", file=self.out)
+        return 1 if counts["failed"] else 0
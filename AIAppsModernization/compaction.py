@@ -0,0 +1,143 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+"""
+Thread Compaction
+
+Keeps the prompt of long modernization threads bounded. Every pasted and
+generated file stays in the thread, so without compaction each model round
+trip resends all of them and prompt size, latency and cost grow every turn.
+
+Before each model call ``ThreadCompactionMiddleware``:
+1. keeps the most recent CONTEXT_KEEP_TURNS user turns verbatim
+2. replaces large tool outputs of older turns (guides, generated files) with a
+   short summary and an artifact handle the model can read with fetch_artifact
+3. if the prompt is still above CONTEXT_MAX_TOKENS, shortens long older
+   messages and finally drops the oldest turns
+
+Only the request sent to the model is compacted; the thread keeps the full
+history. The prompt size of every round trip is recorded as a metric.
+
+The agent is created with ``store=False`` while compaction is enabled: with a
+service-managed thread the model call only carries the new messages of the
+turn, the service appends the stored history and there is nothing local to
+compact.
+"""
+
+import os
+
+from agent_framework import (
+    ChatContext,
+    ChatMessage,
+    ChatMiddleware,
+    FunctionResultContent,
+    Role,
+)
+
+import metrics
+from artifacts import ArtifactTooLargeError, get_store
+from token_budget import prompt_tokens
+
+# Characters of an old tool output or message kept as its summary
+_SUMMARY_CHARS = 240
+
+
+def summarize(text: str, limit: int = _SUMMARY_CHARS) -> str:
+    """Shorten a large text to its head plus a note of what was omitted."""
+    if len(text) <= limit:
+        return text
+    head = text[:limit].rsplit("\n", 1)[0] if "\n" in text[:limit] else text[:limit]
+    return f"{head}\n[... {len(text) - len(head)} characters compacted from an earlier turn]"
+
+
+class CompactionPolicy:
+    """Settings for how a thread is compacted."""
+
+    def __init__(self, keep_turns: int = 4, max_tokens: int = 32000, tool_output_chars: int = 1000):
+        self.keep_turns = keep_turns
+        self.max_tokens = max_tokens
+        self.tool_output_chars = tool_output_chars
+
+    @classmethod
+    def from_env(cls) -> "CompactionPolicy | None":
+        """Create a policy from CONTEXT_* environment variables, or None if disabled."""
+        if os.getenv("CONTEXT_COMPACTION_ENABLED", "true").lower() in ("0", "false", "no"):
+            return None
+        return cls(
+            keep_turns=int(os.getenv("CONTEXT_KEEP_TURNS", "4")),
+            max_tokens=int(os.getenv("CONTEXT_MAX_TOKENS", "32000")),
+            tool_output_chars=int(os.getenv("CONTEXT_TOOL_OUTPUT_CHARS", "1000")),
+        )
+
+    def _compact_tool_results(self, message):
+        """Return the message with large tool results summarized, or None if unchanged."""
+        contents = []
+        changed = False
+        for content in message.contents or []:
+            result = str(content.result or "") if isinstance(content, FunctionResultContent) else None
+            if result is not None and len(result) > self.tool_output_chars:
+                try:
+                    handle = get_store().put(result)
+                except ArtifactTooLargeError:
+                    contents.append(content)
+                    continue
+                summary = f"{summarize(result)}\n[full output: {handle}, readable with fetch_artifact]"
+                contents.append(FunctionResultContent(call_id=content.call_id, result=summary))
+                changed = True
+            else:
+                contents.append(content)
+        if not changed:
+            return None
+        return ChatMessage(role=message.role, contents=contents, author_name=message.author_name)
+
+    def compact(self, messages: list) -> list:
+        """Return a compacted copy of `messages` (the original list is not modified)."""
+        # Turns start at user messages; system messages and the recent turns are kept verbatim
+        user_positions = [i for i, message in enumerate(messages) if message.role == Role.USER]
+        if len(user_positions) <= self.keep_turns:
+            return list(messages)
+        boundary = user_positions[-self.keep_turns] if self.keep_turns > 0 else len(messages)
+
+        compacted = list(messages)
+        for i in range(boundary):
+            replacement = self._compact_tool_results(compacted[i])
+            if replacement is not None:
+                compacted[i] = replacement
+
+        if self.max_tokens <= 0 or prompt_tokens(compacted) <= self.max_tokens:
+            return compacted
+
+        # Still too large: shorten long older user and assistant messages
+        for i in range(boundary):
+            message = compacted[i]
+            if message.role in (Role.USER, Role.ASSISTANT) and message.text and len(message.text) > _SUMMARY_CHARS * 2:
+                if all(getattr(content, "text", None) is not None for content in message.contents or []):
+                    compacted[i] = ChatMessage(role=message.role, text=summarize(message.text), author_name=message.author_name)
+
+        # Last resort: drop whole old turns, oldest first, so tool calls stay paired with results
+        old_turns = [i for i in user_positions if i < boundary]
+        removed = 0
+        while old_turns and prompt_tokens(compacted) > self.max_tokens:
+            start = old_turns.pop(0)
+            end = old_turns[0] if old_turns else boundary
+            del compacted[start - removed:end - removed]
+            removed += end - start
+            metrics.counter("context.dropped_turns").inc()
+        return compacted
+
+
+class ThreadCompactionMiddleware(ChatMiddleware):
+    """Chat middleware compacting the thread history sent on every model round trip."""
+
+    def __init__(self, policy: CompactionPolicy):
+        self.policy = policy
+
+    async def process(self, context: ChatContext, next) -> None:
+        before = prompt_tokens(context.messages)
+        compacted = self.policy.compact(context.messages)
+        after = prompt_tokens(compacted)
+        if after < before:
+            metrics.counter("context.compactions").inc()
+            metrics.histogram("context.compacted_tokens").observe(before - after)
+            context.messages = compacted
+        metrics.histogram("context.prompt_tokens").observe(after)
+        await next(context)
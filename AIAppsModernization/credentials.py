@@ -0,0 +1,143 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+"""
+Credentials
+
+Token credential layer used by every mode:
+- AZURE_CREDENTIAL_TYPE selects one credential type so the DefaultAzureCredential
+  chain walk is skipped (cli, azd, managed_identity, workload_identity,
+  environment or default)
+- the token is prefetched at startup and refreshed in the background before
+  it expires, so the first request after scale-out or a long idle period does
+  not pay for token acquisition
+- token-acquisition latency is recorded in the ``credential.token_acquire_ms`` metric
+"""
+
+import asyncio
+import logging
+import os
+import time
+
+import metrics
+
+logger = logging.getLogger("credentials")
+
+# Token scope used by AzureAIClient for Foundry projects
+TOKEN_SCOPE = os.getenv("AZURE_TOKEN_SCOPE", "https://ai.azure.com/.default")
+
+# Refresh this many seconds before the token expires
+_REFRESH_MARGIN = float(os.getenv("AZURE_TOKEN_REFRESH_MARGIN", "300"))
+# Retry delay when a background refresh fails
+_RETRY_DELAY = 30.0
+
+
+def _create_base_credential():
+    """Create the configured azure.identity credential."""
+    from azure.identity import aio as identity
+
+    credential_type = os.getenv("AZURE_CREDENTIAL_TYPE", "default").lower()
+    client_id = os.getenv("AZURE_CLIENT_ID")
+
+    if credential_type == "cli":
+        return identity.AzureCliCredential()
+    if credential_type == "azd":
+        return identity.AzureDeveloperCliCredential()
+    if credential_type == "managed_identity":
+        return identity.ManagedIdentityCredential(client_id=client_id)
+    if credential_type == "workload_identity":
+        return identity.WorkloadIdentityCredential()
+    if credential_type == "environment":
+        return identity.EnvironmentCredential()
+    if credential_type == "default":
+        return identity.DefaultAzureCredential()
+    raise ValueError(
+        f"Unknown AZURE_CREDENTIAL_TYPE {credential_type!r}. Use cli, azd, "
+        "managed_identity, workload_identity, environment or default."
+    )
+
+
+class PrefetchingCredential:
+    """Async token credential that caches tokens and refreshes them in the background.
+
+    Implements the AsyncTokenCredential protocol, so it can be passed anywhere
+    an azure.identity async credential is expected.
+    """
+
+    def __init__(self, credential, scopes: tuple[str, ...] = (TOKEN_SCOPE,)):
+        self._credential = credential
+        self._scopes = scopes
+        self._tokens: dict[tuple[str, ...], object] = {}
+        self._lock = asyncio.Lock()
+        self._refresh_task: asyncio.Task | None = None
+
+    async def get_token(self, *scopes: str, **kwargs):
+        """Return a cached token, acquiring one if missing or about to expire."""
+        if kwargs.get("claims"):
+            # Claims challenges must always go to the underlying credential
+            return await self._acquire(scopes, **kwargs)
+
+        token = self._tokens.get(scopes)
+        if token is not None and token.expires_on - time.time() > 60:
+            metrics.counter("credential.token_cache_hits").inc()
+            return token
+
+        async with self._lock:
+            token = self._tokens.get(scopes)
+            if token is not None and token.expires_on - time.time() > 60:
+                return token
+            return await self._acquire(scopes, **kwargs)
+
+    async def prefetch(self) -> None:
+        """Acquire the token now and keep it fresh in the background."""
+        await self.get_token(*self._scopes)
+        if self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def _acquire(self, scopes: tuple[str, ...], **kwargs):
+        started = time.perf_counter()
+        token = await self._credential.get_token(*scopes, **kwargs)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        metrics.histogram("credential.token_acquire_ms").observe(elapsed_ms)
+        logger.debug("Acquired token for %s in %.0f ms", scopes, elapsed_ms)
+        if not kwargs.get("claims"):
+            self._tokens[scopes] = token
+        return token
+
+    async def _refresh_loop(self) -> None:
+        """Refresh the cached tokens shortly before they expire."""
+        while True:
+            expires_on = min(
+                (token.expires_on for token in self._tokens.values()),
+                default=time.time() + _REFRESH_MARGIN,
+            )
+            await asyncio.sleep(max(expires_on - time.time() - _REFRESH_MARGIN, 1.0))
+            for scopes in list(self._tokens):
+                try:
+                    async with self._lock:
+                        await self._acquire(scopes)
+                    metrics.counter("credential.background_refreshes").inc()
+                except Exception:
+                    logger.warning("Background token refresh failed, retrying", exc_info=True)
+                    metrics.counter("credential.refresh_failures").inc()
+                    await asyncio.sleep(_RETRY_DELAY)
+
+    async def close(self) -> None:
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            self._refresh_task = None
+        await self._credential.close()
+
+    async def __aenter__(self):
+        await self._credential.__aenter__()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            self._refresh_task = None
+        await self._credential.__aexit__(*exc_info)
+
+
+def create_credential() -> PrefetchingCredential:
+    """Create the configured credential wrapped with token prefetch and refresh."""
+    return PrefetchingCredential(_create_base_credential())
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# Copyright (c) Microsoft. All rights reserved.
+
+"""
+Fake Model Backend
+
+Local stand-in for the model deployment that injects latency and errors, used
+to exercise the resilience layer (retries, hedging, circuit breaker) offline.
+
+Usage:
+    # 200 calls with 10% errors and a slow tail, through the resilience layer
+    python fake_backend.py --calls 200 --error-rate 0.1 --slow-rate 0.05 --hedge
+"""
+
+import argparse
+import asyncio
+import json
+import random
+
+
+class FakeBackendError(Exception):
+    """Error returned by the fake backend, carrying an HTTP status code."""
+
+    def __init__(self, status_code: int):
+        super().__init__(f"Fake backend returned HTTP {status_code}")
+        self.status_code = status_code
+
+
+class FakeModelBackend:
+    """Async callable that answers after a configurable latency or fails."""
+
+    def __init__(
+        self,
+        latency: float = 0.05,
+        slow_latency: float = 2.0,
+        slow_rate: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 503,
+        seed: int | None = None,
+    ):
+        self.latency = latency
+        self.slow_latency = slow_latency
+        self.slow_rate = slow_rate
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.calls = 0
+        self._random = random.Random(seed)
+
+    async def __call__(self) -> str:
+        self.calls += 1
+        slow = self._random.random() < self.slow_rate
+        await asyncio.sleep(self.slow_latency if slow else self.latency)
+        if self._random.random() < self.error_rate:
+            raise FakeBackendError(self.error_status)
+        return "OK"
+
+
+async def _run(args) -> None:
+    # Imported here so the backend itself has no framework dependency
+    import metrics
+    from resilience import ResiliencePolicy, call_with_resilience
+
+    backend = FakeModelBackend(
+        latency=args.latency,
+        slow_rate=args.slow_rate,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    )
+    policy = ResiliencePolicy(base_delay=0.05, hedge=args.hedge, hedge_min_delay=0.1)
+    failures = 0
+    for _ in range(args.calls):
+        try:
+            await call_with_resilience(backend, policy)
+        except Exception:
+            failures += 1
+    print(f"calls={args.calls} backend_calls={backend.calls} failures={failures}")
+    print(json.dumps(metrics.snapshot(), indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exercise the resilience layer against a fake backend")
+    parser.add_argument("--calls", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--slow-rate", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.1)
+    parser.add_argument("--hedge", action="store_true")
+    parser.add_argument("--seed", type=int, default=42)
+    asyncio.run(_run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# Copyright (c) Microsoft. All rights reserved.
+
+"""
+Tool Input Fuzzing
+
+Runs the tools of ``tools.py`` on multi-MB adversarial inputs (patterns
+that made the extraction regexes backtrack quadratically) and on random
+token soup, and checks that each call stays within a time budget per MB and
+grows linearly with the input size. Exits with code 1 on any violation.
+
+Usage:
+    python fuzz_tools.py                      # 1 MB and 4 MB inputs
+    python fuzz_tools.py --sizes 1,2,8 --max-seconds-per-mb 1.5
+    python fuzz_tools.py --random 20 --seed 7
+"""
+
+import argparse
+import random
+import sys
+import time
+
+from tools import analyze_code_patterns, detect_framework, generate_modernized_code
+
+MB = 1024 * 1024
+
+_SK_HEADER = "from semantic_kernel import Kernel\n"
+_AUTOGEN_HEADER = "from autogen import AssistantAgent\n"
+
+# Fragments random inputs are built from: framework keywords, decorators,
+# assignments and the quotes and brackets the extraction patterns look for
+_TOKENS = [
+    "@kernel_function", "@sk_function", "def ", "async def ", "class ", "Kernel()", "kernel = Kernel",
+    "AssistantAgent(", "UserProxyAgent(", "GroupChat(", "system_message", "instructions", " = ", ": ",
+    "=", "\"", "'", "(", ")", "\n", "    ", "\t", "import ", "from ", "semantic_kernel", "autogen",
+    "agent", "_", "x" * 64,
+]
+
+
+def _repeat(fragment: str, size: int, header: str = "") -> str:
+    return header + fragment * max(1, (size - len(header)) // len(fragment))
+
+
+# Adversarial inputs by name: each takes the target size in bytes
+GENERATORS = {
+    "decorators_without_def": lambda size: _repeat("@kernel_function\n", size, _SK_HEADER),
+    "decorator_then_far_def": lambda size: _repeat("@sk_function ", size - 16, _SK_HEADER) + "\ndef tool(): pass\n",
+    "long_identifier": lambda size: _repeat("a", size, _AUTOGEN_HEADER) + " = AssistantAgent(",
+    "identifier_equals_runs": lambda size: _repeat("agent = ", size, _AUTOGEN_HEADER),
+    "unterminated_strings": lambda size: _repeat("system_message = \"" + "x" * 500, size, _AUTOGEN_HEADER),
+    "instruction_keyword_runs": lambda size: _repeat("instructions: ", size, _SK_HEADER),
+    "quote_runs": lambda size: _repeat("\"'", size, _SK_HEADER),
+    "whitespace_runs": lambda size: _repeat(" \t", size, _SK_HEADER) + "= AssistantAgent(",
+    "import_lines": lambda size: _repeat("import " + "m" * 60 + "\n", size),
+    "no_newlines": lambda size: _repeat("from semantic_kernel import x; ", size),
+}
+
+# Tool calls checked on every input
+CALLS = {
+    "detect_framework": detect_framework,
+    "analyze_code_patterns": analyze_code_patterns,
+    "generate_modernized_code[semantic_kernel]": lambda code: generate_modernized_code(code, "semantic_kernel"),
+    "generate_modernized_code[autogen]": lambda code: generate_modernized_code(code, "autogen"),
+}
+
+
+def random_input(rng: random.Random, size: int) -> str:
+    """Random token soup of about `size` bytes."""
+    parts = []
+    length = 0
+    while length < size:
+        token = rng.choice(_TOKENS)
+        parts.append(token)
+        length += len(token)
+    return "".join(parts)
+
+
+def _timed(call, code: str) -> float:
+    started = time.perf_counter()
+    call(code)
+    return time.perf_counter() - started
+
+
+def check(name: str, inputs: dict[int, str], max_seconds_per_mb: float, max_growth: float) -> list[str]:
+    """Time every tool call on the inputs of one generator; returns the violations."""
+    failures = []
+    sizes = sorted(inputs)
+    for call_name, call in CALLS.items():
+        seconds = {size: _timed(call, inputs[size]) for size in sizes}
+        line = "  ".join(f"{size // MB}MB {seconds[size]:6.3f}s" for size in sizes)
+        print(f"{name:<26} {call_name:<42} {line}")
+        for size in sizes:
+            if seconds[size] > max_seconds_per_mb * size / MB:
+                failures.append(f"{name} / {call_name}: {seconds[size]:.2f}s on {size // MB} MB")
+        smallest, largest = sizes[0], sizes[-1]
+        # Times under 50 ms are mostly noise; linear growth is largest/smallest
+        if largest > smallest and seconds[smallest] >= 0.05:
+            growth = seconds[largest] / seconds[smallest]
+            if growth > max_growth * largest / smallest:
+                failures.append(f"{name} / {call_name}: grew {growth:.1f}x from {smallest // MB} to {largest // MB} MB")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that the tools run in bounded time on adversarial inputs")
+    parser.add_argument("--sizes", default="1,4", help="Input sizes in MB, comma-separated")
+    parser.add_argument("--max-seconds-per-mb", type=float, default=2.0, help="Time budget of one call per MB of input")
+    parser.add_argument("--max-growth", type=float, default=2.0, help="Allowed growth over linear between the sizes")
+    parser.add_argument("--random", type=int, default=5, help="Random inputs to check")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the random inputs")
+    args = parser.parse_args()
+
+    sizes = [int(float(size) * MB) for size in args.sizes.split(",")]
+    failures = []
+    for name, generate in GENERATORS.items():
+        inputs = {size: generate(size) for size in sizes}
+        failures += check(name, inputs, args.max_seconds_per_mb, args.max_growth)
+    rng = random.Random(args.seed)
+    for number in range(args.random):
+        inputs = {size: random_input(rng, size) for size in sizes}
+        failures += check(f"random_{number}", inputs, args.max_seconds_per_mb, args.max_growth)
+
+    if failures:
+        print(f"\n{len(failures)} violation(s):")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    print("\nAll tool calls within budget")
+
+
+if __name__ == "__main__":
+    main()
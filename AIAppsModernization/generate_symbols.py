@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# Copyright (c) Microsoft. All rights reserved.
+
+"""
+Agent Framework Symbol List
+
+Writes the public symbols of the installed ``agent_framework`` and its
+submodules to ``agent_framework_symbols.json``. ``validation.py`` reads the
+installed package directly and only falls back to this file where the package
+is not importable, so regenerate it whenever the pinned version changes.
+
+``--check`` writes nothing and exits with code 1 when the file no longer
+matches the installed package (it would accept symbols that do not exist or
+reject real ones) or when an ``agent_framework`` import of this project's own
+modules is rejected.
+
+Usage:
+    python generate_symbols.py
+    python generate_symbols.py --output /tmp/symbols.json
+    python generate_symbols.py --check
+"""
+
+import argparse
+import json
+import sys
+from importlib.metadata import version
+from pathlib import Path
+
+from validation import SYMBOLS_FILE, check_code, installed_symbols
+
+
+def check(symbols: dict[str, frozenset], path: str) -> list[str]:
+    """Differences between the symbol file and the installed package, and rejected imports of this project."""
+    failures = []
+    with open(path, encoding="utf-8") as source:
+        listed = {module: set(names) for module, names in json.load(source)["modules"].items()}
+    for module in sorted(set(listed) | set(symbols)):
+        missing = symbols.get(module, set()) - listed.get(module, set())
+        stale = listed.get(module, set()) - symbols.get(module, set())
+        if missing:
+            failures.append(f"{module}: not listed: {', '.join(sorted(missing))}")
+        if stale:
+            failures.append(f"{module}: listed but not exported: {', '.join(sorted(stale))}")
+    for module in sorted(Path(__file__).parent.glob("*.py")):
+        problems = check_code(module.read_text(encoding="utf-8"), module.name)
+        failures += [f"{module.name}: {problem}" for problem in problems if "agent_framework" in problem]
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write the agent_framework allow-list used by validation.py")
+    parser.add_argument("--output", default=str(SYMBOLS_FILE), help="File to write")
+    parser.add_argument("--check", action="store_true", help="Compare the file with the installed package instead")
+    args = parser.parse_args()
+
+    symbols = installed_symbols()
+    if symbols is None:
+        sys.exit("agent_framework is not importable: install the pinned requirements first")
+    if args.check:
+        failures = check(symbols, args.output)
+        for failure in failures:
+            print(failure)
+        if failures:
+            sys.exit(1)
+        print(f"{args.output} matches the installed agent_framework")
+        return
+    data = {
+        "agent_framework_core": version("agent-framework-core"),
+        "modules": {module: sorted(names) for module, names in sorted(symbols.items())},
+    }
+    with open(args.output, "w", encoding="utf-8") as output:
+        json.dump(data, output, indent=1)
+        output.write("\n")
+    print(f"Wrote {sum(map(len, symbols.values()))} symbols of {len(symbols)} modules to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+"""
+Import Graph
+
+Dependency graph of the files of a batch, built from their imports, so
+modules are modernized after the modules they import (and can reuse their
+shared clients and tools) while independent ones run in parallel.
+
+The imports of each file are extracted once per content hash and cached in a
+local SQLite index (IMPORT_INDEX), so only changed files are parsed again.
+Imports resolve to files of the batch by dotted module name, relative to the
+common root of the files or any parent package directory (``src/`` layouts);
+absolute imports matching more than one file are ignored.
+"""
+
+import ast
+import json
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+
+def extract_imports(code: str) -> list[list]:
+    """Return the imports of a module as ``[level, module, names]`` entries."""
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        return []
+    imports = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            imports.extend([0, alias.name, []] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            imports.append([node.level, node.module or "", [alias.name for alias in node.names]])
+    return imports
+
+
+class ImportIndex:
+    """SQLite cache of the imports of each file content, by its hash; safe to share between threads."""
+
+    def __init__(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA busy_timeout=5000")
+        self._db.execute("CREATE TABLE IF NOT EXISTS imports (input_hash TEXT PRIMARY KEY, imports TEXT NOT NULL)")
+
+    @classmethod
+    def from_env(cls) -> "ImportIndex":
+        default_path = Path(__file__).with_name(".cache") / "imports.db"
+        return cls(os.getenv("IMPORT_INDEX", str(default_path)))
+
+    def imports(self, input_hash: str, code: str) -> list[list]:
+        with self._lock:
+            row = self._db.execute("SELECT imports FROM imports WHERE input_hash = ?", (input_hash,)).fetchone()
+        if row is not None:
+            return json.loads(row[0])
+        # Parsed outside the lock: other threads only wait for the database
+        imports = extract_imports(code)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO imports (input_hash, imports) VALUES (?, ?)",
+                (input_hash, json.dumps(imports)),
+            )
+        return imports
+
+
+def _dotted(path: Path, root: Path) -> list[str]:
+    parts = list(path.relative_to(root).with_suffix("").parts)
+    if parts and parts[-1] == "__init__":
+        parts.pop()
+    return parts
+
+
+def build_graph(files: list[tuple[Path, str, str]], index: ImportIndex | None = None) -> dict[Path, set[Path]]:
+    """Map each of `files` ((path, input hash, code) entries) to the files it imports."""
+    if not files:
+        return {}
+    root = Path(os.path.commonpath([str(path.parent) for path, _, _ in files]))
+    dotted = {path: _dotted(path, root) for path, _, _ in files}
+
+    # Every suffix of a dotted path may be how other files import it
+    candidates: dict[str, set[Path]] = {}
+    for path, parts in dotted.items():
+        for start in range(len(parts)):
+            candidates.setdefault(".".join(parts[start:]), set()).add(path)
+    by_name = {name: next(iter(paths)) for name, paths in candidates.items() if len(paths) == 1}
+    exact = {".".join(parts): path for path, parts in dotted.items() if parts}
+
+    graph = {}
+    for path, input_hash, code in files:
+        package = dotted[path] if path.name == "__init__.py" else dotted[path][:-1]
+        dependencies = set()
+        imports = index.imports(input_hash, code) if index is not None else extract_imports(code)
+        for level, module, names in imports:
+            if level:
+                base = package[: len(package) - (level - 1)] if level - 1 <= len(package) else None
+                if base is None:
+                    continue
+                prefix = ".".join(base + ([module] if module else []))
+                lookup = exact
+            else:
+                prefix, lookup = module, by_name
+            # `from pkg import mod` imports the submodule when there is one
+            targets = [lookup.get(f"{prefix}.{name}" if prefix else name) for name in names]
+            targets = [target for target in targets if target is not None]
+            if not targets and prefix in lookup:
+                targets = [lookup[prefix]]
+            dependencies.update(target for target in targets if target != path)
+        graph[path] = dependencies
+    return graph
+
+
+def components(graph: dict[Path, set[Path]]) -> list[list[Path]]:
+    """Strongly connected components of the graph, each after the components it imports."""
+    index: dict[Path, int] = {}
+    lowlink: dict[Path, int] = {}
+    on_stack: set[Path] = set()
+    stack: list[Path] = []
+    result = []
+    for start in graph:
+        if start in index:
+            continue
+        # Iterative Tarjan: (node, iterator over its dependencies)
+        work = [(start, iter(sorted(graph[start])))]
+        index[start] = lowlink[start] = len(index)
+        stack.append(start)
+        on_stack.add(start)
+        while work:
+            node, dependencies = work[-1]
+            for dependency in dependencies:
+                if dependency not in graph:
+                    continue
+                if dependency not in index:
+                    index[dependency] = lowlink[dependency] = len(index)
+                    stack.append(dependency)
+                    on_stack.add(dependency)
+                    work.append((dependency, iter(sorted(graph[dependency]))))
+                    break
+                if dependency in on_stack:
+                    lowlink[node] = min(lowlink[node], index[dependency])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    result.append(sorted(component))
+    return result
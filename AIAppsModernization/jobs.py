@@ -0,0 +1,447 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+"""
+Background Jobs
+
+Asynchronous job API for modernization runs that outlive APIM and client
+timeouts on a synchronous ``/runs``:
+
+- ``POST /jobs`` stores the job and returns its ID immediately (202)
+- ``GET /jobs/{id}`` returns status, partial output and final result
+- ``GET /jobs/{id}/events`` streams output as resumable SSE (``Last-Event-ID``)
+- ``POST /jobs/{id}/cancel`` cancels a queued or running job
+
+Jobs persist in a local SQLite store, which is also the queue: workers claim
+queued jobs atomically, so several server workers can share one store. A
+running job holds a lease renewed while it streams; after a crash or restart
+jobs with an expired lease go back to the queue and run again, which their
+event stream reports with a ``job.restarted`` event. A job whose lease expires
+JOBS_MAX_ATTEMPTS times (e.g. it crashes the worker every time) fails instead
+of running again.
+
+SQLite calls run in worker threads (``asyncio.to_thread``), never on the
+event loop.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from urllib.parse import parse_qs
+
+import metrics
+from asgi_utils import get_header, read_body, send_json
+
+logger = logging.getLogger("jobs")
+
+TERMINAL_STATUSES = frozenset({"completed", "failed", "cancelled"})
+
+# Seconds a running job's lease lasts without renewal
+_LEASE_SECONDS = 60.0
+# Seconds between output flushes while a job streams
+_FLUSH_INTERVAL = 0.5
+# Seconds between lease renewals / cancellation checks of a running job
+_RENEW_INTERVAL = 2.0
+# Seconds between SSE keep-alive comments
+_KEEPALIVE_SECONDS = 15.0
+# Seconds a job worker waits after a store error before polling again
+_ERROR_BACKOFF = 1.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    input TEXT NOT NULL,
+    error TEXT,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_until REAL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+CREATE TABLE IF NOT EXISTS job_events (
+    job_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    kind TEXT NOT NULL DEFAULT 'output',
+    text TEXT NOT NULL,
+    PRIMARY KEY (job_id, seq)
+);
+"""
+
+
+class JobStore:
+    """SQLite persistence for jobs and their streamed output.
+
+    Methods block; async callers run them with ``asyncio.to_thread``. A lock
+    serializes the threads sharing the connection.
+    """
+
+    def __init__(self, path: str, max_attempts: int = 3):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.max_attempts = max_attempts
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA busy_timeout=5000")
+        self._db.executescript(_SCHEMA)
+        columns = {row["name"] for row in self._db.execute("PRAGMA table_info(job_events)")}
+        if "kind" not in columns:
+            # Stores created before restarts were recorded as events
+            self._db.execute("ALTER TABLE job_events ADD COLUMN kind TEXT NOT NULL DEFAULT 'output'")
+        columns = {row["name"] for row in self._db.execute("PRAGMA table_info(jobs)")}
+        if "attempts" not in columns:
+            # Stores created before attempts were counted
+            self._db.execute("ALTER TABLE jobs ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+
+    def _execute(self, sql: str, params: tuple = ()) -> list:
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def create(self, job_input: str) -> str:
+        job_id = f"job_{uuid.uuid4().hex}"
+        now = time.time()
+        self._execute(
+            "INSERT INTO jobs (id, status, input, created_at, updated_at) VALUES (?, 'queued', ?, ?, ?)",
+            (job_id, job_input, now, now),
+        )
+        return job_id
+
+    def get(self, job_id: str) -> dict | None:
+        rows = self._execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        return dict(rows[0]) if rows else None
+
+    def claim_next(self) -> dict | None:
+        """Atomically move the oldest queued job (or one with an expired lease) to running."""
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = 'cancelled', lease_until = NULL, updated_at = ? "
+                "WHERE status = 'running' AND lease_until < ? AND cancel_requested = 1",
+                (now, now),
+            )
+            # Lost its lease on every attempt: most likely it takes the worker down with it
+            failed = self._db.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, lease_until = NULL, updated_at = ? "
+                "WHERE status = 'running' AND lease_until < ? AND attempts >= ? RETURNING id",
+                (f"Abandoned after {self.max_attempts} attempts", now, now, self.max_attempts),
+            ).fetchall()
+            row = self._db.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, lease_until = ?, updated_at = ? "
+                "WHERE id = (SELECT id FROM jobs WHERE status = 'queued' "
+                "            OR (status = 'running' AND lease_until < ?) "
+                "            ORDER BY created_at LIMIT 1) "
+                "RETURNING *",
+                (now + _LEASE_SECONDS, now, now),
+            ).fetchone()
+            # A job restarted after a crash begins a fresh output; its event ids keep
+            # increasing so resuming readers see the restart instead of missing events
+            if row is not None and self.events_after(row["id"], 0):
+                self._append(row["id"], "restarted", "")
+        for job in failed:
+            logger.warning("Job %s failed after %d attempts", job["id"], self.max_attempts)
+            metrics.counter("jobs.abandoned").inc()
+        return dict(row) if row is not None else None
+
+    def renew(self, job_id: str) -> bool:
+        """Renew the lease; returns True if cancellation was requested."""
+        now = time.time()
+        rows = self._execute(
+            "UPDATE jobs SET lease_until = ?, updated_at = ? WHERE id = ? RETURNING cancel_requested",
+            (now + _LEASE_SECONDS, now, job_id),
+        )
+        return bool(rows and rows[0]["cancel_requested"])
+
+    def _append(self, job_id: str, kind: str, text: str) -> None:
+        self._execute(
+            "INSERT INTO job_events (job_id, seq, kind, text) VALUES "
+            "(?, (SELECT COALESCE(MAX(seq), 0) + 1 FROM job_events WHERE job_id = ?), ?, ?)",
+            (job_id, job_id, kind, text),
+        )
+
+    def append_output(self, job_id: str, text: str) -> None:
+        self._append(job_id, "output", text)
+
+    def events_after(self, job_id: str, seq: int) -> list[tuple[int, str, str]]:
+        """Events after `seq` as (seq, kind, text), kind being "output" or "restarted"."""
+        rows = self._execute(
+            "SELECT seq, kind, text FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq",
+            (job_id, seq),
+        )
+        return [(row["seq"], row["kind"], row["text"]) for row in rows]
+
+    def output(self, job_id: str) -> str:
+        """Output of the latest attempt of a job."""
+        output = []
+        for _, kind, text in self.events_after(job_id, 0):
+            if kind == "restarted":
+                output.clear()
+            else:
+                output.append(text)
+        return "".join(output)
+
+    def finish(self, job_id: str, status: str, error: str | None = None) -> None:
+        self._execute(
+            "UPDATE jobs SET status = ?, error = ?, lease_until = NULL, updated_at = ? WHERE id = ?",
+            (status, error, time.time(), job_id),
+        )
+
+    def requeue(self, job_id: str) -> None:
+        """Hand a running job back to the queue; a clean shutdown does not use up an attempt."""
+        self._execute(
+            "UPDATE jobs SET status = 'queued', attempts = MAX(attempts - 1, 0), lease_until = NULL, "
+            "updated_at = ? WHERE id = ? AND status = 'running'",
+            (time.time(), job_id),
+        )
+
+    def request_cancel(self, job_id: str) -> str | None:
+        """Cancel a queued job right away or flag a running one; returns the new status."""
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = 'cancelled', updated_at = ? WHERE id = ? AND status = 'queued'",
+                (now, job_id),
+            )
+            self._db.execute(
+                "UPDATE jobs SET cancel_requested = 1, updated_at = ? WHERE id = ? AND status = 'running'",
+                (now, job_id),
+            )
+            job = self.get(job_id)
+        return job["status"] if job else None
+
+    def count(self, status: str) -> int:
+        return self._execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (status,))[0][0]
+
+
+class JobManager:
+    """Runs stored jobs against the agent in a bounded pool of asyncio workers."""
+
+    def __init__(self, agent, store: JobStore, max_workers: int = 2):
+        self.agent = agent
+        self.store = store
+        self.max_workers = max_workers
+        self._wakeup = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+        self._running: dict[str, asyncio.Task] = {}
+
+    @classmethod
+    def from_env(cls, agent) -> "JobManager":
+        default_path = Path(__file__).with_name(".cache") / "jobs.db"
+        store = JobStore(
+            os.getenv("JOBS_DB", str(default_path)),
+            max_attempts=int(os.getenv("JOBS_MAX_ATTEMPTS", "3")),
+        )
+        return cls(agent, store, max_workers=int(os.getenv("JOBS_MAX_WORKERS", "2")))
+
+    def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.max_workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, job_input: str) -> str:
+        job_id = await asyncio.to_thread(self.store.create, job_input)
+        metrics.counter("jobs.submitted").inc()
+        self._wakeup.set()
+        return job_id
+
+    async def cancel(self, job_id: str) -> str | None:
+        """Request cancellation; a run in this process stops now, others at their next renewal."""
+        status = await asyncio.to_thread(self.store.request_cancel, job_id)
+        run = self._running.get(job_id)
+        if run is not None:
+            run.cancel()
+        return status
+
+    async def _worker(self) -> None:
+        while True:
+            try:
+                job = await asyncio.to_thread(self.store.claim_next)
+            except Exception:
+                # e.g. the database stayed locked past busy_timeout: keep the worker alive
+                logger.exception("Claiming the next job failed")
+                metrics.counter("jobs.store_errors").inc()
+                await asyncio.sleep(_ERROR_BACKOFF)
+                continue
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    # Poll as well: other server workers may enqueue into the shared store
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=1.0)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self._run(job)
+            except Exception:
+                # The job keeps its lease and is claimed again once it expires
+                logger.exception("Job %s could not be recorded", job["id"])
+                metrics.counter("jobs.store_errors").inc()
+                await asyncio.sleep(_ERROR_BACKOFF)
+
+    async def _run(self, job: dict) -> None:
+        job_id = job["id"]
+        started = time.perf_counter()
+        metrics.gauge("jobs.running").inc()
+        run = asyncio.create_task(self._stream(job_id, job["input"]))
+        self._running[job_id] = run
+        try:
+            # Renew the lease and watch for cancellation while the run streams
+            while not run.done():
+                await asyncio.wait({run}, timeout=_RENEW_INTERVAL)
+                if not run.done() and await asyncio.to_thread(self.store.renew, job_id):
+                    run.cancel()
+            if run.cancelled():
+                await asyncio.to_thread(self.store.finish, job_id, "cancelled")
+                metrics.counter("jobs.cancelled").inc()
+            elif run.exception() is not None:
+                exc = run.exception()
+                logger.warning("Job %s failed", job_id, exc_info=exc)
+                await asyncio.to_thread(self.store.finish, job_id, "failed", f"{type(exc).__name__}: {exc}")
+                metrics.counter("jobs.failed").inc()
+            else:
+                await asyncio.to_thread(self.store.finish, job_id, "completed")
+                metrics.counter("jobs.completed").inc()
+        except asyncio.CancelledError:
+            # Server shutting down: hand the job back so the next start runs it again.
+            # Called directly: this task is already cancelled and must not await again
+            run.cancel()
+            self.store.requeue(job_id)
+            raise
+        except Exception:
+            run.cancel()
+            raise
+        finally:
+            del self._running[job_id]
+            metrics.gauge("jobs.running").dec()
+            metrics.histogram("jobs.duration_ms").observe((time.perf_counter() - started) * 1000)
+
+    async def _stream(self, job_id: str, job_input: str) -> None:
+        """Run the agent and persist its output in small batches."""
+        buffer = []
+        last_flush = time.monotonic()
+        async for update in self.agent.run_stream(job_input):
+            if update.text:
+                buffer.append(update.text)
+            if buffer and time.monotonic() - last_flush >= _FLUSH_INTERVAL:
+                await asyncio.to_thread(self.store.append_output, job_id, "".join(buffer))
+                buffer.clear()
+                last_flush = time.monotonic()
+        if buffer:
+            await asyncio.to_thread(self.store.append_output, job_id, "".join(buffer))
+
+
+def _job_view(store: JobStore, job: dict) -> dict:
+    return {
+        "id": job["id"],
+        "status": job["status"],
+        "attempts": job["attempts"],
+        "output": store.output(job["id"]),
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+    }
+
+
+class JobsMiddleware:
+    """Raw ASGI middleware serving the /jobs API from a JobManager."""
+
+    def __init__(self, app, manager: JobManager):
+        self.app = app
+        self.manager = manager
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "")
+        if scope["type"] != "http" or not (path == "/jobs" or path.startswith("/jobs/")):
+            await self.app(scope, receive, send)
+            return
+
+        method = scope.get("method")
+        parts = path.strip("/").split("/")
+        store = self.manager.store
+
+        if parts == ["jobs"] and method == "POST":
+            try:
+                payload = json.loads(await read_body(receive))
+                job_input = payload["input"]
+                if not isinstance(job_input, str):
+                    job_input = json.dumps(job_input)
+            except (ValueError, KeyError, TypeError):
+                await send_json(send, 400, {"code": "invalid_request_error", "message": "Body must be JSON with an 'input' field"})
+                return
+            job_id = await self.manager.submit(job_input)
+            await send_json(send, 202, {"id": job_id, "status": "queued"}, headers={"location": f"/jobs/{job_id}"})
+            return
+
+        job = await asyncio.to_thread(store.get, parts[1]) if len(parts) >= 2 else None
+        if job is None:
+            await send_json(send, 404, {"code": "not_found", "message": "Job not found"})
+            return
+
+        if len(parts) == 2 and method == "GET":
+            await send_json(send, 200, await asyncio.to_thread(_job_view, store, job))
+        elif len(parts) == 3 and parts[2] == "cancel" and method == "POST":
+            status = await self.manager.cancel(job["id"])
+            await send_json(send, 202, {"id": job["id"], "status": status})
+        elif len(parts) == 3 and parts[2] == "events" and method == "GET":
+            await self._stream_events(scope, receive, send, job["id"])
+        else:
+            await send_json(send, 405, {"code": "method_not_allowed", "message": "Unsupported job operation"})
+
+    async def _stream_events(self, scope, receive, send, job_id: str) -> None:
+        """Stream job output as SSE, resuming after Last-Event-ID or ?after=, until the client leaves."""
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        last_id = get_header(scope, "last-event-id") or query.get("after", ["0"])[0]
+        seq = int(last_id) if last_id.isdigit() else 0
+
+        disconnected = asyncio.Event()
+
+        async def watch_disconnect():
+            while (await receive())["type"] != "http.disconnect":
+                pass
+            disconnected.set()
+
+        watcher = asyncio.create_task(watch_disconnect())
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"text/event-stream"), (b"cache-control", b"no-cache")],
+        })
+        store = self.manager.store
+        last_write = time.monotonic()
+        try:
+            while not disconnected.is_set():
+                events = await asyncio.to_thread(store.events_after, job_id, seq)
+                for seq, kind, text in events:
+                    if kind == "restarted":
+                        # Output sent so far belongs to an attempt that crashed
+                        frame = f"id: {seq}\nevent: job.restarted\ndata: {{}}\n\n"
+                    else:
+                        frame = f"id: {seq}\nevent: job.output\ndata: {json.dumps({'delta': text})}\n\n"
+                    await send({"type": "http.response.body", "body": frame.encode("utf-8"), "more_body": True})
+                    last_write = time.monotonic()
+                job = await asyncio.to_thread(store.get, job_id)
+                if job["status"] in TERMINAL_STATUSES and not events:
+                    final = {"status": job["status"], "error": job["error"]}
+                    frame = f"event: job.{job['status']}\ndata: {json.dumps(final)}\n\n"
+                    await send({"type": "http.response.body", "body": frame.encode("utf-8"), "more_body": False})
+                    return
+                if time.monotonic() - last_write >= _KEEPALIVE_SECONDS:
+                    await send({"type": "http.response.body", "body": b": keep-alive\n\n", "more_body": True})
+                    last_write = time.monotonic()
+                try:
+                    await asyncio.wait_for(disconnected.wait(), timeout=_FLUSH_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+            metrics.counter("jobs.event_stream_disconnects").inc()
+        finally:
+            watcher.cancel()
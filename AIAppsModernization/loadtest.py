@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+# Copyright (c) Microsoft. All rights reserved.
+
+"""
+HTTP Load Test
+
+Measures throughput and latency percentiles of POST /runs, and compares a
+single-worker server against a multi-worker one on the same machine.
+
+Usage:
+    # Load an already running server
+    python loadtest.py --url http://localhost:8087 --concurrency 32 --requests 200
+
+    # Start the server with 1 and then 4 workers and compare
+    python loadtest.py --compare 1,4 --port 8090 --concurrency 32 --requests 200
+
+    # Streamed runs: SSE events per response and time to first event
+    python loadtest.py --stream --concurrency 4 --requests 20
+
+    # Multi-turn session: resend the history each turn vs. a short session ID
+    python loadtest.py --session-turns 4
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+import uuid
+
+import httpx
+
+DEFAULT_PROMPT = """Analyze this Semantic Kernel code and modernize it:
+
+```python
+from semantic_kernel import Kernel
+from semantic_kernel.functions import kernel_function
+
+kernel = Kernel()
+
+@kernel_function(name="greet", description="Greet someone")
+def greet(name: str) -> str:
+    return f"Hello, {name}!"
+```
+"""
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def _streamed_run(client, prompt: str) -> tuple[int, float]:
+    """Send one streamed POST /runs; return the SSE event count and time to first event."""
+    started = time.perf_counter()
+    first_event = None
+    events = 0
+    async with client.stream("POST", "/runs", json={"input": prompt, "stream": True}) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            # Heartbeat comments start with ':' and are not events
+            if line.startswith("data:"):
+                events += 1
+                if first_event is None:
+                    first_event = time.perf_counter() - started
+    return events, first_event or 0.0
+
+
+async def run_load(url: str, concurrency: int, requests: int, prompt: str, stream: bool = False) -> dict:
+    """Send `requests` POST /runs with at most `concurrency` in flight."""
+    latencies = []
+    events_per_response = []
+    first_event = []
+    errors = 0
+    queue = asyncio.Queue()
+    for _ in range(requests):
+        queue.put_nowait(None)
+
+    async with httpx.AsyncClient(base_url=url, timeout=300) as client:
+
+        async def worker():
+            nonlocal errors
+            while not queue.empty():
+                queue.get_nowait()
+                started = time.perf_counter()
+                try:
+                    if stream:
+                        events, ttfe = await _streamed_run(client, prompt)
+                        events_per_response.append(events)
+                        first_event.append(ttfe)
+                    else:
+                        response = await client.post("/runs", json={"input": prompt})
+                        if response.status_code != 200:
+                            errors += 1
+                            continue
+                except httpx.HTTPError:
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    result = {
+        "requests": requests,
+        "errors": errors,
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+    if stream:
+        result["events_per_response"] = sum(events_per_response) / len(events_per_response) if events_per_response else 0.0
+        result["first_event_p50_ms"] = percentile(first_event, 50) * 1000
+    return result
+
+
+FOLLOW_UPS = [
+    "Now generate the modernized version.",
+    "Add type hints to every tool function.",
+    "List the remaining migration steps.",
+]
+
+
+async def run_session(url: str, turns: int, prompt: str, use_session: bool) -> dict:
+    """Run one multi-turn conversation and total the request bytes and input tokens.
+
+    Without a session the client resends the whole transcript every turn, as an
+    APIM MCP client does today; with a session it sends a short conversation ID
+    and only the new message. A last turn asks for a reference only the first
+    message carried, so `history_kept` shows whether the history reached the model.
+    """
+    reference = uuid.uuid4().hex[:12]
+    messages = [f"{prompt}\n\nReference: {reference}"]
+    messages += [FOLLOW_UPS[i % len(FOLLOW_UPS)] for i in range(turns - 1)]
+    messages.append("What was the Reference in my first message? Reply with the value only.")
+    session_id = f"session-{uuid.uuid4().hex[:8]}"
+    transcript = []
+    request_bytes = input_tokens = 0
+    async with httpx.AsyncClient(base_url=url, timeout=300) as client:
+        for message in messages:
+            if use_session:
+                body = {"input": message, "conversation": session_id}
+            else:
+                body = {"input": "\n\n".join(transcript + [message])}
+            response = await client.post("/runs", json=body)
+            response.raise_for_status()
+            result = response.json()
+            request_bytes += len(response.request.content)
+            input_tokens += (result.get("usage") or {}).get("input_tokens") or 0
+            output = "".join(
+                part.get("text", "")
+                for item in result.get("output") or []
+                for part in item.get("content") or []
+            )
+            transcript += [message, output]
+    return {
+        "turns": len(messages),
+        "request_bytes": request_bytes,
+        "input_tokens": input_tokens,
+        "history_kept": reference in transcript[-1],
+    }
+
+
+def wait_until_ready(url: str, timeout: float = 120) -> None:
+    """Poll the readiness probe until the server has warmed up."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{url}/readiness", timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"Server at {url} did not become ready")
+
+
+def compare(worker_counts: list[int], port: int, args) -> None:
+    """Run the same load against the server started with each worker count."""
+    url = f"http://localhost:{port}"
+    results = {}
+    for workers in worker_counts:
+        server = subprocess.Popen(
+            [sys.executable, "main.py", "--port", str(port), "--workers", str(workers)],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            # Every run must reach the agent, not the response cache
+            env={**os.environ, "RESPONSE_CACHE_ENABLED": "false"},
+        )
+        try:
+            wait_until_ready(url)
+            results[workers] = asyncio.run(run_load(url, args.concurrency, args.requests, args.prompt, args.stream))
+        finally:
+            server.terminate()
+            server.wait(timeout=60)
+
+    print(f"\n{'workers':>8} {'req/s':>10} {'p50 ms':>10} {'p99 ms':>10} {'errors':>8}")
+    for workers, result in results.items():
+        print(
+            f"{workers:>8} {result['throughput']:>10.2f} {result['p50_ms']:>10.0f} "
+            f"{result['p99_ms']:>10.0f} {result['errors']:>8}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the Code Modernizer HTTP server")
+    parser.add_argument("--url", default="http://localhost:8087", help="Server base URL")
+    parser.add_argument("--concurrency", type=int, default=16, help="Requests in flight")
+    parser.add_argument("--requests", type=int, default=100, help="Total requests to send")
+    parser.add_argument("--prompt", default=DEFAULT_PROMPT, help="Prompt sent in each run")
+    parser.add_argument("--stream", action="store_true", help="Send streamed runs and count SSE events")
+    parser.add_argument("--session-turns", type=int, help="Compare a multi-turn session with and without a session ID")
+    parser.add_argument("--compare", help="Comma-separated worker counts to compare, e.g. 1,4")
+    parser.add_argument("--port", type=int, default=8090, help="Port used with --compare")
+    args = parser.parse_args()
+
+    if args.session_turns:
+        for use_session in (False, True):
+            result = asyncio.run(run_session(args.url, args.session_turns, args.prompt, use_session))
+            print(f"{'session' if use_session else 'resend':>8}: {result}")
+            if not result["history_kept"]:
+                sys.exit(f"{'session' if use_session else 'resend'}: the last turn did not see the first message")
+    elif args.compare:
+        compare([int(n) for n in args.compare.split(",")], args.port, args)
+    else:
+        result = asyncio.run(run_load(args.url, args.concurrency, args.requests, args.prompt, args.stream))
+        print(result)
+
+
+if __name__ == "__main__":
+    main()
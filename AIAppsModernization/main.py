@@ -13,10 +13,26 @@ Usage:
     
     # Run as HTTP server (for debugging with Agent Inspector)
     python main.py --server
+
+    # Run as HTTP server with 4 pre-forked workers sharing the port
+    python main.py --workers 4
     
     # Run in CLI mode (for testing)
     python main.py --cli
 
+    # Convert files, globs or directories in batch, 8 at a time
+    python main.py modernize src/ "legacy/**/*.py" --concurrency 8 --output-dir migrated
+
+    # Check generated code statically (parses, imports, Annotated tools)
+    python main.py validate migrated/
+
+    # Report the import-time breakdown of the MCP startup path
+    python main.py --import-profile
+
+    # Profile the process until it exits (folded stacks in .cache/profiles;
+    # "--profile alloc" also traces allocations, which is much slower)
+    python main.py --profile
+
 To configure in VS Code for GitHub Copilot Chat:
 1. Add to your VS Code settings.json or .vscode/mcp.json
 2. Configure the MCP server pointing to this script
@@ -28,13 +44,13 @@ import json as json_mod
 import logging
 import os
 import sys
+import time
 from typing import Annotated
 
-from dotenv import load_dotenv
-from azure.identity.aio import DefaultAzureCredential
+from asgi_utils import read_body, replay_body
 
-# Load environment variables
-load_dotenv(override=True)
+# Heavy dependencies (dotenv, azure.identity, agent_framework) are imported lazily
+# inside each mode so the stdio MCP handshake is not delayed by them.
 
 logger = logging.getLogger("sanitize_payload")
 
@@ -67,7 +83,12 @@ class SanitizePayloadMiddleware:
     _MIN_FOUNDRY_ID_LEN = 55
 
     def __init__(self, app):
+        from response_cache import multi_turn_request
+        from tracing import span
+
         self.app = app
+        self._multi_turn_request = multi_turn_request
+        self._span = span
 
     async def __call__(self, scope, receive, send):
         if scope["type"] != "http":
@@ -81,62 +102,58 @@ class SanitizePayloadMiddleware:
             return
 
         # Buffer the full request body
-        body_parts = []
-        while True:
-            message = await receive()
-            body_parts.append(message.get("body", b""))
-            if not message.get("more_body", False):
-                break
-        raw_body = b"".join(body_parts)
+        raw_body = await read_body(receive)
 
         # Parse, sanitize, re-serialize
+        with self._span("sanitize_payload", {"http.request.body.size": len(raw_body)}) as current:
+            multi_turn = False
+            try:
+                payload = json_mod.loads(raw_body)
+                if isinstance(payload, dict):
+                    changed = False
+                    for f in self._DICT_FIELDS:
+                        if f in payload and not isinstance(payload[f], dict):
+                            payload[f] = {}
+                            changed = True
+                    for f in self._OBJECT_FIELDS:
+                        if f in payload and isinstance(payload[f], str) and payload[f] == "":
+                            payload[f] = None
+                            changed = True
+                    for f in self._LIST_FIELDS:
+                        if f in payload and not isinstance(payload[f], list):
+                            payload[f] = None
+                            changed = True
+                    for f in self._STRIP_EMPTY:
+                        if f in payload and isinstance(payload[f], str) and payload[f] == "":
+                            del payload[f]
+                            changed = True
+                    # conversation: must be a valid Foundry ID (conv_<50+ chars>) or dict with id
+                    # APIM MCP sends short strings like "session-1" that crash the SDK
+                    # (SessionMiddleware maps known ones to real IDs before this point)
+                    if "conversation" in payload:
+                        conv = payload["conversation"]
+                        if isinstance(conv, str) and len(conv) < self._MIN_FOUNDRY_ID_LEN:
+                            del payload["conversation"]
+                            changed = True
+                        elif isinstance(conv, dict) and not conv.get("id"):
+                            del payload["conversation"]
+                            changed = True
+                    if changed:
+                        logger.debug("Sanitized payload for %s", path)
+                        raw_body = json_mod.dumps(payload).encode("utf-8")
+                    # Runs that continue server-side history must bypass the response cache
+                    multi_turn = bool(payload.get("previous_response_id") or payload.get("conversation"))
+            except (json_mod.JSONDecodeError, TypeError):
+                pass  # Let the downstream middleware handle invalid JSON
+            if current is not None:
+                current.set_attribute("sanitize.multi_turn", multi_turn)
+
+        token = self._multi_turn_request.set(multi_turn)
         try:
-            payload = json_mod.loads(raw_body)
-            if isinstance(payload, dict):
-                changed = False
-                for f in self._DICT_FIELDS:
-                    if f in payload and not isinstance(payload[f], dict):
-                        payload[f] = {}
-                        changed = True
-                for f in self._OBJECT_FIELDS:
-                    if f in payload and isinstance(payload[f], str) and payload[f] == "":
-                        payload[f] = None
-                        changed = True
-                for f in self._LIST_FIELDS:
-                    if f in payload and not isinstance(payload[f], list):
-                        payload[f] = None
-                        changed = True
-                for f in self._STRIP_EMPTY:
-                    if f in payload and isinstance(payload[f], str) and payload[f] == "":
-                        del payload[f]
-                        changed = True
-                # conversation: must be a valid Foundry ID (conv_<50+ chars>) or dict with id
-                # APIM MCP sends short strings like "session-1" that crash the SDK
-                if "conversation" in payload:
-                    conv = payload["conversation"]
-                    if isinstance(conv, str) and len(conv) < self._MIN_FOUNDRY_ID_LEN:
-                        del payload["conversation"]
-                        changed = True
-                    elif isinstance(conv, dict) and not conv.get("id"):
-                        del payload["conversation"]
-                        changed = True
-                if changed:
-                    logger.debug("Sanitized payload for %s", path)
-                    raw_body = json_mod.dumps(payload).encode("utf-8")
-        except (json_mod.JSONDecodeError, TypeError):
-            pass  # Let the downstream middleware handle invalid JSON
-
-        # Replace receive with one that returns the sanitized body
-        body_sent = False
-
-        async def patched_receive():
-            nonlocal body_sent
-            if not body_sent:
-                body_sent = True
-                return {"type": "http.request", "body": raw_body, "more_body": False}
-            return {"type": "http.disconnect"}
-
-        await self.app(scope, patched_receive, send)
+            # Replace receive with one that returns the sanitized body
+            await self.app(scope, replay_body(raw_body, receive), send)
+        finally:
+            self._multi_turn_request.reset(token)
 
 
 # ==============================================================================
@@ -153,6 +170,13 @@ WORKFLOW — For every modernization request:
 3. Call generate_modernized_code to produce the base modernized structure
 4. Enhance the generated code with your expertise to produce a COMPLETE, WORKING solution
 
+Large tool outputs come back as an artifact handle with an outline; call fetch_artifact
+with the handle and a line range to read the parts you need.
+
+Uploaded files are referenced as code_ref=sha256:...; pass the reference unchanged as the
+code argument of analyze_code_patterns and generate_modernized_code, and read the code
+itself with fetch_artifact.
+
 OUTPUT REQUIREMENTS:
 - ALWAYS include the COMPLETE modernized Python source file in a ```python code block
 - Convert EVERY function, class, and pattern from the original — no placeholders or TODOs
@@ -179,20 +203,54 @@ You MUST generate the complete modernized code."""
 
 
 def get_tools():
-    """Get the modernization tools."""
+    """Get the modernization tools, wrapped to run off the event loop."""
+    from tool_engine import async_tools
     from tools import (
         analyze_code_patterns,
+        fetch_artifact,
         generate_modernized_code,
         get_migration_guide,
     )
-    return [analyze_code_patterns, generate_modernized_code, get_migration_guide]
+    return async_tools([analyze_code_patterns, generate_modernized_code, get_migration_guide, fetch_artifact])
+
+
+def get_middleware():
+    """Get the agent middleware (response cache, token budget, ...)."""
+    from middleware import build_middleware
+
+    return build_middleware(AGENT_INSTRUCTIONS)
+
+
+def create_agent(credential, endpoint: str, model: str):
+    """Create the CodeModernizer agent (use as an async context manager)."""
+    from agent_framework.azure import AzureAIClient
+    from compaction import CompactionPolicy
+
+    # Compaction needs the history on this side: with store=False the service
+    # keeps nothing, the thread holds the messages and every call sends them
+    store = False if CompactionPolicy.from_env() is not None else None
+    return AzureAIClient(
+        project_endpoint=endpoint,
+        model_deployment_name=model,
+        credential=credential,
+    ).create_agent(
+        name="CodeModernizer",
+        instructions=AGENT_INSTRUCTIONS,
+        tools=get_tools(),
+        middleware=get_middleware(),
+        store=store,
+    )
 
 
 async def run_as_mcp_server():
-    """Run the agent as an MCP server for GitHub Copilot integration."""
+    """Run the agent as an MCP server for GitHub Copilot integration.
+
+    The MCP handshake is answered before the credential and agent exist; they
+    are created in the background and awaited by the first tool call.
+    """
     
-    from agent_framework.azure import AzureAIClient
     from mcp.server.stdio import stdio_server
+    from mcp_server import LazyAgent, build_server
     
     endpoint = os.getenv("FOUNDRY_PROJECT_ENDPOINT")
     model = os.getenv("FOUNDRY_MODEL_DEPLOYMENT_NAME")
@@ -204,35 +262,59 @@ async def run_as_mcp_server():
         )
         sys.exit(1)
     
-    async with (
-        DefaultAzureCredential() as credential,
-        AzureAIClient(
-            project_endpoint=endpoint,
-            model_deployment_name=model,
-            credential=credential,
-        ).create_agent(
-            name="CodeModernizer",
-            instructions=AGENT_INSTRUCTIONS,
-            tools=get_tools(),
-        ) as agent,
-    ):
-        # Expose the agent as an MCP server
-        server = agent.as_mcp_server()
-        
-        # Run the MCP server using stdio transport
+    async def open_agent(stack):
+        # Import the heavy modules off the event loop so MCP messages keep flowing
+        await asyncio.to_thread(_import_agent_modules)
+        from credentials import create_credential
+
+        credential = await stack.enter_async_context(create_credential())
+        await credential.prefetch()
+        return await stack.enter_async_context(create_agent(credential, endpoint, model))
+
+    lazy_agent = LazyAgent(open_agent)
+    direct_tools = os.getenv("MCP_DIRECT_TOOLS", "true").lower() not in ("0", "false", "no")
+    server = build_server(lazy_agent, direct_tools=direct_tools)
+    
+    # Run the MCP server using stdio transport
+    try:
         async with stdio_server() as (read_stream, write_stream):
             await server.run(
                 read_stream,
                 write_stream,
                 server.create_initialization_options()
             )
+    finally:
+        await lazy_agent.aclose()
+
+
+def _import_agent_modules():
+    """Import the agent framework, Azure identity and tool modules."""
+    import agent_framework.azure  # noqa: F401
+    import credentials  # noqa: F401
+    import middleware  # noqa: F401
+    import tool_engine  # noqa: F401
+    import tools  # noqa: F401
 
 
-async def run_as_http_server():
-    """Run the agent as an HTTP server for debugging with Agent Inspector."""
+async def run_as_http_server(sock=None, ready=None):
+    """Run the agent as an HTTP server for debugging with Agent Inspector.
+
+    When `sock` is given (multi-worker mode) the server accepts connections on
+    that shared socket, warms up first and sets the `ready` event once serving.
+    """
     
-    from agent_framework.azure import AzureAIClient
+    from admission import AdmissionController, AdmissionMiddleware
+    from artifacts import ArtifactsMiddleware
     from azure.ai.agentserver.agentframework import from_agent_framework
+    from credentials import create_credential
+    from jobs import JobManager, JobsMiddleware
+    from mcp_http import MCPHttpMiddleware, MCPSessionManager
+    from metrics import MetricsMiddleware
+    from profiling import ProfilingMiddleware, profiling_enabled
+    from sessions import SessionMiddleware, SessionStore, ThreadRepository
+    from streaming import SSEHeartbeatMiddleware
+    from tracing import TracingMiddleware, enabled as tracing_enabled
+    from warmup import ReadinessMiddleware, WarmupState, warm_up_until_ready
     
     endpoint = os.getenv("FOUNDRY_PROJECT_ENDPOINT")
     model = os.getenv("FOUNDRY_MODEL_DEPLOYMENT_NAME")
@@ -245,26 +327,82 @@ async def run_as_http_server():
         sys.exit(1)
     
     async with (
-        DefaultAzureCredential() as credential,
-        AzureAIClient(
-            project_endpoint=endpoint,
-            model_deployment_name=model,
-            credential=credential,
-        ).create_agent(
-            name="CodeModernizer",
-            instructions=AGENT_INSTRUCTIONS,
-            tools=get_tools(),
-        ) as agent,
+        create_credential() as credential,
+        create_agent(credential, endpoint, model) as agent,
     ):
         port = os.getenv("AGENT_SERVER_PORT", "8087")
         print("Starting Code Modernizer HTTP Server...")
         print(f"Server running on http://localhost:{port}")
         print("Use AI Toolkit Agent Inspector to test the agent")
         
-        # Run as HTTP server with payload sanitization for APIM MCP compatibility
-        server = from_agent_framework(agent)
-        server.app = SanitizePayloadMiddleware(server.app)
-        await server.run_async()
+        # Run as HTTP server with payload sanitization for APIM MCP compatibility;
+        # /readiness reports ready only once the warm-up stage has succeeded
+        state = WarmupState()
+        sessions = SessionStore.from_env()
+        # Threads are saved per conversation so later turns continue the same history
+        thread_repository = ThreadRepository(agent, sessions) if sessions is not None else None
+        server = from_agent_framework(agent, thread_repository=thread_repository)
+        app = SanitizePayloadMiddleware(server.app)
+        if sessions is not None:
+            # Resolve short client session IDs before the sanitizer would drop them
+            app = SessionMiddleware(app, sessions)
+        admission = AdmissionController.from_env()
+        if admission is not None:
+            # Admit before buffering the body so rejected requests cost almost nothing
+            app = AdmissionMiddleware(app, admission)
+        # Background jobs run in this worker's pool, persisted in a shared store
+        jobs = JobManager.from_env(agent)
+        app = JobsMiddleware(app, jobs)
+        # Agent calls over MCP take admission slots like /runs
+        mcp_sessions = MCPSessionManager.from_env(agent, admission)
+        if mcp_sessions is not None:
+            # MCP clients share this worker's warm agent instead of one stdio process each
+            app = MCPHttpMiddleware(app, mcp_sessions)
+            mcp_sessions.start()
+        app = ArtifactsMiddleware(app)
+        # Heartbeats keep idle SSE streams alive through the gateway
+        app = SSEHeartbeatMiddleware(app)
+        if tracing_enabled():
+            # Continues the caller's trace; probes and /metrics are answered outside it
+            app = TracingMiddleware(app)
+        if profiling_enabled():
+            # GET /debug/profile and x-profile requests, for authorized callers only
+            app = ProfilingMiddleware(app)
+        server.app = MetricsMiddleware(ReadinessMiddleware(app, state))
+        jobs.start()
+        try:
+            if sock is None:
+                warmup_task = asyncio.create_task(warm_up_until_ready(agent, credential, state))
+                try:
+                    await server.run_async()
+                finally:
+                    warmup_task.cancel()
+                return
+
+            # Workers share the socket, so they only start accepting once warm
+            import uvicorn
+
+            await warm_up_until_ready(agent, credential, state)
+            config = uvicorn.Config(
+                server.app,
+                loop="asyncio",
+                timeout_graceful_shutdown=int(os.getenv("AGENT_SERVER_DRAIN_TIMEOUT", "30")),
+            )
+            uvicorn_server = uvicorn.Server(config)
+            ready.set()
+            await uvicorn_server.serve(sockets=[sock])
+        finally:
+            if mcp_sessions is not None:
+                await mcp_sessions.stop()
+            await jobs.stop()
+
+
+def _http_worker(sock, ready):
+    """Entry point of a worker process in multi-worker HTTP mode."""
+    if os.getenv("PROFILE_PROCESS"):
+        from profiling import profile_process
+        profile_process(allocations=os.environ["PROFILE_PROCESS"] == "alloc")
+    asyncio.run(run_as_http_server(sock=sock, ready=ready))
 
 
 async def run_cli():
@@ -273,6 +411,81 @@ async def run_cli():
     await cli_mode()
 
 
+def run_validate(args) -> int:
+    """Validate generated code in files, globs or directories; returns the exit code."""
+    from batch import find_files
+    from validation import Validator
+
+    paths = find_files(args.paths)
+    if not paths:
+        print("ERROR: No Python files match the given paths", file=sys.stderr)
+        return 2
+    started = time.perf_counter()
+    validator = Validator.from_env()
+    if args.workers:
+        validator.workers = args.workers
+    codes = [path.read_text(encoding="utf-8", errors="replace") for path in paths]
+    results = validator.validate_many(codes, [str(path) for path in paths])
+    invalid = 0
+    for path, problems in zip(paths, results):
+        if problems:
+            invalid += 1
+            for problem in problems:
+                print(f"{path}: {problem}")
+    print(
+        f"{len(paths)} files validated in {time.perf_counter() - started:.2f}s "
+        f"({validator.cached} cached): {invalid} invalid",
+        file=sys.stderr,
+    )
+    return 1 if invalid else 0
+
+
+async def run_modernize(args) -> int:
+    """Convert the files named by `args` in batch; returns the exit code."""
+    from batch import BatchRunner, plan
+    from import_graph import ImportIndex
+    from manifest import RunManifest
+    from validation import Validator
+
+    tasks = plan(args.paths, output_dir=args.output_dir, suffix=args.suffix)
+    if not tasks:
+        print("ERROR: No Python files match the given paths", file=sys.stderr)
+        return 2
+    manifest = RunManifest.from_env(args.manifest)
+    if args.dry_run:
+        for task in tasks:
+            row = manifest.get(*task.key)
+            print(f"{task.source} -> {task.output} [{row['state'] if row else 'new'}]")
+        return 0
+
+    from credentials import create_credential
+
+    endpoint = os.getenv("FOUNDRY_PROJECT_ENDPOINT")
+    model = os.getenv("FOUNDRY_MODEL_DEPLOYMENT_NAME")
+    if not endpoint or not model:
+        print(
+            "ERROR: Please set FOUNDRY_PROJECT_ENDPOINT and FOUNDRY_MODEL_DEPLOYMENT_NAME",
+            file=sys.stderr
+        )
+        return 1
+
+    async with (
+        create_credential() as credential,
+        create_agent(credential, endpoint, model) as agent,
+    ):
+        await credential.prefetch()
+        runner = BatchRunner(
+            agent,
+            manifest,
+            concurrency=args.concurrency,
+            timeout=args.timeout,
+            validator=Validator.from_env(),
+            index=ImportIndex.from_env(),
+            fresh=args.fresh,
+        )
+        return await runner.run(tasks)
+
+
 def main():
     """Main entry point with argument parsing."""
     
@@ -295,17 +508,116 @@ def main():
         default=8087,
         help="Port for HTTP server mode (default: 8087)"
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Number of HTTP worker processes sharing the port (default: AGENT_SERVER_WORKERS or 1)"
+    )
+    parser.add_argument(
+        "--import-profile",
+        action="store_true",
+        help="Report the import-time breakdown of the MCP startup path and exit"
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="cpu",
+        choices=["cpu", "alloc"],
+        help="Sample stacks (and with 'alloc' trace allocations) until exit, written to PROFILE_DIR"
+    )
+    commands = parser.add_subparsers(dest="command")
+    modernize = commands.add_parser(
+        "modernize",
+        help="Convert files, glob patterns or directories in batch"
+    )
+    modernize.add_argument("paths", nargs="+", help="Python files, glob patterns or directories")
+    modernize.add_argument(
+        "--output-dir",
+        help="Write outputs under this directory (default: next to each original)"
+    )
+    modernize.add_argument(
+        "--suffix",
+        default="_maf",
+        help="Suffix of output file names next to the originals (default: _maf)"
+    )
+    modernize.add_argument(
+        "--concurrency",
+        type=int,
+        help="Files converted at the same time (default: BATCH_CONCURRENCY or 4)"
+    )
+    modernize.add_argument(
+        "--timeout",
+        type=float,
+        help="Seconds allowed per file, 0 for no limit (default: BATCH_TIMEOUT_SECONDS or 900)"
+    )
+    modernize.add_argument(
+        "--manifest",
+        help="SQLite run manifest used to resume (default: BATCH_MANIFEST or .cache/batch.db)"
+    )
+    modernize.add_argument(
+        "--fresh",
+        action="store_true",
+        help="Convert every file again instead of resuming from the manifest"
+    )
+    modernize.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="List the files, their output paths and manifest state without converting"
+    )
+    validate = commands.add_parser(
+        "validate",
+        help="Check generated Agent Framework code in files, glob patterns or directories"
+    )
+    validate.add_argument("paths", nargs="+", help="Python files, glob patterns or directories")
+    validate.add_argument(
+        "--workers",
+        type=int,
+        help="Worker processes for the checks (default: VALIDATION_WORKERS or one per CPU)"
+    )
     
     args = parser.parse_args()
     
-    if args.cli:
+    if args.import_profile:
+        from profiling import import_profile
+        import_profile()
+        return
+    
+    # Load environment variables
+    from dotenv import load_dotenv
+    load_dotenv(override=True)
+
+    # Defaults from the environment are resolved only now, so values in .env apply
+    if args.command is None and args.workers is None:
+        args.workers = int(os.getenv("AGENT_SERVER_WORKERS", "1"))
+    if args.command == "modernize":
+        if args.concurrency is None:
+            args.concurrency = int(os.getenv("BATCH_CONCURRENCY", "4"))
+        if args.timeout is None:
+            args.timeout = float(os.getenv("BATCH_TIMEOUT_SECONDS", "900"))
+    
+    if args.profile:
+        # Workers inherit the setting and profile themselves
+        os.environ["PROFILE_PROCESS"] = args.profile
+        if args.command or args.cli or args.mcp or args.workers <= 1:
+            from profiling import profile_process
+            profile_process(allocations=args.profile == "alloc")
+    
+    if args.command == "modernize":
+        sys.exit(asyncio.run(run_modernize(args)))
+    elif args.command == "validate":
+        sys.exit(run_validate(args))
+    elif args.cli:
         asyncio.run(run_cli())
     elif args.mcp:
         asyncio.run(run_as_mcp_server())
     else:
         # Default: Run as HTTP server for AI Toolkit Agent Inspector/Supervisor
         os.environ["AGENT_SERVER_PORT"] = str(args.port)
-        asyncio.run(run_as_http_server())
+        if args.workers > 1:
+            from workers import serve_workers
+            serve_workers(_http_worker, args.workers, args.port)
+        else:
+            asyncio.run(run_as_http_server())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,132 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+"""
+Run Manifest
+
+Checkpoints of batch modernization runs in a local SQLite store, so a run
+that dies halfway (crash, throttling, redeploy) resumes instead of paying for
+every model call again.
+
+Each (source, output) pair has a row with its input hash, the artifact
+handles of its analysis and generated code, the generated code of the files
+it imports that it was generated against (``deps_key``) and its state:
+
+    pending -> analyzed -> generated -> validated      (or skipped)
+
+A rerun keeps the state of files whose input hash is unchanged and resets
+the others to pending. Workers, in one process or several sharing the
+store, claim a file atomically with a lease renewed while they work on it;
+the lease of a crashed worker expires and another worker takes the file over.
+
+Methods block; the batch runner calls them with ``asyncio.to_thread`` so
+lease renewals keep running, and a lock serializes the threads sharing the
+connection.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+FINAL_STATES = frozenset({"validated", "skipped"})
+
+# Seconds a claimed file's lease lasts without renewal
+LEASE_SECONDS = 60.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    source TEXT NOT NULL,
+    output TEXT NOT NULL,
+    input_hash TEXT NOT NULL,
+    state TEXT NOT NULL,
+    framework TEXT,
+    analysis TEXT,
+    artifact TEXT,
+    deps_key TEXT,
+    error TEXT,
+    lease_until REAL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (source, output)
+);
+"""
+
+
+class RunManifest:
+    """SQLite store of per-file checkpoints of batch runs."""
+
+    def __init__(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA busy_timeout=5000")
+        self._db.executescript(_SCHEMA)
+        columns = {row["name"] for row in self._db.execute("PRAGMA table_info(files)")}
+        if "deps_key" not in columns:
+            # Stores created before dependency tracking
+            self._db.execute("ALTER TABLE files ADD COLUMN deps_key TEXT")
+
+    @classmethod
+    def from_env(cls, path: str | None = None) -> "RunManifest":
+        default_path = Path(__file__).with_name(".cache") / "batch.db"
+        return cls(path or os.getenv("BATCH_MANIFEST", str(default_path)))
+
+    def _execute(self, sql: str, params: tuple = ()) -> list:
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def register(self, source: str, output: str, input_hash: str, fresh: bool = False) -> str:
+        """Add a file, restarting it if its input changed (or `fresh`); returns its state."""
+        now = time.time()
+        self._execute(
+            "INSERT INTO files (source, output, input_hash, state, updated_at) VALUES (?, ?, ?, 'pending', ?) "
+            "ON CONFLICT (source, output) DO UPDATE SET input_hash = excluded.input_hash, state = 'pending', "
+            "framework = NULL, analysis = NULL, artifact = NULL, deps_key = NULL, error = NULL, updated_at = excluded.updated_at "
+            "WHERE files.input_hash != excluded.input_hash OR ?",
+            (source, output, input_hash, now, fresh),
+        )
+        return self.get(source, output)["state"]
+
+    def get(self, source: str, output: str) -> dict | None:
+        rows = self._execute("SELECT * FROM files WHERE source = ? AND output = ?", (source, output))
+        return dict(rows[0]) if rows else None
+
+    def claim(self, source: str, output: str) -> dict | None:
+        """Atomically take the lease of a file; None if another live worker holds it."""
+        now = time.time()
+        rows = self._execute(
+            "UPDATE files SET lease_until = ?, updated_at = ? "
+            "WHERE source = ? AND output = ? AND (lease_until IS NULL OR lease_until < ?) "
+            "RETURNING *",
+            (now + LEASE_SECONDS, now, source, output, now),
+        )
+        return dict(rows[0]) if rows else None
+
+    def renew(self, source: str, output: str) -> None:
+        now = time.time()
+        self._execute(
+            "UPDATE files SET lease_until = ?, updated_at = ? WHERE source = ? AND output = ?",
+            (now + LEASE_SECONDS, now, source, output),
+        )
+
+    def advance(self, source: str, output: str, state: str, **fields) -> None:
+        """Checkpoint a file at `state`, with new values of framework, analysis, artifact or deps_key."""
+        columns = {
+            name: value
+            for name, value in fields.items()
+            if name in ("framework", "analysis", "artifact", "deps_key")
+        }
+        assignments = "".join(f", {name} = ?" for name in columns)
+        self._execute(
+            f"UPDATE files SET state = ?, error = NULL, updated_at = ?{assignments} WHERE source = ? AND output = ?",
+            (state, time.time(), *columns.values(), source, output),
+        )
+
+    def release(self, source: str, output: str, error: str | None = None) -> None:
+        """Give up the lease, recording the error of a failed attempt."""
+        self._execute(
+            "UPDATE files SET lease_until = NULL, error = ?, updated_at = ? WHERE source = ? AND output = ?",
+            (error, time.time(), source, output),
+        )
@@ -0,0 +1,233 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+"""
+MCP over HTTP
+
+Serves the MCP server at ``/mcp`` (streamable HTTP transport) from the HTTP
+server process. Stdio MCP starts one Python process per VS Code window, each
+with its own agent, credential and connection pool; over HTTP every client
+session shares this process's warm agent and pool instead.
+
+Each session gets its own transport and MCP session (protocol state, request
+IDs, notification stream); agent calls start a fresh thread, so nothing leaks
+between sessions. Limits:
+- MCP_HTTP_MAX_SESSIONS open sessions; new ones are refused with 503
+- MCP_HTTP_SESSION_IDLE_SECONDS without requests ends a session (the client
+  re-initializes on its next call)
+- MCP_HTTP_MAX_CALLS_PER_SESSION concurrent tool calls per session
+- agent calls go through the same admission controller as ``/runs``; a call
+  that is not admitted fails with a "server busy" tool error
+
+The endpoint is off unless MCP_HTTP_ENABLED is set. Clients must send
+MCP_HTTP_TOKEN as a bearer token; without a token configured only loopback
+clients are allowed.
+"""
+
+import asyncio
+import contextlib
+import logging
+import os
+import time
+import uuid
+
+from mcp.server.streamable_http import MCP_SESSION_ID_HEADER, StreamableHTTPServerTransport
+
+import metrics
+from admission import AdmissionController, AdmissionRejected
+from asgi_utils import bearer_authorized, client_key, get_header, send_json
+from mcp_server import LazyAgent, build_server
+
+logger = logging.getLogger("mcp_http")
+
+MCP_PATH = "/mcp"
+
+
+def _admission_guard(controller: AdmissionController):
+    """Agent guard holding an admission slot, keyed like /runs, for each agent call."""
+    client_header = os.getenv("ADMISSION_CLIENT_HEADER", "ocp-apim-subscription-key")
+
+    @contextlib.asynccontextmanager
+    async def admitted(request):
+        scope = getattr(request, "scope", None)
+        client = client_key(scope, client_header) if scope is not None else "anonymous"
+        try:
+            await controller.acquire(client)
+        except AdmissionRejected as exc:
+            raise RuntimeError(f"Server busy: {exc}. Retry after {controller.retry_after()}s") from None
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            metrics.histogram("admission.run_ms").observe((time.perf_counter() - started) * 1000)
+            controller.release(client)
+
+    return admitted
+
+
+class _Session:
+    """One client session: its transport, the task serving it and its activity."""
+
+    def __init__(self, transport: StreamableHTTPServerTransport):
+        self.transport = transport
+        self.task: asyncio.Task | None = None
+        self.last_seen = time.monotonic()
+        self.active = 0
+
+
+class MCPSessionManager:
+    """Multiplexes streamable HTTP MCP sessions over one MCP server and agent."""
+
+    def __init__(self, server, max_sessions: int = 100, idle_seconds: float = 1800.0, json_response: bool = False):
+        self.server = server
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self.json_response = json_response
+        self._sessions: dict[str, _Session] = {}
+        self._reaper: asyncio.Task | None = None
+
+    @classmethod
+    def from_env(cls, agent, admission: AdmissionController | None = None) -> "MCPSessionManager | None":
+        """Create a manager sharing `agent` from MCP_HTTP_* environment variables, or None if disabled."""
+        if os.getenv("MCP_HTTP_ENABLED", "false").lower() not in ("1", "true", "yes"):
+            return None
+
+        async def warm_agent(stack):
+            return agent
+
+        server = build_server(
+            LazyAgent(warm_agent),
+            direct_tools=os.getenv("MCP_DIRECT_TOOLS", "true").lower() not in ("0", "false", "no"),
+            max_calls_per_session=int(os.getenv("MCP_HTTP_MAX_CALLS_PER_SESSION", "4")),
+            agent_guard=_admission_guard(admission) if admission is not None else None,
+        )
+        return cls(
+            server,
+            max_sessions=int(os.getenv("MCP_HTTP_MAX_SESSIONS", "100")),
+            idle_seconds=float(os.getenv("MCP_HTTP_SESSION_IDLE_SECONDS", "1800")),
+            json_response=os.getenv("MCP_HTTP_JSON_RESPONSE", "false").lower() in ("1", "true", "yes"),
+        )
+
+    def start(self) -> None:
+        if self.idle_seconds > 0:
+            self._reaper = asyncio.create_task(self._reap_idle())
+
+    async def stop(self) -> None:
+        tasks = [session.task for session in self._sessions.values() if session.task is not None]
+        if self._reaper is not None:
+            tasks.append(self._reaper)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._sessions.clear()
+        self._reaper = None
+
+    async def _serve(self, session_id: str, session: _Session, connected: asyncio.Event) -> None:
+        try:
+            async with session.transport.connect() as (read_stream, write_stream):
+                connected.set()
+                await self.server.run(read_stream, write_stream, self.server.create_initialization_options())
+        except Exception:
+            logger.exception("MCP session %s failed", session_id)
+        finally:
+            connected.set()
+            self._sessions.pop(session_id, None)
+            metrics.gauge("mcp.sessions").set(len(self._sessions))
+
+    async def _open(self) -> tuple[str, _Session] | None:
+        """Open a new session, or return None if it could not be started."""
+        session_id = uuid.uuid4().hex
+        session = _Session(StreamableHTTPServerTransport(session_id, is_json_response_enabled=self.json_response))
+        self._sessions[session_id] = session
+        metrics.gauge("mcp.sessions").set(len(self._sessions))
+        connected = asyncio.Event()
+        session.task = asyncio.create_task(self._serve(session_id, session, connected))
+        await connected.wait()
+        if session.task.done():
+            return None
+        return session_id, session
+
+    async def _close(self, session_id: str) -> None:
+        session = self._sessions.pop(session_id, None)
+        metrics.gauge("mcp.sessions").set(len(self._sessions))
+        if session is None:
+            return
+        with contextlib.suppress(Exception):
+            await session.transport.terminate()
+        if session.task is not None:
+            session.task.cancel()
+
+    async def _reap_idle(self) -> None:
+        while True:
+            await asyncio.sleep(min(self.idle_seconds / 4, 60.0))
+            cutoff = time.monotonic() - self.idle_seconds
+            for session_id, session in list(self._sessions.items()):
+                # An open notification stream counts as activity
+                if session.active == 0 and session.last_seen < cutoff:
+                    metrics.counter("mcp.sessions_expired").inc()
+                    await self._close(session_id)
+
+    async def handle(self, scope, receive, send) -> None:
+        session_id = get_header(scope, MCP_SESSION_ID_HEADER)
+        created = False
+        if session_id:
+            session = self._sessions.get(session_id)
+            if session is None:
+                await send_json(send, 404, {"code": "not_found", "message": "Unknown or expired MCP session"})
+                return
+        elif scope.get("method") != "POST":
+            await send_json(send, 400, {"code": "invalid_request_error", "message": "Missing mcp-session-id header"})
+            return
+        elif len(self._sessions) >= self.max_sessions:
+            metrics.counter("mcp.sessions_rejected").inc()
+            await send_json(
+                send,
+                503,
+                {"code": "too_many_sessions", "message": f"MCP session limit ({self.max_sessions}) reached"},
+                headers={"retry-after": "30"},
+            )
+            return
+        else:
+            opened = await self._open()
+            if opened is None:
+                await send_json(send, 500, {"code": "server_error", "message": "Could not start the MCP session"})
+                return
+            session_id, session = opened
+            created = True
+            metrics.counter("mcp.sessions_opened").inc()
+
+        response = {}
+
+        async def tracked_send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+            await send(message)
+
+        session.active += 1
+        session.last_seen = time.monotonic()
+        try:
+            await session.transport.handle_request(scope, receive, tracked_send)
+        finally:
+            session.active -= 1
+            session.last_seen = time.monotonic()
+        if session.transport.is_terminated or (created and response.get("status", 500) >= 400):
+            # Closed by the client (DELETE), or a first request that was not a valid initialize
+            await self._close(session_id)
+
+
+class MCPHttpMiddleware:
+    """Raw ASGI middleware serving MCP sessions at /mcp to authorized clients."""
+
+    def __init__(self, app, manager: MCPSessionManager):
+        self.app = app
+        self.manager = manager
+        self.token = os.getenv("MCP_HTTP_TOKEN", "")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("path", "").rstrip("/") != MCP_PATH:
+            await self.app(scope, receive, send)
+            return
+        if not bearer_authorized(scope, self.token):
+            metrics.counter("mcp.unauthorized").inc()
+            await send_json(send, 401, {"code": "unauthorized", "message": "MCP over HTTP is not allowed for this client"})
+            return
+        await self.manager.handle(scope, receive, send)
@@ -0,0 +1,199 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+"""
+MCP Server
+
+Lightweight MCP server for GitHub Copilot. The handshake (``initialize`` and
+``tools/list``) is answered from static metadata, so it completes before the
+agent framework and Azure identity are imported. The credential and agent are
+created in the background once the client lists the tools, and the first call
+of the agent tool waits for them.
+
+Next to the agent, the deterministic tools of ``tools.py`` are exposed as
+direct MCP tools (MCP_DIRECT_TOOLS): they run locally through the tool engine
+in milliseconds, without a model round trip. The agent tool stays available
+for full conversions.
+"""
+
+import asyncio
+import contextlib
+import logging
+
+import mcp.types as types
+from mcp.server.lowlevel import Server
+
+logger = logging.getLogger("mcp_server")
+
+AGENT_TOOL_NAME = "CodeModernizer"
+AGENT_TOOL_DESCRIPTION = (
+    "Modernize AI agent code written with Semantic Kernel or AutoGen to Microsoft "
+    "Agent Framework. Send the source code and what you need (analysis, migration "
+    "guide or complete modernized code)."
+)
+
+_CODE_DESCRIPTION = "The source code, or an uploaded 'code_ref=sha256:...'."
+_FRAMEWORK_SCHEMA = {
+    "type": "string",
+    "enum": ["semantic_kernel", "autogen"],
+    "description": "The source framework.",
+}
+
+# Metadata of the direct tools, kept static (mirroring the Annotated signatures
+# in tools.py) so tools/list does not import them
+DIRECT_TOOLS = {
+    "analyze_code_patterns": (
+        "Detect the framework (Semantic Kernel or AutoGen) and the agent patterns used in the "
+        "code, with modernization notes. Runs locally, no model call.",
+        {"code": {"type": "string", "description": _CODE_DESCRIPTION}},
+        ["code"],
+    ),
+    "generate_modernized_code": (
+        "Generate the Agent Framework skeleton for Semantic Kernel or AutoGen code. Runs "
+        "locally, no model call; use the CodeModernizer tool for a complete conversion.",
+        {"original_code": {"type": "string", "description": _CODE_DESCRIPTION}, "framework": _FRAMEWORK_SCHEMA},
+        ["original_code", "framework"],
+    ),
+    "get_migration_guide": (
+        "Get the migration guide from Semantic Kernel or AutoGen to Agent Framework. Runs "
+        "locally, no model call.",
+        {"source_framework": _FRAMEWORK_SCHEMA},
+        ["source_framework"],
+    ),
+    "fetch_artifact": (
+        "Read a slice of a large tool output returned as an artifact handle ('sha256:...').",
+        {
+            "handle": {"type": "string", "description": "Artifact handle returned by another tool."},
+            "range": {"type": "string", "description": "1-based inclusive line range such as '1-80'."},
+        },
+        ["handle"],
+    ),
+}
+
+
+def _load_direct_tool(name: str):
+    """Import the tool engine and tools (slow the first time) and return (run_tool, tool)."""
+    import tool_engine
+    import tools
+
+    return tool_engine.run_tool, getattr(tools, name)
+
+
+class LazyAgent:
+    """Creates the agent in the background and hands it to callers once ready.
+
+    `factory` is an async callable that receives an AsyncExitStack, enters the
+    credential and agent context managers on it and returns the agent. If it
+    fails, the next call tries again.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._stack = contextlib.AsyncExitStack()
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        """Start creating the agent in the background (idempotent)."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._create())
+
+    async def _create(self):
+        try:
+            return await self._factory(self._stack)
+        except BaseException:
+            # Forget the failed attempt (e.g. a transient credential error) so the
+            # next call retries, closing whatever it had already entered
+            stack, self._stack = self._stack, contextlib.AsyncExitStack()
+            self._task = None
+            await stack.aclose()
+            raise
+
+    async def get(self):
+        """Return the agent, creating it first if needed."""
+        self.start()
+        return await asyncio.shield(self._task)
+
+    async def aclose(self) -> None:
+        """Close the agent and credential if they were created."""
+        if self._task is not None:
+            if not self._task.done():
+                self._task.cancel()
+            with contextlib.suppress(BaseException):
+                await self._task
+        await self._stack.aclose()
+
+
+def build_server(
+    lazy_agent: LazyAgent,
+    direct_tools: bool = True,
+    max_calls_per_session: int = 0,
+    agent_guard=None,
+) -> Server:
+    """Build the MCP server exposing the agent, and optionally the direct tools, as tools.
+
+    With `max_calls_per_session`, a session with that many tool calls in
+    flight gets an error for the next one instead of queueing it.
+    `agent_guard`, called with the transport's request (None over stdio),
+    returns an async context manager entered around each agent call, such as
+    admission control.
+    """
+    server = Server(AGENT_TOOL_NAME)
+    direct = DIRECT_TOOLS if direct_tools else {}
+    # Tool calls in flight per client session (keyed by id() of the ServerSession)
+    in_flight: dict[int, int] = {}
+
+    @server.list_tools()
+    async def list_tools() -> list[types.Tool]:
+        # The client lists tools right after the handshake: start warming up
+        lazy_agent.start()
+        return [
+            types.Tool(
+                name=AGENT_TOOL_NAME,
+                description=AGENT_TOOL_DESCRIPTION,
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "task": {
+                            "type": "string",
+                            "description": "The modernization request, including the source code.",
+                        },
+                    },
+                    "required": ["task"],
+                },
+            )
+        ] + [
+            types.Tool(
+                name=name,
+                description=description,
+                inputSchema={"type": "object", "properties": properties, "required": required},
+            )
+            for name, (description, properties, required) in direct.items()
+        ]
+
+    async def run_tool_call(name: str, arguments: dict, request) -> list[types.TextContent]:
+        if name in direct:
+            # Imported off the event loop, which keeps serving while the agent warms up
+            run_tool, tool = await asyncio.to_thread(_load_direct_tool, name)
+            text = await run_tool(tool, **(arguments or {}))
+            return [types.TextContent(type="text", text=text)]
+        if name != AGENT_TOOL_NAME:
+            raise ValueError(f"Unknown tool: {name}")
+        async with agent_guard(request) if agent_guard is not None else contextlib.nullcontext():
+            agent = await lazy_agent.get()
+            response = await agent.run(arguments.get("task", ""))
+        return [types.TextContent(type="text", text=response.text)]
+
+    @server.call_tool()
+    async def call_tool(name: str, arguments: dict) -> list[types.TextContent]:
+        context = server.request_context
+        session = id(context.session)
+        if max_calls_per_session and in_flight.get(session, 0) >= max_calls_per_session:
+            raise RuntimeError(f"Too many concurrent tool calls in this session (limit {max_calls_per_session})")
+        in_flight[session] = in_flight.get(session, 0) + 1
+        try:
+            return await run_tool_call(name, arguments, context.request)
+        finally:
+            in_flight[session] -= 1
+            if not in_flight[session]:
+                del in_flight[session]
+
+    return server
@@ -0,0 +1,134 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+"""
+Metrics
+
+Minimal in-process metrics registry (counters, gauges and latency histograms).
+The HTTP server exposes a JSON snapshot at ``GET /metrics``; in multi-worker
+mode each worker reports its own values.
+"""
+
+import threading
+from collections import deque
+
+from asgi_utils import send_json
+
+# Histograms keep the most recent observations to compute percentiles
+_RESERVOIR_SIZE = 2048
+
+
+class Counter:
+    """Monotonically increasing value."""
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def snapshot(self) -> float:
+        return self.value
+
+
+class Gauge:
+    """Value that can go up and down."""
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.inc(-amount)
+
+    def snapshot(self) -> float:
+        return self.value
+
+
+class Histogram:
+    """Distribution of observed values with percentiles over a bounded reservoir."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self._values: deque[float] = deque(maxlen=_RESERVOIR_SIZE)
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self.count += 1
+            self.total += value
+            self._values.append(value)
+
+    def percentile(self, pct: float) -> float | None:
+        """Nearest-rank percentile of the recent observations, or None when empty."""
+        with self._lock:
+            ordered = sorted(self._values)
+        if not ordered:
+            return None
+        index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+        return ordered[index]
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": round(self.total, 3),
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+        }
+
+
+_registry: dict[str, Counter | Gauge | Histogram] = {}
+_registry_lock = threading.Lock()
+
+
+def _get(name: str, kind: type):
+    metric = _registry.get(name)
+    if metric is None:
+        with _registry_lock:
+            metric = _registry.setdefault(name, kind())
+    if not isinstance(metric, kind):
+        raise TypeError(f"Metric {name!r} is a {type(metric).__name__}, not a {kind.__name__}")
+    return metric
+
+
+def counter(name: str) -> Counter:
+    """Get or create a counter."""
+    return _get(name, Counter)
+
+
+def gauge(name: str) -> Gauge:
+    """Get or create a gauge."""
+    return _get(name, Gauge)
+
+
+def histogram(name: str) -> Histogram:
+    """Get or create a histogram."""
+    return _get(name, Histogram)
+
+
+def snapshot() -> dict:
+    """Return the current value of every metric."""
+    return {name: metric.snapshot() for name, metric in sorted(_registry.items())}
+
+
+class MetricsMiddleware:
+    """Raw ASGI middleware serving ``GET /metrics`` with a JSON snapshot of the registry."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope.get("method") == "GET" and scope.get("path") == "/metrics":
+            await send_json(send, 200, snapshot())
+            return
+        await self.app(scope, receive, send)
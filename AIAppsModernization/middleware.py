@@ -0,0 +1,58 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+"""
+Agent Middleware
+
+Builds the agent-framework middleware pipeline shared by every mode (HTTP,
+MCP and CLI). Each stage is enabled through its own environment variables.
+"""
+
+from compaction import CompactionPolicy, ThreadCompactionMiddleware
+from resilience import ResilienceMiddleware, ResiliencePolicy
+from response_cache import ResponseCache, ResponseCacheMiddleware
+from streaming import StreamCoalescingMiddleware
+from token_budget import TokenBudget, TokenBudgetMiddleware
+from tool_engine import ToolPhaseMiddleware
+from tracing import TracingAgentMiddleware, TracingChatMiddleware, setup_tracing
+
+
+def build_middleware(instructions: str) -> list:
+    """Create the middleware list for an agent with the given instructions."""
+    middleware = []
+    tracing = setup_tracing()
+
+    # The run span covers every other stage, cached replays included
+    if tracing:
+        middleware.append(TracingAgentMiddleware())
+
+    # Outermost of the remaining stages, so cached replays and live streams are coalesced alike
+    coalescing = StreamCoalescingMiddleware.from_env()
+    if coalescing is not None:
+        middleware.append(coalescing)
+
+    cache = ResponseCache.from_env(instructions)
+    if cache is not None:
+        middleware.append(ResponseCacheMiddleware(cache))
+
+    # Records the latency of each run's tool phases (cached replays call no tools)
+    middleware.append(ToolPhaseMiddleware())
+
+    # Compact first so retries and the budget see the prompt actually sent
+    compaction = CompactionPolicy.from_env()
+    if compaction is not None:
+        middleware.append(ThreadCompactionMiddleware(compaction))
+
+    # Resilience wraps the budget so every retry or hedge reserves its own tokens
+    policy = ResiliencePolicy.from_env()
+    if policy is not None:
+        middleware.append(ResilienceMiddleware(policy))
+
+    budget = TokenBudget.from_env()
+    if budget is not None:
+        middleware.append(TokenBudgetMiddleware(budget))
+
+    # Innermost, so every retry and hedge gets its own model-call span
+    if tracing:
+        middleware.append(TracingChatMiddleware())
+
+    return middleware
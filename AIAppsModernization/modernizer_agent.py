@@ -10,17 +10,21 @@ This agent exposes the following tools:
 - analyze_code_patterns: Analyze source code to identify AI agent patterns
 - generate_modernized_code: Generate modernized Agent Framework code
 - get_migration_guide: Get comprehensive migration documentation
+- fetch_artifact: Read slices of large tool outputs stored as artifacts
 """
 
 import asyncio
 import os
 from dotenv import load_dotenv
-from azure.identity.aio import DefaultAzureCredential
 
 from agent_framework.azure import AzureAIClient
 
+from credentials import create_credential
+from middleware import build_middleware
+from tool_engine import async_tools
 from tools import (
     analyze_code_patterns,
+    fetch_artifact,
     generate_modernized_code,
     get_migration_guide,
 )
@@ -44,6 +48,12 @@ You have access to the following tools:
 3. **get_migration_guide**: Use this to provide comprehensive migration documentation for 
    either Semantic Kernel or AutoGen to Agent Framework.
 
+4. **fetch_artifact**: Large tool outputs are returned as an artifact handle with an outline.
+   Use this to read the lines you need from an artifact.
+
+Uploaded files are referenced as code_ref=sha256:...; pass the reference unchanged as the code
+argument of the tools, and read the code itself with fetch_artifact.
+
 When helping developers:
 1. First, analyze their code to understand what they're working with
 2. Explain what patterns you've identified and what changes are needed
@@ -83,11 +93,13 @@ def create_modernizer_agent(credential):
     ).create_agent(
         name="CodeModernizer",
         instructions=AGENT_INSTRUCTIONS,
-        tools=[
+        tools=async_tools([
             analyze_code_patterns,
             generate_modernized_code,
             get_migration_guide,
-        ],
+            fetch_artifact,
+        ]),
+        middleware=build_middleware(AGENT_INSTRUCTIONS),
     )
 
 
@@ -101,9 +113,10 @@ async def run_cli():
     print()
     
     async with (
-        DefaultAzureCredential() as credential,
+        create_credential() as credential,
         create_modernizer_agent(credential) as agent,
     ):
+        await credential.prefetch()
         thread = agent.get_new_thread()
         
         print("Ready! Paste your code or ask for migration help.")
@@ -0,0 +1,383 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+"""
+Profiling Diagnostics
+
+Helpers to understand where the server spends its time:
+- import_profile: import-time breakdown of each startup stage (``--import-profile``)
+- Profiler: sampled stacks of every thread (event loop, middleware and the
+  tool threads) in folded format, one ``frame;frame;... count`` line per
+  stack, ready for flamegraph.pl or speedscope, and on request ``tracemalloc``
+  allocation snapshots (tracing allocations slows allocation-heavy code
+  several times over, sampling barely registers). Nothing samples or traces
+  while no profile is taken.
+- ProfilingMiddleware: guarded ``GET /debug/profile?seconds=N`` and
+  per-request profiles opted into with the ``x-profile`` header, of which the
+  newest PROFILE_MAX_REQUESTS are kept in PROFILE_DIR
+- profile_process: profile the whole process until it exits (``--profile``)
+
+Tool calls routed to worker processes show up as the thread waiting for the
+worker; their own stacks are not sampled.
+"""
+
+import asyncio
+import atexit
+import hmac
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from contextvars import ContextVar
+from pathlib import Path
+from urllib.parse import parse_qs
+
+from asgi_utils import get_header, send_bytes, send_json
+
+# Modules imported before the MCP handshake, and the ones deferred until after it
+HANDSHAKE_MODULES = ["dotenv", "mcp.types", "mcp.server.lowlevel", "mcp.server.stdio", "mcp_server"]
+DEFERRED_MODULES = ["azure.identity.aio", "agent_framework.azure", "credentials", "middleware", "tool_engine", "tools"]
+
+
+def _measure_imports(modules: list[str]) -> list[tuple[str, int]]:
+    """Import `modules` in a fresh interpreter and return (module, cumulative µs) per top-level import."""
+    code = "\n".join(f"import {module}" for module in modules)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+    )
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|", 2)
+        if not cumulative.strip().isdigit():
+            continue  # Header line
+        # Top-level imports are the ones without nesting indentation
+        if not name.startswith("  ") and name.startswith(" "):
+            entries.append((name.strip(), int(cumulative)))
+    if result.returncode != 0:
+        print(result.stderr.strip().splitlines()[-1], file=sys.stderr)
+    return entries
+
+
+def import_profile(top: int = 15) -> None:
+    """Print the import-time breakdown of the handshake and deferred startup stages."""
+    handshake = _measure_imports(HANDSHAKE_MODULES)
+    full = dict(_measure_imports(HANDSHAKE_MODULES + DEFERRED_MODULES))
+    already_loaded = {name for name, _ in handshake}
+    deferred = [(name, us) for name, us in full.items() if name not in already_loaded]
+
+    for title, entries in (("Before MCP handshake", handshake), ("Deferred (first tool call)", deferred)):
+        total_ms = sum(us for _, us in entries) / 1000
+        print(f"\n{title}: {total_ms:.0f} ms")
+        for name, us in sorted(entries, key=lambda entry: entry[1], reverse=True)[:top]:
+            print(f"  {us / 1000:8.1f} ms  {name}")
+
+
+# Leaf frames of threads that are waiting rather than running
+_IDLE_LEAVES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+}
+# Allocation sites listed in a report
+_ALLOC_TOP = 30
+_PROFILE_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+# The profile session of the request a task belongs to
+_request_session: ContextVar["ProfileSession | None"] = ContextVar("profile_session", default=None)
+
+
+def _fold(frame, thread_name: str) -> str | None:
+    """Fold a thread's stack into ``thread;outer;...;leaf``, or None if the thread is idle."""
+    code = frame.f_code
+    if (os.path.basename(code.co_filename), code.co_name) in _IDLE_LEAVES:
+        return None
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    names.append(thread_name)
+    return ";".join(reversed(names))
+
+
+class ProfileSession:
+    """Stack samples and allocation statistics collected by one profile."""
+
+    def __init__(self, request_only: bool = False, allocations: bool = False, baseline=None):
+        self.id = uuid.uuid4().hex
+        self.request_only = request_only
+        self.allocations = allocations
+        self.stacks: Counter[str] = Counter()
+        self.started = time.perf_counter()
+        self.duration = 0.0
+        self._baseline = baseline
+        self._allocations = None
+
+    def finish(self, snapshot) -> None:
+        self.duration = time.perf_counter() - self.started
+        if snapshot is None:
+            return
+        snapshot = snapshot.filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ])
+        if self._baseline is not None:
+            self._allocations = snapshot.compare_to(self._baseline, "lineno")
+        else:
+            self._allocations = snapshot.statistics("lineno")
+        self._baseline = None
+
+    def folded(self) -> str:
+        """Stack samples in folded (flamegraph) format."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def allocation_report(self) -> str:
+        """Largest live allocation sites created while the profile ran."""
+        if not self.allocations:
+            return "Allocation tracing was not requested for this profile.\n"
+        if not self._allocations:
+            return "No allocations traced.\n"
+        lines = [f"Top {_ALLOC_TOP} allocation sites over {self.duration:.1f}s:"]
+        lines.extend(str(stat) for stat in self._allocations[:_ALLOC_TOP])
+        return "\n".join(lines) + "\n"
+
+    def write(self, directory: Path, name: str | None = None) -> list[Path]:
+        """Write the folded stacks and the allocation report; returns their paths."""
+        directory.mkdir(parents=True, exist_ok=True)
+        name = name or self.id
+        paths = [directory / f"{name}.folded", directory / f"{name}.alloc.txt"]
+        paths[0].write_text(self.folded(), encoding="utf-8")
+        paths[1].write_text(self.allocation_report(), encoding="utf-8")
+        return paths
+
+
+class Profiler:
+    """Shares one sampling thread and tracemalloc between all active profile sessions."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self._sessions: list[ProfileSession] = []
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._owns_tracemalloc = False
+        self._loop = None
+        self._loop_thread: int | None = None
+
+    def bind_loop(self) -> None:
+        """Record the running event loop, whose samples are attributed to requests."""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+
+    def start(self, request_only: bool = False, allocations: bool = False) -> ProfileSession:
+        with self._lock:
+            baseline = None
+            if allocations:
+                if tracemalloc.is_tracing():
+                    baseline = tracemalloc.take_snapshot()
+                else:
+                    tracemalloc.start()
+                    self._owns_tracemalloc = True
+            session = ProfileSession(request_only, allocations, baseline)
+            self._sessions.append(session)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._sample, name="profiler", daemon=True)
+                self._thread.start()
+        return session
+
+    def stop(self, session: ProfileSession) -> ProfileSession:
+        snapshot = tracemalloc.take_snapshot() if session.allocations and tracemalloc.is_tracing() else None
+        with self._lock:
+            self._sessions.remove(session)
+            if self._owns_tracemalloc and not any(other.allocations for other in self._sessions):
+                tracemalloc.stop()
+                self._owns_tracemalloc = False
+        session.finish(snapshot)
+        return session
+
+    def _sample(self) -> None:
+        own = threading.get_ident()
+        while True:
+            with self._lock:
+                sessions = list(self._sessions)
+                if not sessions:
+                    self._thread = None
+                    return
+            self._collect(sessions, own)
+            time.sleep(self.interval)
+
+    def _collect(self, sessions: list[ProfileSession], own: int) -> None:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        request = None
+        if self._loop is not None and any(session.request_only for session in sessions):
+            task = asyncio.current_task(self._loop)
+            request = task.get_context().get(_request_session) if task is not None else None
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            stack = _fold(frame, names.get(ident, str(ident)))
+            if stack is None:
+                continue
+            for session in sessions:
+                # The loop runs every request; its samples count only for the one running
+                if session.request_only and ident == self._loop_thread and session is not request:
+                    continue
+                session.stacks[stack] += 1
+
+
+_profiler: Profiler | None = None
+
+
+def get_profiler() -> Profiler:
+    global _profiler
+    if _profiler is None:
+        _profiler = Profiler(interval=float(os.getenv("PROFILE_INTERVAL_MS", "10")) / 1000)
+    return _profiler
+
+
+def _profile_dir() -> Path:
+    return Path(os.getenv("PROFILE_DIR", str(Path(__file__).with_name(".cache") / "profiles")))
+
+
+def _prune_request_profiles(directory: Path, keep: int) -> int:
+    """Delete all but the newest `keep` request profiles; returns how many were deleted."""
+    profiles = {}
+    for path in directory.glob("*.folded"):
+        if _PROFILE_ID_PATTERN.match(path.stem):
+            try:
+                profiles[path.stem] = path.stat().st_mtime
+            except FileNotFoundError:
+                pass
+    stale = sorted(profiles, key=profiles.get, reverse=True)[keep:]
+    for profile_id in stale:
+        for suffix in (".folded", ".alloc.txt"):
+            (directory / f"{profile_id}{suffix}").unlink(missing_ok=True)
+    return len(stale)
+
+
+def profiling_enabled() -> bool:
+    return os.getenv("PROFILING_ENABLED", "false").lower() in ("1", "true", "yes")
+
+
+def profile_process(allocations: bool = False) -> None:
+    """Profile the whole process and write the results to PROFILE_DIR when it exits."""
+    session = get_profiler().start(allocations=allocations)
+
+    def write() -> None:
+        paths = get_profiler().stop(session).write(_profile_dir(), f"process-{os.getpid()}")
+        print(f"Profile written to {', '.join(str(path) for path in paths)}", file=sys.stderr)
+
+    atexit.register(write)
+
+
+class ProfilingMiddleware:
+    """Raw ASGI middleware serving profiles on demand.
+
+    - ``GET /debug/profile?seconds=N[&kind=alloc]`` profiles the process for N
+      seconds and returns the folded stacks (or the allocation report)
+    - a request with ``x-profile: 1`` (``x-profile: alloc`` to trace
+      allocations too) is profiled on its own; the response carries
+      ``x-profile-id`` and ``GET /debug/profile/{id}[?kind=alloc]`` returns
+      the result
+
+    Callers must send PROFILING_TOKEN in ``x-profile-token``; without a token
+    configured only loopback clients are allowed.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.token = os.getenv("PROFILING_TOKEN", "")
+        self.max_seconds = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+        self.max_requests = int(os.getenv("PROFILE_MAX_REQUESTS", "100"))
+        self.directory = _profile_dir()
+        self.profiler = get_profiler()
+
+    def _authorized(self, scope) -> bool:
+        if self.token:
+            return hmac.compare_digest(get_header(scope, "x-profile-token") or "", self.token)
+        client = scope.get("client")
+        return client is not None and client[0] in ("127.0.0.1", "::1")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        path = scope.get("path", "")
+        if path == "/debug/profile" or path.startswith("/debug/profile/"):
+            if scope.get("method") != "GET":
+                await send_json(send, 405, {"error": "Method not allowed"})
+            elif not self._authorized(scope):
+                await send_json(send, 403, {"error": "Profiling is not allowed for this client"})
+            elif path == "/debug/profile":
+                await self._profile_window(scope, send)
+            else:
+                await self._serve_result(scope, send, path[len("/debug/profile/"):])
+            return
+        mode = get_header(scope, "x-profile")
+        if mode in ("1", "true", "alloc") and self._authorized(scope):
+            await self._profile_request(scope, receive, send, allocations=mode == "alloc")
+            return
+        await self.app(scope, receive, send)
+
+    async def _profile_window(self, scope, send) -> None:
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        try:
+            seconds = float(query.get("seconds", ["10"])[0])
+        except ValueError:
+            seconds = -1
+        if not 0 < seconds <= self.max_seconds:
+            await send_json(send, 400, {"error": f"seconds must be between 0 and {self.max_seconds:g}"})
+            return
+        allocations = query.get("kind") == ["alloc"]
+        self.profiler.bind_loop()
+        session = self.profiler.start(allocations=allocations)
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            self.profiler.stop(session)
+        body = session.allocation_report() if allocations else session.folded()
+        await send_bytes(send, 200, body.encode("utf-8"), "text/plain; charset=utf-8")
+
+    async def _serve_result(self, scope, send, profile_id: str) -> None:
+        if not _PROFILE_ID_PATTERN.match(profile_id):
+            await send_json(send, 404, {"error": "Unknown profile"})
+            return
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        suffix = ".alloc.txt" if query.get("kind") == ["alloc"] else ".folded"
+        try:
+            body = (self.directory / f"{profile_id}{suffix}").read_bytes()
+        except FileNotFoundError:
+            await send_json(send, 404, {"error": "Unknown profile"})
+            return
+        await send_bytes(send, 200, body, "text/plain; charset=utf-8")
+
+    async def _profile_request(self, scope, receive, send, allocations: bool) -> None:
+        self.profiler.bind_loop()
+        session = self.profiler.start(request_only=True, allocations=allocations)
+        token = _request_session.set(session)
+
+        async def profiled_send(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers") or [])
+                headers.append((b"x-profile-id", session.id.encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, profiled_send)
+        finally:
+            _request_session.reset(token)
+            await asyncio.to_thread(self._save, self.profiler.stop(session))
+
+    def _save(self, session: ProfileSession) -> None:
+        session.write(self.directory)
+        # Every profiled request adds files: keep only the newest ones
+        _prune_request_profiles(self.directory, self.max_requests)
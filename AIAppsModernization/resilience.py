@@ -0,0 +1,276 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+"""
+Model Call Resilience
+
+Resilience layer around the agent's model round trips:
+- jittered exponential retry of transient failures for non-streamed calls
+- optional hedging: a duplicate request is sent when the first one is slower
+  than the recent p95 latency, and the first answer wins
+- a circuit breaker that fails fast while the backend is unhealthy; only
+  transient errors count toward it, since a 4xx (content filter, context
+  length, bad request) says nothing about the backend's health
+- a per-attempt timeout so a stalled call does not hang the run, and for
+  streamed calls a first-update and idle timeout; a stream is retried while
+  it has not yielded any update yet
+
+``call_with_resilience`` does not depend on the agent framework and can be
+exercised against the fault-injecting backend in ``fake_backend.py``.
+"""
+
+import asyncio
+import copy
+import os
+import random
+import time
+
+from agent_framework import ChatContext, ChatMiddleware
+
+import metrics
+
+_TRANSIENT_STATUS = frozenset({408, 409, 429, 500, 502, 503, 504})
+_CIRCUIT_STATES = {"closed": 0, "open": 1, "half_open": 2}
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the backend while the circuit breaker is open."""
+
+
+def is_transient(exc: BaseException) -> bool:
+    """Return True for timeouts, connection errors and retryable HTTP statuses."""
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        if isinstance(exc, (asyncio.TimeoutError, ConnectionError)):
+            return True
+        status = getattr(exc, "status_code", None) or getattr(getattr(exc, "response", None), "status_code", None)
+        if status in _TRANSIENT_STATUS:
+            return True
+        name = type(exc).__name__
+        if "Timeout" in name or "Connection" in name or "RateLimit" in name:
+            return True
+        exc = exc.__cause__ or exc.__context__
+    return False
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures and lets one probe through after a cool-down."""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        # While half open, until when the probe in flight blocks other calls
+        self._probe_until = 0.0
+
+    def _set_state(self, state: str) -> None:
+        self.state = state
+        metrics.gauge("resilience.circuit_state").set(_CIRCUIT_STATES[state])
+
+    def before_call(self) -> None:
+        """Raise CircuitOpenError if calls are currently not allowed."""
+        now = time.monotonic()
+        if self.state == "open" and now - self._opened_at >= self.reset_timeout:
+            self._set_state("half_open")
+            self._probe_until = 0.0
+        # A probe that never reported back (e.g. cancelled) stops blocking after reset_timeout
+        if self.state == "open" or (self.state == "half_open" and now < self._probe_until):
+            metrics.counter("resilience.circuit_rejections").inc()
+            raise CircuitOpenError("Model backend circuit is open")
+        if self.state == "half_open":
+            self._probe_until = now + self.reset_timeout
+
+    def record_success(self) -> None:
+        self._failures = 0
+        self._probe_until = 0.0
+        if self.state != "closed":
+            self._set_state("closed")
+
+    def record_error(self, exc: BaseException) -> None:
+        """Record a failed call: transient errors are failures, any other error means the backend answered."""
+        if is_transient(exc):
+            self.record_failure()
+        else:
+            self.record_success()
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        self._probe_until = 0.0
+        if self.state == "half_open" or self._failures >= self.failure_threshold:
+            if self.state != "open":
+                metrics.counter("resilience.circuit_trips").inc()
+            self._opened_at = time.monotonic()
+            self._set_state("open")
+
+
+class ResiliencePolicy:
+    """Retry, hedging, timeout and circuit breaker settings."""
+
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        base_delay: float = 0.5,
+        max_delay: float = 8.0,
+        attempt_timeout: float = 120.0,
+        first_update_timeout: float = 60.0,
+        stream_idle_timeout: float = 60.0,
+        hedge: bool = False,
+        hedge_min_delay: float = 2.0,
+        breaker: CircuitBreaker | None = None,
+    ):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.attempt_timeout = attempt_timeout
+        self.first_update_timeout = first_update_timeout
+        self.stream_idle_timeout = stream_idle_timeout
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.breaker = breaker or CircuitBreaker()
+
+    @classmethod
+    def from_env(cls) -> "ResiliencePolicy | None":
+        """Create a policy from RESILIENCE_* environment variables, or None if disabled."""
+        if os.getenv("RESILIENCE_ENABLED", "true").lower() in ("0", "false", "no"):
+            return None
+        return cls(
+            max_attempts=int(os.getenv("RESILIENCE_MAX_ATTEMPTS", "3")),
+            base_delay=float(os.getenv("RESILIENCE_BASE_DELAY", "0.5")),
+            max_delay=float(os.getenv("RESILIENCE_MAX_DELAY", "8")),
+            attempt_timeout=float(os.getenv("RESILIENCE_ATTEMPT_TIMEOUT", "120")),
+            first_update_timeout=float(os.getenv("RESILIENCE_FIRST_UPDATE_TIMEOUT", "60")),
+            stream_idle_timeout=float(os.getenv("RESILIENCE_STREAM_IDLE_TIMEOUT", "60")),
+            hedge=os.getenv("RESILIENCE_HEDGE", "false").lower() in ("1", "true", "yes"),
+            hedge_min_delay=float(os.getenv("RESILIENCE_HEDGE_MIN_DELAY", "2")),
+            breaker=CircuitBreaker(
+                failure_threshold=int(os.getenv("RESILIENCE_BREAKER_FAILURES", "5")),
+                reset_timeout=float(os.getenv("RESILIENCE_BREAKER_RESET", "30")),
+            ),
+        )
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff before retry number `attempt` (1-based)."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def hedge_delay(self) -> float:
+        """Delay before sending a hedged duplicate: the recent p95 latency."""
+        p95_ms = metrics.histogram("resilience.call_ms").percentile(95)
+        return max(self.hedge_min_delay, (p95_ms or 0.0) / 1000)
+
+
+async def _attempt(call, policy: ResiliencePolicy):
+    """One attempt, hedged with a duplicate call when enabled."""
+    first = asyncio.ensure_future(asyncio.wait_for(call(), policy.attempt_timeout))
+    if not policy.hedge:
+        return await first
+
+    done, _ = await asyncio.wait({first}, timeout=policy.hedge_delay())
+    if done:
+        return first.result()
+
+    metrics.counter("resilience.hedges").inc()
+    second = asyncio.ensure_future(asyncio.wait_for(call(), policy.attempt_timeout))
+    pending = {first, second}
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is second:
+                        metrics.counter("resilience.hedge_wins").inc()
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def call_with_resilience(call, policy: ResiliencePolicy):
+    """Await `call()` with retries, hedging, timeout and circuit breaking."""
+    for attempt in range(1, policy.max_attempts + 1):
+        policy.breaker.before_call()
+        metrics.counter("resilience.attempts").inc()
+        started = time.perf_counter()
+        try:
+            result = await _attempt(call, policy)
+        except Exception as exc:
+            policy.breaker.record_error(exc)
+            metrics.counter("resilience.failures").inc()
+            if attempt == policy.max_attempts or not is_transient(exc):
+                raise
+            metrics.counter("resilience.retries").inc()
+            await asyncio.sleep(policy.backoff(attempt))
+            continue
+        policy.breaker.record_success()
+        metrics.histogram("resilience.call_ms").observe((time.perf_counter() - started) * 1000)
+        return result
+
+
+class ResilienceMiddleware(ChatMiddleware):
+    """Chat middleware applying a ResiliencePolicy to every model round trip.
+
+    Streamed calls are not hedged, and are retried only until their first
+    update: a partially consumed stream cannot be retried transparently. Each
+    update must arrive within the first-update or idle timeout, and the
+    outcome is recorded when the stream ends.
+    """
+
+    def __init__(self, policy: ResiliencePolicy):
+        self.policy = policy
+
+    async def process(self, context: ChatContext, next) -> None:
+        if context.is_streaming:
+            context.result = self._resilient_stream(context, next)
+            return
+
+        async def call():
+            # Each attempt (and hedge) runs on its own copy of the context
+            attempt_context = copy.copy(context)
+            await next(attempt_context)
+            return attempt_context.result
+
+        context.result = await call_with_resilience(call, self.policy)
+
+    async def _resilient_stream(self, context: ChatContext, next):
+        policy = self.policy
+        for attempt in range(1, policy.max_attempts + 1):
+            policy.breaker.before_call()
+            metrics.counter("resilience.attempts").inc()
+            yielded = False
+            updates = None
+            try:
+                attempt_context = copy.copy(context)
+                # asyncio.timeout keeps every step in this task, so context
+                # variables set by inner stages stay valid across updates
+                async with asyncio.timeout(policy.first_update_timeout):
+                    await next(attempt_context)
+                if attempt_context.result is not None:
+                    updates = aiter(attempt_context.result)
+                    while True:
+                        timeout = policy.stream_idle_timeout if yielded else policy.first_update_timeout
+                        try:
+                            async with asyncio.timeout(timeout):
+                                update = await anext(updates)
+                        except StopAsyncIteration:
+                            break
+                        yielded = True
+                        yield update
+            except Exception as exc:
+                policy.breaker.record_error(exc)
+                metrics.counter("resilience.failures").inc()
+                if isinstance(exc, TimeoutError):
+                    metrics.counter("resilience.stream_timeouts").inc()
+                if yielded or attempt == policy.max_attempts or not is_transient(exc):
+                    raise
+                metrics.counter("resilience.retries").inc()
+                await asyncio.sleep(policy.backoff(attempt))
+                continue
+            finally:
+                if updates is not None and hasattr(updates, "aclose"):
+                    await updates.aclose()
+            policy.breaker.record_success()
+            return
@@ -0,0 +1,285 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+"""
+Response Cache
+
+Caches the final modernized answer produced by the agent so that re-submitting
+the same code (even with different whitespace, comments or docstrings) returns
+immediately instead of paying for another model run.
+
+The cache key is built from the prompt with every Python snippet normalized to
+its AST, plus the model version. Entries live in an in-memory LRU tier backed
+by an optional on-disk tier, both with a TTL. The whole cache is invalidated
+when the agent instructions or ``tools.py`` change.
+"""
+
+import ast
+import contextvars
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from agent_framework import (
+    AgentMiddleware,
+    AgentRunContext,
+    AgentRunResponse,
+    AgentRunResponseUpdate,
+    ChatMessage,
+    Role,
+    TextContent,
+)
+
+from tracing import annotate
+
+# Set by SanitizePayloadMiddleware when the request continues a previous
+# response or conversation; such runs depend on server-side history.
+multi_turn_request: contextvars.ContextVar[bool] = contextvars.ContextVar(
+    "multi_turn_request", default=False
+)
+# Set for runs that must reach the model, such as the startup warm-up.
+bypass_cache: contextvars.ContextVar[bool] = contextvars.ContextVar(
+    "bypass_cache", default=False
+)
+
+_TOOLS_FILE = Path(__file__).with_name("tools.py")
+_FINGERPRINT_FILE = "FINGERPRINT"
+
+
+def normalize_code(source: str) -> str:
+    """Normalize Python source to its AST, dropping whitespace, comments and docstrings.
+
+    Text that is not valid Python is normalized by collapsing whitespace.
+    """
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError, RecursionError, MemoryError):
+        return " ".join(source.split())
+
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Module, ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
+            body = node.body
+            if (
+                body
+                and isinstance(body[0], ast.Expr)
+                and isinstance(body[0].value, ast.Constant)
+                and isinstance(body[0].value.value, str)
+            ):
+                node.body = body[1:]
+
+    try:
+        return ast.dump(tree)
+    except RecursionError:
+        return " ".join(source.split())
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Normalize a prompt: fenced code blocks are AST-normalized, prose is whitespace-collapsed."""
+    if "```" not in prompt:
+        return normalize_code(prompt)
+
+    normalized = []
+    # Odd-indexed segments are inside ``` fences
+    for index, segment in enumerate(prompt.split("```")):
+        if index % 2 == 0:
+            normalized.append(" ".join(segment.split()))
+        else:
+            first_line, _, body = segment.partition("\n")
+            if first_line.strip() and not first_line.strip().isidentifier():
+                body = segment  # No language tag, the first line is code
+            normalized.append(normalize_code(body))
+    return "\n```\n".join(normalized)
+
+
+def compute_fingerprint(instructions: str) -> str:
+    """Fingerprint the agent instructions and tool code; a change invalidates the cache."""
+    digest = hashlib.sha256(instructions.encode("utf-8"))
+    try:
+        digest.update(_TOOLS_FILE.read_bytes())
+    except OSError:
+        pass
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    """Two-tier (memory LRU + disk) cache of final agent answers with TTL."""
+
+    def __init__(
+        self,
+        instructions: str,
+        model: str,
+        max_entries: int = 256,
+        ttl_seconds: float = 86400,
+        cache_dir: str | None = None,
+    ):
+        self.fingerprint = compute_fingerprint(instructions)
+        self.model = model
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._memory: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._dir = Path(cache_dir) if cache_dir else None
+        if self._dir is not None:
+            self._prepare_disk_tier()
+
+    @classmethod
+    def from_env(cls, instructions: str) -> "ResponseCache | None":
+        """Create a cache from RESPONSE_CACHE_* environment variables, or None if disabled."""
+        if os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() in ("0", "false", "no"):
+            return None
+        model = os.getenv("FOUNDRY_MODEL_DEPLOYMENT_NAME", "")
+        version = os.getenv("FOUNDRY_MODEL_VERSION", "")
+        default_dir = Path(__file__).with_name(".cache") / "responses"
+        return cls(
+            instructions=instructions,
+            model=f"{model}@{version}" if version else model,
+            max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "256")),
+            ttl_seconds=float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "86400")),
+            cache_dir=os.getenv("RESPONSE_CACHE_DIR", str(default_dir)) or None,
+        )
+
+    def key_for(self, prompt: str) -> str:
+        """Build the cache key for a prompt."""
+        material = json.dumps([normalize_prompt(prompt), self.model, self.fingerprint])
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        """Return the cached answer for a key, or None if missing or expired."""
+        now = time.time()
+        entry = self._memory.get(key)
+        if entry is not None:
+            expires_at, text = entry
+            if expires_at > now:
+                self._memory.move_to_end(key)
+                return text
+            del self._memory[key]
+
+        entry = self._read_disk(key)
+        if entry is not None and entry[0] > now:
+            self._remember(key, entry)
+            return entry[1]
+        return None
+
+    def put(self, key: str, text: str) -> None:
+        """Store an answer in both tiers."""
+        if not text:
+            return
+        entry = (time.time() + self.ttl_seconds, text)
+        self._remember(key, entry)
+        self._write_disk(key, entry)
+
+    def invalidate(self) -> None:
+        """Drop every cached answer from both tiers."""
+        self._memory.clear()
+        if self._dir is not None and self._dir.is_dir():
+            for path in self._dir.glob("*.json"):
+                path.unlink(missing_ok=True)
+
+    def _remember(self, key: str, entry: tuple[float, str]) -> None:
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _prepare_disk_tier(self) -> None:
+        """Create the cache directory and purge it if the fingerprint changed."""
+        try:
+            self._dir.mkdir(parents=True, exist_ok=True)
+            marker = self._dir / _FINGERPRINT_FILE
+            if not marker.exists() or marker.read_text().strip() != self.fingerprint:
+                self.invalidate()
+                marker.write_text(self.fingerprint)
+        except OSError:
+            self._dir = None  # Read-only filesystem: memory tier only
+
+    def _read_disk(self, key: str) -> tuple[float, str] | None:
+        if self._dir is None:
+            return None
+        try:
+            data = json.loads((self._dir / f"{key}.json").read_text(encoding="utf-8"))
+            return float(data["expires_at"]), data["text"]
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def _write_disk(self, key: str, entry: tuple[float, str]) -> None:
+        if self._dir is None:
+            return
+        path = self._dir / f"{key}.json"
+        tmp = path.with_suffix(".tmp")
+        try:
+            tmp.write_text(
+                json.dumps({"expires_at": entry[0], "text": entry[1]}), encoding="utf-8"
+            )
+            os.replace(tmp, path)
+        except OSError:
+            pass
+
+
+class ResponseCacheMiddleware(AgentMiddleware):
+    """Agent middleware that serves and stores final answers from a ResponseCache.
+
+    Multi-turn runs (a previous_response_id / conversation on the request, or a
+    thread that already carries history) and runs with ``bypass_cache`` set are
+    never served from the cache.
+    """
+
+    def __init__(self, cache: ResponseCache):
+        self.cache = cache
+
+    async def process(self, context: AgentRunContext, next) -> None:
+        if multi_turn_request.get() or bypass_cache.get() or await _has_history(context.thread):
+            await next(context)
+            return
+
+        prompt = "\n".join(
+            message.text for message in context.messages
+            if message.role == Role.USER and message.text
+        )
+        if not prompt:
+            await next(context)
+            return
+
+        key = self.cache.key_for(prompt)
+        cached = self.cache.get(key)
+        annotate({"cache.hit": cached is not None})
+        if cached is not None:
+            if context.is_streaming:
+                context.result = _replay(cached)
+            else:
+                context.result = AgentRunResponse(
+                    messages=[ChatMessage(role=Role.ASSISTANT, text=cached)]
+                )
+            return
+
+        await next(context)
+
+        if context.is_streaming:
+            context.result = self._store_stream(key, context.result)
+        elif context.result is not None:
+            self.cache.put(key, context.result.text)
+
+    async def _store_stream(self, key, updates):
+        """Pass streamed updates through and cache the text once the stream completes."""
+        parts = []
+        async for update in updates:
+            if update.text:
+                parts.append(update.text)
+            yield update
+        self.cache.put(key, "".join(parts))
+
+
+async def _replay(text: str):
+    yield AgentRunResponseUpdate(contents=[TextContent(text=text)], role=Role.ASSISTANT)
+
+
+async def _has_history(thread) -> bool:
+    """Return True if the thread already holds messages from earlier turns."""
+    if thread is None:
+        return False
+    if getattr(thread, "service_thread_id", None):
+        return True
+    store = getattr(thread, "message_store", None)
+    if store is None:
+        return False
+    return bool(await store.list_messages())
@@ -0,0 +1,327 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+"""
+Session Store
+
+Maps short client session IDs (e.g. APIM MCP's ``"session-1"``) to the real
+conversation ID and keeps each conversation's agent thread, so multi-turn
+sessions reuse the history instead of re-uploading previous code and context
+every turn.
+
+``SessionMiddleware`` runs in front of ``SanitizePayloadMiddleware``:
+- a request whose ``conversation`` is a short client ID is rewritten to the
+  mapped conversation ID
+- the response (JSON or SSE) is inspected for the conversation ID, which
+  becomes the session's mapping
+
+``ThreadRepository`` is the agent server's thread repository: the server loads
+the thread of the request's conversation before the run and saves it after,
+so the next turn continues the same history on whichever worker serves it.
+
+Sessions are namespaced per client (hash of ADMISSION_CLIENT_HEADER), evicted
+by LRU and TTL, and optionally persisted to SQLite, which also shares them
+and the threads between workers. SQLite calls run in a worker thread.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from azure.ai.agentserver.agentframework.persistence import SerializedAgentThreadRepository
+
+import metrics
+from asgi_utils import client_key, read_body, replay_body
+
+logger = logging.getLogger("sessions")
+
+# Same threshold SanitizePayloadMiddleware uses for a valid Foundry conversation ID
+_MIN_FOUNDRY_ID_LEN = 55
+# Largest non-streamed response body inspected for IDs
+_MAX_CAPTURE_BYTES = 4 * 1024 * 1024
+# Prune expired and excess rows from disk every N writes
+_PRUNE_EVERY = 100
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    key TEXT PRIMARY KEY,
+    conversation_id TEXT,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_last_used ON sessions (last_used);
+CREATE TABLE IF NOT EXISTS threads (
+    conversation_id TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS threads_last_used ON threads (last_used);
+"""
+
+
+class SessionStore:
+    """LRU/TTL map of session keys to conversation IDs, and of conversation IDs to serialized threads."""
+
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 86400, path: str | None = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._memory: OrderedDict[str, tuple[str, float]] = OrderedDict()
+        # Threads are only cached in memory without a database: with one,
+        # another worker may have advanced the conversation since
+        self._threads: OrderedDict[str, tuple[dict, float]] = OrderedDict()
+        self._writes = 0
+        self._db = None
+        self._lock = threading.Lock()
+        if path:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA busy_timeout=5000")
+            self._db.executescript(_SCHEMA)
+
+    @classmethod
+    def from_env(cls) -> "SessionStore | None":
+        """Create a store from SESSION_STORE_* environment variables, or None if disabled."""
+        if os.getenv("SESSION_STORE_ENABLED", "true").lower() in ("0", "false", "no"):
+            return None
+        path = None
+        if os.getenv("SESSION_STORE_PERSIST", "true").lower() not in ("0", "false", "no"):
+            default_path = Path(__file__).with_name(".cache") / "sessions.db"
+            path = os.getenv("SESSION_STORE_DB", str(default_path))
+        return cls(
+            max_entries=int(os.getenv("SESSION_STORE_MAX_ENTRIES", "10000")),
+            ttl_seconds=float(os.getenv("SESSION_STORE_TTL_SECONDS", "86400")),
+            path=path,
+        )
+
+    async def get(self, key: str) -> str | None:
+        """Conversation ID of a session key, or None if unknown or expired."""
+        now = time.time()
+        entry = self._memory.get(key)
+        if entry is not None and now - entry[1] <= self.ttl_seconds:
+            self._memory.move_to_end(key)
+            return entry[0]
+
+        conversation_id = None
+        if self._db is not None:
+            # Another worker may have served the previous turn
+            row = await asyncio.to_thread(
+                self._execute_one, "SELECT conversation_id, last_used FROM sessions WHERE key = ?", (key,)
+            )
+            if row is not None and row[0] and now - row[1] <= self.ttl_seconds:
+                conversation_id = row[0]
+        if conversation_id is None:
+            self._memory.pop(key, None)
+            return None
+        self._remember(self._memory, key, conversation_id, now)
+        metrics.gauge("sessions.entries").set(len(self._memory))
+        return conversation_id
+
+    async def put(self, key: str, conversation_id: str) -> None:
+        now = time.time()
+        self._remember(self._memory, key, conversation_id, now)
+        metrics.gauge("sessions.entries").set(len(self._memory))
+        if self._db is not None:
+            await asyncio.to_thread(
+                self._write,
+                "INSERT INTO sessions (key, conversation_id, last_used) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET conversation_id = excluded.conversation_id, "
+                "last_used = excluded.last_used",
+                (key, conversation_id, now),
+            )
+
+    async def get_thread(self, conversation_id: str) -> dict | None:
+        """Serialized agent thread of a conversation, or None if unknown or expired."""
+        now = time.time()
+        if self._db is None:
+            entry = self._threads.get(conversation_id)
+            if entry is None or now - entry[1] > self.ttl_seconds:
+                self._threads.pop(conversation_id, None)
+                return None
+            self._remember(self._threads, conversation_id, entry[0], now)
+            return entry[0]
+        row = await asyncio.to_thread(
+            self._execute_one, "SELECT state, last_used FROM threads WHERE conversation_id = ?", (conversation_id,)
+        )
+        if row is None or now - row[1] > self.ttl_seconds:
+            return None
+        return json.loads(row[0])
+
+    async def put_thread(self, conversation_id: str, state: dict) -> None:
+        now = time.time()
+        if self._db is None:
+            self._remember(self._threads, conversation_id, state, now)
+            return
+        await asyncio.to_thread(
+            self._write,
+            "INSERT INTO threads (conversation_id, state, last_used) VALUES (?, ?, ?) "
+            "ON CONFLICT(conversation_id) DO UPDATE SET state = excluded.state, last_used = excluded.last_used",
+            (conversation_id, json.dumps(state), now),
+        )
+
+    def _remember(self, entries: OrderedDict, key: str, value, now: float) -> None:
+        entries[key] = (value, now)
+        entries.move_to_end(key)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+    def _execute_one(self, sql: str, params: tuple):
+        with self._lock:
+            return self._db.execute(sql, params).fetchone()
+
+    def _write(self, sql: str, params: tuple) -> None:
+        with self._lock:
+            self._db.execute(sql, params)
+            self._writes += 1
+            if self._writes % _PRUNE_EVERY == 0:
+                self._prune(time.time())
+
+    def _prune(self, now: float) -> None:
+        for table, key in (("sessions", "key"), ("threads", "conversation_id")):
+            self._db.execute(f"DELETE FROM {table} WHERE last_used < ?", (now - self.ttl_seconds,))
+            self._db.execute(
+                f"DELETE FROM {table} WHERE {key} NOT IN "
+                f"(SELECT {key} FROM {table} ORDER BY last_used DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+
+
+class ThreadRepository(SerializedAgentThreadRepository):
+    """Agent thread repository for ``from_agent_framework`` backed by a SessionStore."""
+
+    def __init__(self, agent, store: SessionStore):
+        super().__init__(agent)
+        self.store = store
+
+    async def read_from_storage(self, conversation_id: str) -> dict | None:
+        if not conversation_id:
+            return None
+        state = await self.store.get_thread(conversation_id)
+        metrics.counter("sessions.threads_loaded" if state is not None else "sessions.threads_new").inc()
+        return state
+
+    async def write_to_storage(self, conversation_id: str, serialized_thread: dict) -> None:
+        if conversation_id:
+            await self.store.put_thread(conversation_id, serialized_thread)
+
+
+def _extract_ids(response: dict) -> tuple[str | None, int | None]:
+    """Return the conversation ID and input tokens of a response object."""
+    conversation = response.get("conversation")
+    if isinstance(conversation, dict):
+        conversation = conversation.get("id")
+    if not isinstance(conversation, str) or len(conversation) < _MIN_FOUNDRY_ID_LEN:
+        conversation = None
+    usage = response.get("usage") or {}
+    return conversation, usage.get("input_tokens")
+
+
+class SessionMiddleware:
+    """Raw ASGI middleware resolving short client session IDs through a SessionStore."""
+
+    def __init__(self, app, store: SessionStore):
+        self.app = app
+        self.store = store
+        self.client_header = os.getenv("ADMISSION_CLIENT_HEADER", "ocp-apim-subscription-key")
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope.get("method") != "POST"
+            or scope.get("path") not in ("/runs", "/responses")
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        raw_body = await read_body(receive)
+        try:
+            payload = json.loads(raw_body)
+        except ValueError:
+            payload = None
+        session = payload.get("conversation") if isinstance(payload, dict) else None
+        if (
+            not isinstance(session, str)
+            or not session
+            or len(session) >= _MIN_FOUNDRY_ID_LEN
+        ):
+            await self.app(scope, replay_body(raw_body, receive), send)
+            return
+
+        key = f"{client_key(scope, self.client_header)}:{session}"
+        conversation_id = await self.store.get(key)
+        if conversation_id is not None:
+            metrics.counter("sessions.hits").inc()
+            payload["conversation"] = conversation_id
+            raw_body = json.dumps(payload).encode("utf-8")
+        else:
+            # First turn: SanitizePayloadMiddleware drops the short ID, the server
+            # starts a new conversation and the response we capture below maps it
+            metrics.counter("sessions.misses").inc()
+        metrics.histogram("sessions.request_bytes").observe(len(raw_body))
+
+        continued = conversation_id is not None
+        captured = {}
+        chunks = []
+        capture_size = 0
+        event_stream = False
+        sse_tail = b""
+
+        async def capturing_send(message):
+            nonlocal event_stream, capture_size, sse_tail
+            if message["type"] == "http.response.start":
+                captured["status"] = message["status"]
+                event_stream = any(
+                    key.lower() == b"content-type" and value.startswith(b"text/event-stream")
+                    for key, value in message.get("headers") or []
+                )
+            elif message["type"] == "http.response.body" and captured.get("status") == 200:
+                body = message.get("body", b"")
+                if event_stream:
+                    # Events may be split across body chunks: keep the partial last line
+                    lines = (sse_tail + body).split(b"\n")
+                    sse_tail = lines.pop()
+                    if len(sse_tail) > _MAX_CAPTURE_BYTES:
+                        sse_tail = b""
+                    self._scan_events(lines, captured)
+                elif capture_size + len(body) <= _MAX_CAPTURE_BYTES:
+                    chunks.append(body)
+                    capture_size += len(body)
+            await send(message)
+
+        await self.app(scope, replay_body(raw_body, receive), capturing_send)
+
+        if captured.get("status") != 200:
+            return
+        if not event_stream:
+            try:
+                response = json.loads(b"".join(chunks))
+            except ValueError:
+                return
+            if isinstance(response, dict):
+                captured.update(zip(("conversation_id", "input_tokens"), _extract_ids(response)))
+        if captured.get("conversation_id"):
+            await self.store.put(key, captured["conversation_id"])
+        if captured.get("input_tokens") is not None:
+            name = "sessions.continued_input_tokens" if continued else "sessions.new_input_tokens"
+            metrics.histogram(name).observe(captured["input_tokens"])
+
+    @staticmethod
+    def _scan_events(lines: list[bytes], captured: dict) -> None:
+        """Pick the response object out of response.created/completed SSE events."""
+        for line in lines:
+            if not line.startswith(b"data:") or b'"response"' not in line:
+                continue
+            try:
+                event = json.loads(line[5:])
+            except ValueError:
+                continue
+            response = event.get("response") if isinstance(event, dict) else None
+            if isinstance(response, dict):
+                conversation_id, input_tokens = _extract_ids(response)
+                captured["conversation_id"] = conversation_id or captured.get("conversation_id")
+                if input_tokens is not None:
+                    captured["input_tokens"] = input_tokens
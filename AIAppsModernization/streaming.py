@@ -0,0 +1,259 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+"""
+Streaming Output
+
+Output stage for streamed runs:
+- ``StreamCoalescingMiddleware`` merges the tiny text chunks yielded by
+  ``run_stream`` into larger updates, flushed by size (STREAM_COALESCE_CHARS)
+  or after a short window (STREAM_COALESCE_MS, default 20 ms). The first chunk
+  is forwarded immediately so time to first token does not change.
+- ``SSEHeartbeatMiddleware`` sends SSE comment lines while a stream is idle
+  (e.g. during tool execution) so gateways such as APIM do not time out, and
+  records events, writes and CPU time per streamed response.
+"""
+
+import asyncio
+import os
+import time
+
+from agent_framework import (
+    AgentMiddleware,
+    AgentRunContext,
+    AgentRunResponseUpdate,
+    TextContent,
+)
+
+import metrics
+
+_HEARTBEAT = b": keep-alive\n\n"
+# Updates read ahead of a slow consumer before the model stream is paused
+_MAX_QUEUED = 64
+
+
+def _is_text_only(update) -> bool:
+    contents = update.contents or []
+    return bool(contents) and all(isinstance(content, TextContent) for content in contents)
+
+
+def _merge(updates: list):
+    """Merge consecutive text-only updates of one message into a single update.
+
+    Identity fields come from the first update; additional_properties and
+    raw_representation from the last, which is the most recent state of the
+    stream (e.g. a provider's cumulative finish reason).
+    """
+    if len(updates) == 1:
+        return updates[0]
+    first, last = updates[0], updates[-1]
+    return AgentRunResponseUpdate(
+        contents=[TextContent(text="".join(update.text for update in updates))],
+        role=first.role,
+        author_name=first.author_name,
+        response_id=first.response_id,
+        message_id=first.message_id,
+        created_at=first.created_at,
+        additional_properties=last.additional_properties,
+        raw_representation=last.raw_representation,
+    )
+
+
+async def coalesce_updates(updates, window: float = 0.02, max_chars: int = 256, max_queued: int = _MAX_QUEUED):
+    """Re-yield streamed updates with consecutive text chunks coalesced.
+
+    Text is flushed when `max_chars` are buffered or `window` seconds after the
+    first buffered chunk, whichever comes first. Non-text updates (tool calls,
+    usage) flush the buffer and pass through unchanged. At most `max_queued`
+    updates are read ahead, so a slow consumer slows the model stream down
+    instead of letting it buffer without limit.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max_queued)
+    loop = asyncio.get_running_loop()
+    done = object()
+    flush = object()
+
+    async def pump():
+        try:
+            async for update in updates:
+                await queue.put(update)
+        except Exception as exc:
+            await queue.put(exc)
+            return
+        await queue.put(done)
+
+    producer = asyncio.create_task(pump())
+    buffer: list = []
+    buffered_chars = 0
+    timer = None
+    first_text = True
+    received = emitted = 0
+
+    def request_flush():
+        nonlocal timer
+        if queue.full():
+            # The consumer is behind and has updates to read anyway: ask again later
+            timer = loop.call_later(window, request_flush)
+        else:
+            queue.put_nowait(flush)
+
+    def take():
+        # Reset the buffer and its pending flush timer
+        nonlocal buffer, buffered_chars, timer
+        merged = _merge(buffer)
+        buffer, buffered_chars = [], 0
+        if timer is not None:
+            timer.cancel()
+            timer = None
+        return merged
+
+    try:
+        while True:
+            # A timer puts a flush marker in the queue, so waiting never needs a timeout
+            item = await queue.get()
+            if item is flush:
+                if buffer:
+                    emitted += 1
+                    yield take()
+                continue
+
+            if item is done or isinstance(item, Exception):
+                if buffer:
+                    emitted += 1
+                    yield take()
+                if item is not done:
+                    raise item
+                return
+
+            received += 1
+            if not _is_text_only(item):
+                if buffer:
+                    emitted += 1
+                    yield take()
+                emitted += 1
+                yield item
+                continue
+
+            if first_text:
+                first_text = False
+                emitted += 1
+                yield item
+                continue
+
+            if buffer and item.message_id != buffer[0].message_id:
+                emitted += 1
+                yield take()
+            buffer.append(item)
+            buffered_chars += len(item.text)
+            if buffered_chars >= max_chars:
+                emitted += 1
+                yield take()
+            elif timer is None:
+                timer = loop.call_later(window, request_flush)
+    finally:
+        if timer is not None:
+            timer.cancel()
+        producer.cancel()
+        # Wait until the producer has stopped reading the model stream
+        await asyncio.gather(producer, return_exceptions=True)
+        metrics.histogram("stream.updates_in").observe(received)
+        metrics.histogram("stream.updates_out").observe(emitted)
+
+
+class StreamCoalescingMiddleware(AgentMiddleware):
+    """Agent middleware that coalesces the text chunks of streamed runs."""
+
+    def __init__(self, window: float = 0.02, max_chars: int = 256):
+        self.window = window
+        self.max_chars = max_chars
+
+    @classmethod
+    def from_env(cls) -> "StreamCoalescingMiddleware | None":
+        """Create the middleware from STREAM_COALESCE_* variables, or None if disabled."""
+        window_ms = float(os.getenv("STREAM_COALESCE_MS", "20"))
+        if window_ms <= 0:
+            return None
+        return cls(window=window_ms / 1000, max_chars=int(os.getenv("STREAM_COALESCE_CHARS", "256")))
+
+    async def process(self, context: AgentRunContext, next) -> None:
+        await next(context)
+        if context.is_streaming and context.result is not None:
+            context.result = coalesce_updates(context.result, self.window, self.max_chars)
+
+
+class SSEHeartbeatMiddleware:
+    """Raw ASGI middleware adding idle heartbeats and per-stream metrics to SSE responses."""
+
+    def __init__(self, app, interval: float | None = None):
+        self.app = app
+        self.interval = interval if interval is not None else float(os.getenv("STREAM_HEARTBEAT_SECONDS", "10"))
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        lock = asyncio.Lock()
+        streaming = False
+        finished = False
+        last_write = time.monotonic()
+        events = writes = 0
+        cpu_started = time.process_time()
+        started = time.perf_counter()
+        first_byte_ms = None
+        heartbeat_task = None
+
+        async def heartbeat():
+            nonlocal last_write
+            while not finished:
+                await asyncio.sleep(max(0.0, last_write + self.interval - time.monotonic()))
+                async with lock:
+                    if finished or time.monotonic() - last_write < self.interval:
+                        continue
+                    await send({"type": "http.response.body", "body": _HEARTBEAT, "more_body": True})
+                    last_write = time.monotonic()
+                    metrics.counter("stream.heartbeats").inc()
+
+        async def wrapped_send(message):
+            nonlocal streaming, finished, last_write, events, writes, first_byte_ms, heartbeat_task
+            if message["type"] == "http.response.start":
+                content_type = next(
+                    (value for key, value in message.get("headers") or [] if key.lower() == b"content-type"),
+                    b"",
+                )
+                streaming = content_type.startswith(b"text/event-stream")
+                if streaming and self.interval > 0:
+                    heartbeat_task = asyncio.create_task(heartbeat())
+                await send(message)
+                return
+            if not streaming or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            async with lock:
+                body = message.get("body", b"")
+                if body:
+                    writes += 1
+                    events += body.count(b"\n\n")
+                    if first_byte_ms is None:
+                        first_byte_ms = (time.perf_counter() - started) * 1000
+                if not message.get("more_body", False):
+                    finished = True
+                await send(message)
+                last_write = time.monotonic()
+
+        try:
+            await self.app(scope, receive, wrapped_send)
+        finally:
+            finished = True
+            if heartbeat_task is not None:
+                heartbeat_task.cancel()
+                # Wait until it has stopped so nothing is sent after the response returns;
+                # a send that failed once the client left is retrieved (and dropped) here
+                await asyncio.gather(heartbeat_task, return_exceptions=True)
+            if streaming:
+                metrics.histogram("stream.events_per_response").observe(events)
+                metrics.histogram("stream.writes_per_response").observe(writes)
+                # Process CPU over the stream's lifetime (exact when streams do not overlap)
+                metrics.histogram("stream.cpu_ms").observe((time.process_time() - cpu_started) * 1000)
+                if first_byte_ms is not None:
+                    metrics.histogram("stream.first_byte_ms").observe(first_byte_ms)
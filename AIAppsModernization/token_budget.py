@@ -0,0 +1,208 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+"""
+Token Budget
+
+Client-side tokens-per-minute / requests-per-minute scheduler in front of model
+calls, so the agent stays under the Foundry deployment quota instead of being
+throttled with 429s.
+
+Each model request reserves its estimated tokens (prompt estimate plus the
+expected output) from a token bucket. When the bucket is in debt the request
+waits exactly as long as the refill takes, which spaces requests smoothly in
+arrival order instead of producing retry storms. The prompt estimate counts
+tool results, usually most of this agent's prompt. Once the response (or the
+end of a stream) reports the real usage, the reservation is corrected.
+
+Backends:
+- memory: per process
+- file: JSON state guarded by an exclusive file lock, shared by every worker on
+  the machine (defaults to /dev/shm, i.e. shared memory, when available)
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from pathlib import Path
+
+from agent_framework import ChatContext, ChatMiddleware, FunctionResultContent, UsageContent
+
+import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger("token_budget")
+
+# Rough characters-per-token ratio used to estimate prompt size
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of tokens in a text."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _message_tokens(message) -> int:
+    total = 0
+    for content in message.contents or []:
+        if isinstance(content, FunctionResultContent):
+            total += estimate_tokens(str(content.result or ""))
+        else:
+            total += estimate_tokens(getattr(content, "text", None) or str(getattr(content, "arguments", "") or ""))
+    return total + 4  # Per-message overhead
+
+
+def prompt_tokens(messages) -> int:
+    """Estimate the tokens of a list of chat messages."""
+    return sum(_message_tokens(message) for message in messages)
+
+
+class MemoryBucketBackend:
+    """Token bucket state kept in this process."""
+
+    def __init__(self):
+        self._state: dict[str, tuple[float, float]] = {}
+
+    def reserve(self, name: str, amount: float, capacity: float, now: float) -> float:
+        """Take `amount` from bucket `name` and return how long the caller must wait."""
+        tokens, updated = self._state.get(name, (capacity, now))
+        tokens, wait = _reserve(tokens, updated, amount, capacity, now)
+        self._state[name] = (tokens, now)
+        return wait
+
+
+class FileBucketBackend:
+    """Token bucket state in a JSON file shared between processes."""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.touch(exist_ok=True)
+
+    def reserve(self, name: str, amount: float, capacity: float, now: float) -> float:
+        with open(self.path, "r+", encoding="utf-8") as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                try:
+                    state = json.loads(handle.read() or "{}")
+                except ValueError:
+                    state = {}
+                tokens, updated = state.get(name, (capacity, now))
+                tokens, wait = _reserve(tokens, updated, amount, capacity, now)
+                state[name] = (tokens, now)
+                handle.seek(0)
+                handle.truncate()
+                handle.write(json.dumps(state))
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+        return wait
+
+
+def _reserve(tokens: float, updated: float, amount: float, capacity: float, now: float):
+    """Refill a bucket of `capacity` per minute and take `amount`, allowing debt.
+
+    Returns the new token count and the wait until the debt is repaid.
+    """
+    rate = capacity / 60.0
+    tokens = min(capacity, tokens + (now - updated) * rate)
+    tokens -= min(amount, capacity)
+    wait = -tokens / rate if tokens < 0 else 0.0
+    return tokens, wait
+
+
+class TokenBudget:
+    """Schedules model requests under a tokens-per-minute and requests-per-minute budget."""
+
+    def __init__(self, backend, tokens_per_minute: int, requests_per_minute: int = 0):
+        self.backend = backend
+        self.tokens_per_minute = tokens_per_minute
+        self.requests_per_minute = requests_per_minute
+
+    @classmethod
+    def from_env(cls) -> "TokenBudget | None":
+        """Create a budget from MODEL_* environment variables, or None if no limit is set."""
+        tpm = int(os.getenv("MODEL_TPM_LIMIT", "0"))
+        rpm = int(os.getenv("MODEL_RPM_LIMIT", "0"))
+        if tpm <= 0 and rpm <= 0:
+            return None
+
+        backend_name = os.getenv("MODEL_BUDGET_BACKEND", "file")
+        if backend_name == "file" and fcntl is not None:
+            default_dir = "/dev/shm" if os.path.isdir("/dev/shm") else Path(__file__).with_name(".cache")
+            path = os.getenv("MODEL_BUDGET_FILE", str(Path(default_dir) / "modernizer-token-budget.json"))
+            backend = FileBucketBackend(path)
+        else:
+            if backend_name == "file":
+                logger.warning("File locking is not available, using a per-process token budget")
+            backend = MemoryBucketBackend()
+        return cls(backend, tpm, rpm)
+
+    async def reserve(self, estimated_tokens: int) -> None:
+        """Wait until the request fits in the budget."""
+        now = time.time()
+        wait = 0.0
+        if self.tokens_per_minute > 0:
+            wait = self.backend.reserve("tokens", estimated_tokens, self.tokens_per_minute, now)
+        if self.requests_per_minute > 0:
+            wait = max(wait, self.backend.reserve("requests", 1, self.requests_per_minute, now))
+
+        metrics.histogram("budget.wait_ms").observe(wait * 1000)
+        if wait > 0:
+            gauge = metrics.gauge("budget.waiting")
+            gauge.inc()
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                gauge.dec()
+
+    def adjust(self, delta_tokens: int) -> None:
+        """Correct the token reservation once the real usage is known (negative refunds)."""
+        if self.tokens_per_minute > 0 and delta_tokens:
+            self.backend.reserve("tokens", delta_tokens, self.tokens_per_minute, time.time())
+
+
+class TokenBudgetMiddleware(ChatMiddleware):
+    """Chat middleware that reserves budget before every model round trip."""
+
+    def __init__(self, budget: TokenBudget):
+        self.budget = budget
+        self.output_tokens = int(os.getenv("MODEL_BUDGET_OUTPUT_TOKENS", "1000"))
+
+    def _estimate(self, context: ChatContext) -> int:
+        prompt = prompt_tokens(context.messages)
+        options = context.chat_options
+        instructions = getattr(options, "instructions", None) or ""
+        max_tokens = getattr(options, "max_tokens", None) or self.output_tokens
+        return prompt + estimate_tokens(instructions) + max_tokens
+
+    async def process(self, context: ChatContext, next) -> None:
+        estimated = self._estimate(context)
+        metrics.histogram("budget.estimated_tokens").observe(estimated)
+        await self.budget.reserve(estimated)
+        await next(context)
+
+        if context.is_streaming:
+            if context.result is not None:
+                context.result = self._corrected_stream(context.result, estimated)
+            return
+        usage = getattr(context.result, "usage_details", None)
+        if usage is not None and usage.total_token_count:
+            self.budget.adjust(usage.total_token_count - estimated)
+
+    async def _corrected_stream(self, updates, estimated: int):
+        # Streams report usage in UsageContent, typically in the last update
+        used = 0
+        try:
+            async for update in updates:
+                for content in update.contents or []:
+                    if isinstance(content, UsageContent) and content.details is not None:
+                        used += content.details.total_token_count or 0
+                yield update
+        finally:
+            if used:
+                self.budget.adjust(used - estimated)
@@ -0,0 +1,285 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+"""
+Tool Execution Engine
+
+The tools in ``tools.py`` are synchronous, CPU-bound functions. Called as-is
+they run on the event loop: tool calls the model issues in the same turn run
+one after another, and while one runs every other stream and probe waits.
+
+``async_tools`` wraps each tool in an async function with the same signature
+and docstring that runs the tool off the event loop, so the framework's
+concurrent dispatch of one turn's calls actually overlaps:
+- small inputs run in a thread pool (TOOL_THREAD_WORKERS)
+- inputs of TOOL_PROCESS_THRESHOLD_KB or more (e.g. a 20 MB paste) run in a
+  pool of worker processes (TOOL_PROCESS_WORKERS), isolated from the server's
+  GIL and memory
+- every call has a wall-clock budget (TOOL_TIMEOUT_SECONDS), which includes
+  the wait for a free worker process; a worker process that exceeds it is
+  killed and replaced, a thread (which cannot be killed) is abandoned and
+  counted
+- queueing and execution time are recorded separately
+
+``ToolPhaseMiddleware`` tracks, per agent run, the tool phase between two
+model round trips: tool calls that overlap form one phase, whose latency and
+call count are recorded.
+"""
+
+import asyncio
+import functools
+import multiprocessing
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+
+from agent_framework import AgentMiddleware, AgentRunContext
+
+import metrics
+import tool_worker
+from artifacts import get_store, parse_code_ref
+from tracing import annotate, span
+
+
+class ToolTimeoutError(Exception):
+    """Raised when a tool call exceeds its wall-clock budget."""
+
+
+class ToolPhaseTracker:
+    """Groups overlapping tool calls of one run into phases and records their latency."""
+
+    def __init__(self):
+        self._in_flight = 0
+        self._calls = 0
+        self._started = 0.0
+
+    def enter(self) -> None:
+        if self._in_flight == 0:
+            self._started = time.perf_counter()
+            self._calls = 0
+        self._in_flight += 1
+        self._calls += 1
+
+    def exit(self) -> None:
+        self._in_flight -= 1
+        if self._in_flight == 0:
+            metrics.histogram("tools.phase_ms").observe((time.perf_counter() - self._started) * 1000)
+            metrics.histogram("tools.calls_per_phase").observe(self._calls)
+
+
+_current_phase: ContextVar[ToolPhaseTracker | None] = ContextVar("tool_phase", default=None)
+_executor: ThreadPoolExecutor | None = None
+_process_pool: "ProcessToolPool | None" = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("TOOL_THREAD_WORKERS", "4")),
+            thread_name_prefix="tool",
+        )
+    return _executor
+
+
+class ProcessToolPool:
+    """Pool of long-lived worker processes that can be killed one at a time."""
+
+    def __init__(self, workers: int = 2):
+        self.workers = workers
+        self._context = multiprocessing.get_context("spawn")
+        self._idle: asyncio.Queue | None = None
+        self._started = 0
+        self._waiting = 0
+
+    def _spawn(self):
+        parent, child = self._context.Pipe()
+        process = self._context.Process(target=tool_worker.serve, args=(child,), daemon=True)
+        process.start()
+        child.close()
+        self._started += 1
+        return process, parent
+
+    def _discard(self, worker) -> None:
+        process, conn = worker
+        process.kill()
+        process.join()
+        conn.close()
+        self._started -= 1
+
+    def _replace(self, worker) -> None:
+        """Discard a broken worker, handing a fresh one to a caller waiting for a worker."""
+        self._discard(worker)
+        if self._waiting and self._started < self.workers:
+            self._idle.put_nowait(self._spawn())
+
+    async def _acquire(self, timeout: float | None):
+        if self._idle is None:
+            self._idle = asyncio.Queue()
+        if self._idle.empty() and self._started < self.workers:
+            return self._spawn()
+        self._waiting += 1
+        try:
+            return await asyncio.wait_for(self._idle.get(), timeout)
+        finally:
+            self._waiting -= 1
+
+    async def run(self, func, args, kwargs, timeout: float | None):
+        """Run `func` in a worker process; returns (value, queue_ms, exec_ms).
+
+        `timeout` bounds the wait for a worker and the call together.
+        """
+        submitted = time.perf_counter()
+        worker = await self._acquire(timeout)
+        queue_ms = (time.perf_counter() - submitted) * 1000
+        if timeout is not None:
+            timeout = max(timeout - queue_ms / 1000, 0.0)
+        process, conn = worker
+        try:
+            await asyncio.to_thread(conn.send, (func, args, kwargs))
+            status, value, exec_ms = await asyncio.wait_for(asyncio.to_thread(conn.recv), timeout)
+        except BaseException as exc:
+            # Timed out, cancelled or the worker died: never reuse it
+            if isinstance(exc, asyncio.TimeoutError):
+                metrics.counter("tools.killed_workers").inc()
+            self._replace(worker)
+            raise
+        self._idle.put_nowait(worker)
+        if status == "error":
+            raise RuntimeError(value)
+        return value, queue_ms, exec_ms
+
+    def close(self) -> None:
+        while self._idle is not None and not self._idle.empty():
+            self._discard(self._idle.get_nowait())
+
+
+def _get_process_pool() -> "ProcessToolPool | None":
+    global _process_pool
+    workers = int(os.getenv("TOOL_PROCESS_WORKERS", "2"))
+    # Worker processes only see artifacts and uploads through the shared disk tier
+    if workers <= 0 or get_store().directory is None:
+        return None
+    if _process_pool is None:
+        _process_pool = ProcessToolPool(workers)
+    return _process_pool
+
+
+def _input_size(args, kwargs) -> int:
+    """Size of a call's string inputs, counting uploaded code behind code_ref values."""
+    size = 0
+    for value in (*args, *kwargs.values()):
+        if isinstance(value, str):
+            handle = parse_code_ref(value)
+            if handle is not None:
+                annotate({"tool.code_ref": True, "cache.hit": get_store().in_memory(handle)})
+                # A stat, not a read: the tool loads the content itself off the loop
+                size += get_store().size(handle) or 0
+            else:
+                size += len(value)
+    return size
+
+
+def _timed_call(func, args, kwargs):
+    started = time.perf_counter()
+    value = func(*args, **kwargs)
+    return value, started, time.perf_counter()
+
+
+async def _run_in_thread(func, args, kwargs, timeout: float | None):
+    """Run `func` in the thread pool; returns (value, queue_ms, exec_ms)."""
+    submitted = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(_get_executor(), _timed_call, func, args, kwargs)
+    try:
+        value, started, finished = await asyncio.wait_for(future, timeout)
+    except asyncio.TimeoutError:
+        # A thread cannot be killed: it runs to completion and its result is dropped
+        metrics.counter("tools.abandoned_threads").inc()
+        raise
+    return value, (started - submitted) * 1000, (finished - started) * 1000
+
+
+async def run_tool(func, *args, timeout: float | None = None, **kwargs):
+    """Run a synchronous tool off the event loop under a wall-clock budget."""
+    if timeout is None:
+        timeout = float(os.getenv("TOOL_TIMEOUT_SECONDS", "30"))
+    timeout = timeout if timeout > 0 else None
+    name = func.__name__
+    with span(f"tool.{name}", {"tool.name": name}) as tool_span:
+        size = _input_size(args, kwargs)
+        threshold = int(os.getenv("TOOL_PROCESS_THRESHOLD_KB", "256")) * 1024
+        pool = _get_process_pool() if size >= threshold else None
+
+        tracker = _current_phase.get()
+        if tracker is not None:
+            tracker.enter()
+        started = time.perf_counter()
+        try:
+            if pool is not None:
+                metrics.counter("tools.process_calls").inc()
+                value, queue_ms, exec_ms = await pool.run(func, args, kwargs, timeout)
+            else:
+                metrics.counter("tools.thread_calls").inc()
+                value, queue_ms, exec_ms = await _run_in_thread(func, args, kwargs, timeout)
+        except asyncio.TimeoutError:
+            metrics.counter(f"tools.{name}.timeouts").inc()
+            raise ToolTimeoutError(f"Tool {name} exceeded its {timeout:g}s budget") from None
+        finally:
+            metrics.histogram(f"tools.{name}.call_ms").observe((time.perf_counter() - started) * 1000)
+            if tracker is not None:
+                tracker.exit()
+        metrics.histogram(f"tools.{name}.queue_ms").observe(queue_ms)
+        metrics.histogram(f"tools.{name}.exec_ms").observe(exec_ms)
+        if tool_span is not None:
+            tool_span.set_attributes({
+                "tool.executor": "process" if pool is not None else "thread",
+                "tool.input_chars": size,
+                "tool.output_chars": len(value) if isinstance(value, str) else 0,
+                "tool.queue_ms": queue_ms,
+                "tool.exec_ms": exec_ms,
+            })
+    return value
+
+
+def async_tool(func):
+    """Wrap a synchronous tool so calls run off the event loop."""
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_tool(func, *args, **kwargs)
+
+    return wrapper
+
+
+def async_tools(funcs: list) -> list:
+    """Wrap a list of synchronous tools with ``async_tool``."""
+    return [async_tool(func) for func in funcs]
+
+
+async def _bind_phase(tracker: ToolPhaseTracker, updates):
+    # Tools of a streamed run execute while the stream is consumed
+    token = _current_phase.set(tracker)
+    try:
+        async for update in updates:
+            yield update
+    finally:
+        try:
+            _current_phase.reset(token)
+        except ValueError:
+            # Closed from another context (e.g. finalized by the event loop): nothing to restore there
+            pass
+
+
+class ToolPhaseMiddleware(AgentMiddleware):
+    """Agent middleware giving each run its own tool-phase tracker."""
+
+    async def process(self, context: AgentRunContext, next) -> None:
+        tracker = ToolPhaseTracker()
+        token = _current_phase.set(tracker)
+        try:
+            await next(context)
+        finally:
+            _current_phase.reset(token)
+        if context.is_streaming and context.result is not None:
+            context.result = _bind_phase(tracker, context.result)
@@ -0,0 +1,27 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+"""
+Tool Worker Process
+
+Entry point of the worker processes used by ``tool_engine`` for large tool
+inputs. Kept free of heavy imports so a worker starts quickly; the tool
+modules are imported on the first call.
+"""
+
+import time
+
+
+def serve(conn) -> None:
+    """Run tool calls received on `conn` until the parent closes it."""
+    while True:
+        try:
+            func, args, kwargs = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            return
+        started = time.perf_counter()
+        try:
+            value = func(*args, **kwargs)
+        except Exception as exc:
+            conn.send(("error", f"{type(exc).__name__}: {exc}", (time.perf_counter() - started) * 1000))
+        else:
+            conn.send(("ok", value, (time.perf_counter() - started) * 1000))
@@ -8,11 +8,90 @@ and providing modernization guidance to Microsoft Agent Framework.
 """
 
 import re
+from itertools import islice
 from typing import Annotated
 
+from artifacts import read_lines, resolve_code_ref, store_if_large
+
+
+# Detection patterns are compiled once at import time so that importing this
+# module is enough to warm them up.
+
+# Semantic Kernel patterns
+_SK_PATTERNS = {
+    "kernel_import": re.compile(r"from\s+semantic_kernel|import\s+semantic_kernel", re.IGNORECASE),
+    "kernel_creation": re.compile(r"Kernel\(\)|kernel\s*=\s*Kernel", re.IGNORECASE),
+    "plugin_import": re.compile(r"from\s+semantic_kernel\.functions|\.plugins", re.IGNORECASE),
+    "chat_completion": re.compile(r"ChatCompletionClientBase|add_chat_service", re.IGNORECASE),
+    "native_function": re.compile(r"@kernel_function|@sk_function", re.IGNORECASE),
+    "prompt_template": re.compile(r"PromptTemplateConfig|ChatPromptTemplate", re.IGNORECASE),
+    "planner": re.compile(r"ActionPlanner|SequentialPlanner|StepwisePlanner", re.IGNORECASE),
+    "memory": re.compile(r"SemanticTextMemory|VolatileMemoryStore", re.IGNORECASE),
+    "connector": re.compile(r"AzureChatCompletion|OpenAIChatCompletion", re.IGNORECASE),
+}
+
+# AutoGen patterns
+_AUTOGEN_PATTERNS = {
+    "autogen_import": re.compile(r"from\s+autogen|import\s+autogen|from\s+pyautogen|import\s+pyautogen", re.IGNORECASE),
+    "assistant_agent": re.compile(r"AssistantAgent\(|ConversableAgent\(", re.IGNORECASE),
+    "user_proxy": re.compile(r"UserProxyAgent\(", re.IGNORECASE),
+    "group_chat": re.compile(r"GroupChat\(|GroupChatManager\(", re.IGNORECASE),
+    "config_list": re.compile(r"config_list|llm_config", re.IGNORECASE),
+    "code_execution": re.compile(r"code_execution_config|CodeExecutorAgent", re.IGNORECASE),
+    "function_calling": re.compile(r"register_function|function_map", re.IGNORECASE),
+    "nested_chat": re.compile(r"register_nested_chats|nested_chat", re.IGNORECASE),
+}
+
+_IMPORT_PATTERN = re.compile(r"^(?:from|import)\s+[\w\.]+.*$", re.MULTILINE)
+
+# Extraction patterns run on pastes of any size, so none of them may rescan
+# the input: each is anchored (line start, word start or a literal) and only
+# ever searched forward from the previous match, which keeps extraction linear
+# in the input size. What is collected is capped as well.
+_SK_DECORATOR_PATTERN = re.compile(r"@(?:kernel_function|sk_function)")
+_DEF_PATTERN = re.compile(r"^[ \t]*(?:async[ \t]+)?def[ \t]+(\w+)", re.MULTILINE)
+_SK_INSTRUCTION_PATTERN = re.compile(r"(?:system_message|instructions?)\s*[=:]\s*[\"']([^\"'\n]{1,2000})[\"']")
+_AUTOGEN_INSTRUCTION_PATTERN = re.compile(r"system_message\s*[=:]\s*[\"']([^\"'\n]{1,2000})[\"']")
+_AGENT_PATTERN = re.compile(r"(?<!\w)(\w+)\s*=\s*(?:AssistantAgent|ConversableAgent|UserProxyAgent)\(")
+
+# Most names collected by one extraction
+_MAX_EXTRACTED = 50
+
+
+def _decorated_functions(code: str) -> list[str]:
+    """Names of the functions defined under @kernel_function / @sk_function decorators."""
+    names = []
+    position = 0
+    while len(names) < _MAX_EXTRACTED:
+        decorator = _SK_DECORATOR_PATTERN.search(code, position)
+        if decorator is None:
+            break
+        # Stacked decorators share the next def, so the search resumes after it
+        definition = _DEF_PATTERN.search(code, decorator.end())
+        if definition is None:
+            break
+        names.append(definition.group(1))
+        position = definition.end()
+    return names
+
+
+def _first_instruction(pattern: re.Pattern, code: str) -> str:
+    """The first quoted instruction string matched by `pattern`, or the default."""
+    match = pattern.search(code)
+    return match.group(1) if match else "You are a helpful AI assistant."
+
+
+def detect_framework(code: str) -> str | None:
+    """Return "semantic_kernel" or "autogen" if the code imports that framework, else None."""
+    if _SK_PATTERNS["kernel_import"].search(code):
+        return "semantic_kernel"
+    if _AUTOGEN_PATTERNS["autogen_import"].search(code):
+        return "autogen"
+    return None
+
 
 def analyze_code_patterns(
-    code: Annotated[str, "The source code to analyze for AI agent patterns."],
+    code: Annotated[str, "The source code to analyze for AI agent patterns, or an uploaded 'code_ref=sha256:...'."],
 ) -> str:
     """
     Analyze source code to identify Semantic Kernel or AutoGen patterns.
@@ -20,6 +99,9 @@ def analyze_code_patterns(
     Returns a detailed analysis of the detected framework, patterns used,
     and recommendations for modernization.
     """
+    code = resolve_code_ref(code)
+    if code is None:
+        return "Unknown code reference. Upload the file to POST /uploads and pass the returned ref."
     analysis = {
         "framework": "unknown",
         "patterns_found": [],
@@ -27,40 +109,15 @@ def analyze_code_patterns(
         "modernization_notes": []
     }
     
-    # Detect Semantic Kernel patterns
-    sk_patterns = {
-        "kernel_import": r"from\s+semantic_kernel|import\s+semantic_kernel",
-        "kernel_creation": r"Kernel\(\)|kernel\s*=\s*Kernel",
-        "plugin_import": r"from\s+semantic_kernel\.functions|\.plugins",
-        "chat_completion": r"ChatCompletionClientBase|add_chat_service",
-        "native_function": r"@kernel_function|@sk_function",
-        "prompt_template": r"PromptTemplateConfig|ChatPromptTemplate",
-        "planner": r"ActionPlanner|SequentialPlanner|StepwisePlanner",
-        "memory": r"SemanticTextMemory|VolatileMemoryStore",
-        "connector": r"AzureChatCompletion|OpenAIChatCompletion",
-    }
-    
-    # Detect AutoGen patterns
-    autogen_patterns = {
-        "autogen_import": r"from\s+autogen|import\s+autogen|from\s+pyautogen|import\s+pyautogen",
-        "assistant_agent": r"AssistantAgent\(|ConversableAgent\(",
-        "user_proxy": r"UserProxyAgent\(",
-        "group_chat": r"GroupChat\(|GroupChatManager\(",
-        "config_list": r"config_list|llm_config",
-        "code_execution": r"code_execution_config|CodeExecutorAgent",
-        "function_calling": r"register_function|function_map",
-        "nested_chat": r"register_nested_chats|nested_chat",
-    }
-    
     sk_matches = []
     autogen_matches = []
     
-    for pattern_name, pattern in sk_patterns.items():
-        if re.search(pattern, code, re.IGNORECASE):
+    for pattern_name, pattern in _SK_PATTERNS.items():
+        if pattern.search(code):
             sk_matches.append(pattern_name)
     
-    for pattern_name, pattern in autogen_patterns.items():
-        if re.search(pattern, code, re.IGNORECASE):
+    for pattern_name, pattern in _AUTOGEN_PATTERNS.items():
+        if pattern.search(code):
             autogen_matches.append(pattern_name)
     
     # Determine primary framework
@@ -72,9 +129,8 @@ def analyze_code_patterns(
         analysis["patterns_found"] = autogen_matches
     
     # Extract imports
-    import_pattern = r"^(?:from|import)\s+[\w\.]+.*$"
-    imports = re.findall(import_pattern, code, re.MULTILINE)
-    analysis["imports"] = imports[:20]  # Limit to first 20 imports
+    imports = islice(_IMPORT_PATTERN.finditer(code), 20)  # Limit to first 20 imports
+    analysis["imports"] = [match.group(0) for match in imports]
     
     # Generate modernization notes based on patterns
     if analysis["framework"] == "semantic_kernel":
@@ -161,7 +217,7 @@ def _get_autogen_modernization_notes(patterns: list[str]) -> list[str]:
 
 
 def generate_modernized_code(
-    original_code: Annotated[str, "The original Semantic Kernel or AutoGen code to modernize."],
+    original_code: Annotated[str, "The original Semantic Kernel or AutoGen code to modernize, or an uploaded 'code_ref=sha256:...'."],
     framework: Annotated[str, "The source framework: 'semantic_kernel' or 'autogen'."],
 ) -> str:
     """
@@ -170,11 +226,14 @@ def generate_modernized_code(
     Provides a complete, working example that maintains the same functionality
     but uses Agent Framework patterns and best practices.
     """
+    original_code = resolve_code_ref(original_code)
+    if original_code is None:
+        return "Unknown code reference. Upload the file to POST /uploads and pass the returned ref."
     
     if framework.lower() in ["semantic_kernel", "sk", "semantickernel"]:
-        return _generate_from_semantic_kernel(original_code)
+        return store_if_large(_generate_from_semantic_kernel(original_code), "Modernized code")
     elif framework.lower() in ["autogen", "pyautogen", "auto-gen"]:
-        return _generate_from_autogen(original_code)
+        return store_if_large(_generate_from_autogen(original_code), "Modernized code")
     else:
         return "Unable to determine source framework. Please specify 'semantic_kernel' or 'autogen'."
 
@@ -183,13 +242,10 @@ def _generate_from_semantic_kernel(code: str) -> str:
     """Generate Agent Framework code from Semantic Kernel patterns."""
     
     # Extract function names that look like tools
-    function_pattern = r"@(?:kernel_function|sk_function).*?\ndef\s+(\w+)"
-    functions = re.findall(function_pattern, code, re.DOTALL)
+    functions = _decorated_functions(code)
     
     # Extract any instructions/system messages
-    instruction_pattern = r"(?:system_message|instructions?)\s*[=:]\s*[\"']([^\"']+)[\"']"
-    instructions = re.findall(instruction_pattern, code)
-    default_instructions = instructions[0] if instructions else "You are a helpful AI assistant."
+    default_instructions = _first_instruction(_SK_INSTRUCTION_PATTERN, code)
     
     tools_code = ""
     if functions:
@@ -288,13 +344,10 @@ def _generate_from_autogen(code: str) -> str:
     has_user_proxy = bool(re.search(r"UserProxyAgent", code))
     
     # Extract agent names
-    agent_pattern = r"(\w+)\s*=\s*(?:AssistantAgent|ConversableAgent|UserProxyAgent)\("
-    agent_names = re.findall(agent_pattern, code)
+    agent_names = [match.group(1) for match in islice(_AGENT_PATTERN.finditer(code), _MAX_EXTRACTED)]
     
     # Extract instructions
-    instruction_pattern = r"system_message\s*[=:]\s*[\"']([^\"']+)[\"']"
-    instructions = re.findall(instruction_pattern, code)
-    default_instructions = instructions[0] if instructions else "You are a helpful AI assistant."
+    default_instructions = _first_instruction(_AUTOGEN_INSTRUCTION_PATTERN, code)
     
     if has_group_chat and len(agent_names) > 1:
         return _generate_multi_agent_workflow(agent_names, default_instructions)
@@ -523,13 +576,24 @@ def get_migration_guide(
     """
     
     if source_framework.lower() in ["semantic_kernel", "sk"]:
-        return _get_sk_migration_guide()
+        return store_if_large(_get_sk_migration_guide(), "Migration guide")
     elif source_framework.lower() in ["autogen", "pyautogen"]:
-        return _get_autogen_migration_guide()
+        return store_if_large(_get_autogen_migration_guide(), "Migration guide")
     else:
         return "Please specify 'semantic_kernel' or 'autogen' as the source framework."
 
 
+def fetch_artifact(
+    handle: Annotated[str, "Artifact handle returned by another tool, e.g. 'sha256:...'."],
+    range: Annotated[str, "1-based inclusive line range such as '1-80'; empty reads from the start."] = "",
+) -> str:
+    """
+    Read a slice of a large tool output (generated code or migration guide)
+    that was stored as an artifact instead of being returned inline.
+    """
+    return read_lines(handle, range)
+
+
 def _get_sk_migration_guide() -> str:
     """Get Semantic Kernel to Agent Framework migration guide."""
     return """
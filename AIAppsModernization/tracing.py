@@ -0,0 +1,230 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+"""
+Tracing
+
+OpenTelemetry spans that break a slow request down into its parts:
+- ``<METHOD> <path>``: a server span per HTTP request (TracingMiddleware),
+  continuing the trace of the incoming ``traceparent`` / ``tracestate`` headers
+- ``sanitize_payload``: the SanitizePayloadMiddleware rewrite
+- ``agent.run``: each agent run, with ``cache.hit`` from the response cache
+- ``model.call``: each model round trip (every retry and hedge on its own)
+- ``tool.<name>``: each tool call, with input / output size, executor and
+  queue / execution time
+
+TRACING_EXPORTER selects where spans go (comma-separated): ``console``,
+``file`` (one JSON span per line in TRACING_FILE), ``otlp`` (a local
+collector, configured through the standard OTEL_EXPORTER_OTLP_* variables) or
+``azure_monitor`` (APPLICATIONINSIGHTS_CONNECTION_STRING). Tracing is off
+when it is unset; OpenTelemetry is optional and without it every helper here
+is a no-op.
+"""
+
+import logging
+import os
+from contextlib import contextmanager
+from pathlib import Path
+
+from agent_framework import AgentMiddleware, AgentRunContext, ChatContext, ChatMiddleware
+
+try:
+    from opentelemetry import propagate, trace
+except ImportError:  # Optional dependency
+    propagate = trace = None
+
+from token_budget import prompt_tokens
+
+logger = logging.getLogger("tracing")
+
+_tracer = None
+
+
+def _create_exporter(name: str):
+    """Create the span exporter for one TRACING_EXPORTER entry, or None."""
+    try:
+        if name == "console":
+            from opentelemetry.sdk.trace.export import ConsoleSpanExporter
+
+            return ConsoleSpanExporter()
+        if name == "file":
+            from opentelemetry.sdk.trace.export import ConsoleSpanExporter
+
+            default_path = Path(__file__).with_name(".cache") / "traces.jsonl"
+            path = Path(os.getenv("TRACING_FILE", str(default_path)))
+            path.parent.mkdir(parents=True, exist_ok=True)
+            return ConsoleSpanExporter(
+                out=path.open("a", encoding="utf-8"),
+                formatter=lambda span: span.to_json(indent=None) + "\n",
+            )
+        if name == "otlp":
+            if os.getenv("OTEL_EXPORTER_OTLP_PROTOCOL", "grpc") == "grpc":
+                from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+            else:
+                from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+
+            return OTLPSpanExporter()
+        if name == "azure_monitor":
+            from azure.monitor.opentelemetry.exporter import AzureMonitorTraceExporter
+
+            return AzureMonitorTraceExporter()
+    except ImportError as exc:
+        logger.warning("Span exporter %r is unavailable: %s", name, exc)
+        return None
+    logger.warning("Unknown TRACING_EXPORTER entry %r", name)
+    return None
+
+
+def setup_tracing() -> bool:
+    """Configure span export from TRACING_* environment variables; returns True if tracing is on."""
+    global _tracer
+    if _tracer is not None:
+        return True
+    names = [name.strip().lower() for name in os.getenv("TRACING_EXPORTER", "").split(",") if name.strip()]
+    if not names or names == ["none"]:
+        return False
+    try:
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    except ImportError:
+        logger.warning("TRACING_EXPORTER is set but opentelemetry-sdk is not installed; tracing is off")
+        return False
+
+    exporters = [exporter for exporter in map(_create_exporter, names) if exporter is not None]
+    if not exporters:
+        return False
+    provider = trace.get_tracer_provider()
+    if not isinstance(provider, TracerProvider):
+        # Nobody (e.g. the agent server) has installed an SDK provider yet
+        resource = Resource.create({"service.name": os.getenv("OTEL_SERVICE_NAME", "ai-code-modernizer")})
+        provider = TracerProvider(resource=resource)
+        trace.set_tracer_provider(provider)
+    for exporter in exporters:
+        provider.add_span_processor(BatchSpanProcessor(exporter))
+    _tracer = trace.get_tracer("ai-code-modernizer")
+    return True
+
+
+def enabled() -> bool:
+    return _tracer is not None
+
+
+@contextmanager
+def span(name: str, attributes: dict | None = None):
+    """Run the block in a child span of the current one; yields None when tracing is off."""
+    if _tracer is None:
+        yield None
+        return
+    with _tracer.start_as_current_span(name, attributes=attributes) as current:
+        yield current
+
+
+def annotate(attributes: dict) -> None:
+    """Set attributes on the current span."""
+    if _tracer is not None:
+        trace.get_current_span().set_attributes(attributes)
+
+
+async def _traced_stream(current, updates, size_attribute: str):
+    """Pass streamed updates through inside `current`, ending it with the stream."""
+    with trace.use_span(current, end_on_exit=True):
+        chars = 0
+        try:
+            async for update in updates:
+                chars += len(update.text or "")
+                yield update
+        finally:
+            current.set_attribute(size_attribute, chars)
+
+
+class TracingMiddleware:
+    """Raw ASGI middleware opening a server span per HTTP request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or _tracer is None:
+            await self.app(scope, receive, send)
+            return
+
+        carrier = {
+            key.decode("latin-1").lower(): value.decode("latin-1")
+            for key, value in scope.get("headers") or []
+        }
+        method = scope.get("method", "GET")
+        path = scope.get("path", "")
+        response = {}
+
+        async def traced_send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+            await send(message)
+
+        with _tracer.start_as_current_span(
+            f"{method} {path}",
+            context=propagate.extract(carrier),
+            kind=trace.SpanKind.SERVER,
+            attributes={"http.request.method": method, "url.path": path},
+        ) as current:
+            await self.app(scope, receive, traced_send)
+            status = response.get("status", 0)
+            current.set_attribute("http.response.status_code", status)
+            if status >= 500:
+                current.set_status(trace.StatusCode.ERROR)
+
+
+class TracingAgentMiddleware(AgentMiddleware):
+    """Agent middleware opening a span per agent run; streamed runs end with their stream."""
+
+    async def process(self, context: AgentRunContext, next) -> None:
+        run_span = _tracer.start_span(
+            "agent.run",
+            attributes={
+                "agent.streaming": context.is_streaming,
+                "agent.input_messages": len(context.messages),
+                "agent.input_chars": sum(len(message.text or "") for message in context.messages),
+            },
+        )
+        try:
+            with trace.use_span(run_span):
+                await next(context)
+        except BaseException:
+            run_span.end()
+            raise
+        if context.is_streaming and context.result is not None:
+            context.result = _traced_stream(run_span, context.result, "agent.output_chars")
+            return
+        if context.result is not None:
+            run_span.set_attribute("agent.output_chars", len(context.result.text or ""))
+        run_span.end()
+
+
+class TracingChatMiddleware(ChatMiddleware):
+    """Chat middleware opening a span per model round trip."""
+
+    async def process(self, context: ChatContext, next) -> None:
+        call_span = _tracer.start_span(
+            "model.call",
+            attributes={
+                "model.streaming": context.is_streaming,
+                "model.prompt_messages": len(context.messages),
+                "model.prompt_tokens_estimate": prompt_tokens(context.messages),
+            },
+        )
+        try:
+            with trace.use_span(call_span):
+                await next(context)
+        except BaseException:
+            call_span.end()
+            raise
+        if context.is_streaming and context.result is not None:
+            context.result = _traced_stream(call_span, context.result, "model.output_chars")
+            return
+        usage = getattr(context.result, "usage_details", None)
+        if usage is not None:
+            call_span.set_attributes({
+                "gen_ai.usage.input_tokens": usage.input_token_count or 0,
+                "gen_ai.usage.output_tokens": usage.output_token_count or 0,
+            })
+        call_span.end()
@@ -0,0 +1,273 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+"""
+Code Validation
+
+Static checks of generated Agent Framework code, so broken output is caught
+before a human reads it:
+- the code parses and compiles
+- ``agent_framework`` imports name symbols the installed package exports
+  (its public names and those of its submodules, or SYMBOLS_FILE when it is
+  not installed), extended with VALIDATION_EXTRA_SYMBOLS such as
+  ``agent_framework:NewThing``
+- no Semantic Kernel or AutoGen imports are left
+- every tool (``@ai_function`` functions and functions passed as ``tools=``)
+  annotates its parameters with ``Annotated``
+
+``check_code`` is a pure function; ``Validator`` runs it in a pool of worker
+processes for many files and caches results by the sha256 of the code (and of
+the rules) in a local SQLite store, so unchanged files are never checked twice.
+"""
+
+import ast
+import functools
+import hashlib
+import importlib
+import json
+import multiprocessing
+import os
+import pkgutil
+import sqlite3
+import threading
+import types
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+# Allow-list of the pinned agent_framework, written by generate_symbols.py and
+# used only when the package is not importable
+SYMBOLS_FILE = Path(__file__).with_name("agent_framework_symbols.json")
+
+# Top-level packages of the frameworks being migrated away from
+LEGACY_PACKAGES = frozenset({
+    "semantic_kernel", "autogen", "autogen_agentchat", "autogen_core", "autogen_ext", "pyautogen",
+})
+
+# Bump when the checks change so cached results are not reused
+_RULES_VERSION = 2
+# Below this many uncached files, checking in-process beats starting workers
+_POOL_MIN_FILES = 64
+
+
+# Pool workers receive the parent's allow-list instead of importing agent_framework
+_worker_allowed: dict[str, frozenset] | None = None
+
+
+def _public_names(module) -> set[str]:
+    names = getattr(module, "__all__", None) or [name for name in dir(module) if not name.startswith("_")]
+    return {name for name in names if not isinstance(vars(module).get(name), types.ModuleType)}
+
+
+def installed_symbols() -> dict[str, frozenset] | None:
+    """Public symbols of the installed agent_framework and its submodules, or None if not importable."""
+    try:
+        import agent_framework
+    except ImportError:
+        return None
+    symbols = {"agent_framework": _public_names(agent_framework)}
+    for info in pkgutil.iter_modules(agent_framework.__path__):
+        if info.name.startswith("_"):
+            continue
+        try:
+            module = importlib.import_module(f"agent_framework.{info.name}")
+        except ImportError:
+            # Needs an optional dependency that is not installed, so generated code could not import it either
+            continue
+        symbols[module.__name__] = _public_names(module)
+        symbols["agent_framework"].add(info.name)
+    return {module: frozenset(names) for module, names in symbols.items()}
+
+
+@functools.lru_cache(maxsize=1)
+def base_symbols() -> dict[str, frozenset]:
+    """The allow-list of the installed agent_framework, or of SYMBOLS_FILE without it."""
+    symbols = installed_symbols()
+    if symbols is None:
+        modules = json.loads(SYMBOLS_FILE.read_text(encoding="utf-8"))["modules"]
+        symbols = {module: frozenset(names) for module, names in modules.items()}
+    return symbols
+
+
+def _allowed_symbols() -> dict[str, frozenset]:
+    """The allow-list extended with VALIDATION_EXTRA_SYMBOLS."""
+    if _worker_allowed is not None:
+        return _worker_allowed
+    return _extend_allowed(os.getenv("VALIDATION_EXTRA_SYMBOLS", ""))
+
+
+def _init_worker(allowed: dict[str, frozenset]) -> None:
+    global _worker_allowed
+    _worker_allowed = allowed
+
+
+@functools.lru_cache(maxsize=4)
+def _extend_allowed(extra: str) -> dict[str, frozenset]:
+    allowed = {module: set(names) for module, names in base_symbols().items()}
+    for entry in extra.split(","):
+        module, _, name = entry.strip().partition(":")
+        if module and name:
+            allowed.setdefault(module, set()).add(name)
+    return {module: frozenset(names) for module, names in allowed.items()}
+
+
+def rules_key() -> str:
+    """Fingerprint of the rules in effect, part of every cache key."""
+    rules = json.dumps({module: sorted(names) for module, names in sorted(_allowed_symbols().items())})
+    return hashlib.sha256(f"{_RULES_VERSION}:{rules}".encode("utf-8")).hexdigest()[:16]
+
+
+def _is_annotated(annotation) -> bool:
+    if isinstance(annotation, ast.Subscript):
+        annotation = annotation.value
+    return (isinstance(annotation, ast.Name) and annotation.id == "Annotated") or (
+        isinstance(annotation, ast.Attribute) and annotation.attr == "Annotated"
+    )
+
+
+def _is_ai_function(decorator) -> bool:
+    target = decorator.func if isinstance(decorator, ast.Call) else decorator
+    return getattr(target, "id", None) == "ai_function" or getattr(target, "attr", None) == "ai_function"
+
+
+def _check_tree(tree: ast.AST, allowed: dict[str, frozenset]) -> list[str]:
+    """Check imports and tool signatures in one walk over the tree."""
+    problems = []
+    functions = []
+    tools = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            modules = [(alias.name, None) for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            modules = [(node.module, [alias.name for alias in node.names])]
+        else:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                functions.append(node)
+                if any(_is_ai_function(decorator) for decorator in node.decorator_list):
+                    tools.add(node.name)
+            elif isinstance(node, ast.keyword) and node.arg == "tools":
+                values = node.value.elts if isinstance(node.value, (ast.List, ast.Tuple)) else [node.value]
+                tools.update(value.id for value in values if isinstance(value, ast.Name))
+            continue
+        for module, names in modules:
+            package = module.split(".")[0]
+            if package in LEGACY_PACKAGES:
+                problems.append(f"line {node.lineno}: leftover import of {module}")
+            elif package == "agent_framework":
+                if module not in allowed:
+                    problems.append(f"line {node.lineno}: unknown module {module}")
+                    continue
+                for name in names or []:
+                    if name != "*" and name not in allowed[module]:
+                        problems.append(f"line {node.lineno}: {module} has no symbol {name}")
+
+    for node in functions:
+        if node.name not in tools:
+            continue
+        for argument in node.args.posonlyargs + node.args.args + node.args.kwonlyargs:
+            if argument.arg not in ("self", "cls") and not _is_annotated(argument.annotation):
+                problems.append(f"line {node.lineno}: tool {node.name} parameter {argument.arg} is not Annotated")
+    return problems
+
+
+def check_code(code: str, filename: str = "<generated>") -> list[str]:
+    """Return the problems found in a piece of generated code (empty if valid)."""
+    try:
+        tree = ast.parse(code, filename=filename)
+    except SyntaxError as exc:
+        return [f"line {exc.lineno}: syntax error: {exc.msg}"]
+    except ValueError as exc:  # e.g. null bytes
+        return [f"does not parse: {exc}"]
+    problems = _check_tree(tree, _allowed_symbols())
+    try:
+        # Catches what parses but cannot compile, e.g. 'await' outside a function
+        compile(tree, filename, "exec")
+    except SyntaxError as exc:
+        problems.append(f"line {exc.lineno}: syntax error: {exc.msg}")
+    return problems
+
+
+class ValidationCache:
+    """SQLite cache of validation results by code hash and rules fingerprint.
+
+    Thread-safe: concurrent ``asyncio.to_thread`` validations share the connection under a lock.
+    """
+
+    def __init__(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA busy_timeout=5000")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, problems TEXT NOT NULL)"
+        )
+
+    @classmethod
+    def from_env(cls) -> "ValidationCache | None":
+        default_path = Path(__file__).with_name(".cache") / "validation.db"
+        path = os.getenv("VALIDATION_CACHE", str(default_path))
+        return cls(path) if path else None
+
+    def get_many(self, keys: list[str]) -> dict[str, list[str]]:
+        found = {}
+        # Stay under SQLite's limit on bound parameters
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            with self._lock:
+                rows = self._db.execute(
+                    f"SELECT key, problems FROM results WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+            found.update((key, json.loads(problems)) for key, problems in rows)
+        return found
+
+    def put_many(self, results: dict[str, list[str]]) -> None:
+        rows = [(key, json.dumps(problems)) for key, problems in results.items()]
+        with self._lock:
+            self._db.executemany("INSERT OR REPLACE INTO results (key, problems) VALUES (?, ?)", rows)
+
+
+class Validator:
+    """Validates generated code with cached results, in worker processes for many files."""
+
+    def __init__(self, cache: ValidationCache | None = None, workers: int | None = None):
+        self.cache = cache
+        self.workers = workers or os.cpu_count() or 1
+        self.cached = 0
+
+    @classmethod
+    def from_env(cls) -> "Validator":
+        workers = int(os.getenv("VALIDATION_WORKERS", "0"))
+        return cls(ValidationCache.from_env(), workers=workers or None)
+
+    def validate(self, code: str, filename: str = "<generated>") -> list[str]:
+        """Return the problems of one piece of code."""
+        return self.validate_many([code], [filename])[0]
+
+    def validate_many(self, codes: list[str], filenames: list[str] | None = None) -> list[list[str]]:
+        """Return the problems of each piece of code, checking uncached ones in parallel."""
+        filenames = filenames or ["<generated>"] * len(codes)
+        rules = rules_key()
+        keys = [f"{rules}:{hashlib.sha256(code.encode('utf-8')).hexdigest()}" for code in codes]
+        results = self.cache.get_many(list(set(keys))) if self.cache is not None else {}
+        self.cached += sum(key in results for key in keys)
+
+        # Identical outputs are checked once
+        pending = {key: index for index, key in enumerate(keys) if key not in results}
+        indexes = list(pending.values())
+        pending_codes = [codes[index] for index in indexes]
+        pending_names = [filenames[index] for index in indexes]
+        if len(indexes) >= _POOL_MIN_FILES and self.workers > 1:
+            chunksize = max(1, len(indexes) // (self.workers * 4))
+            with ProcessPoolExecutor(
+                self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(_allowed_symbols(),),
+            ) as pool:
+                checked = list(pool.map(check_code, pending_codes, pending_names, chunksize=chunksize))
+        else:
+            checked = list(map(check_code, pending_codes, pending_names))
+        new_results = dict(zip(pending, checked))
+        if self.cache is not None and new_results:
+            self.cache.put_many(new_results)
+        results.update(new_results)
+        return [results[key] for key in keys]
@@ -0,0 +1,142 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+"""
+Startup Warm-up
+
+Before the HTTP server reports itself ready, every replica:
+1. runs each tool on bundled Semantic Kernel and AutoGen samples
+2. prefetches the credential token
+3. performs a minimal model round trip (or a stub call in offline mode)
+
+``GET /readiness`` answers 503 until all of that succeeded, so new Container
+Apps replicas do not receive traffic while their first request would be slow.
+"""
+
+import asyncio
+import logging
+import os
+import time
+
+import metrics
+from asgi_utils import send_json
+
+logger = logging.getLogger("warmup")
+
+SAMPLE_SEMANTIC_KERNEL = '''\
+from semantic_kernel import Kernel
+from semantic_kernel.connectors.ai.open_ai import AzureChatCompletion
+from semantic_kernel.functions import kernel_function
+
+kernel = Kernel()
+kernel.add_service(AzureChatCompletion(service_id="chat"))
+
+class WeatherPlugin:
+    @kernel_function(name="get_weather", description="Get the weather")
+    def get_weather(self, city: str) -> str:
+        return f"Sunny in {city}"
+
+kernel.add_plugin(WeatherPlugin(), plugin_name="weather")
+'''
+
+SAMPLE_AUTOGEN = '''\
+from autogen import AssistantAgent, UserProxyAgent, GroupChat, GroupChatManager
+
+config_list = [{"model": "gpt-4o"}]
+writer = AssistantAgent(name="writer", system_message="You write.", llm_config={"config_list": config_list})
+critic = AssistantAgent(name="critic", system_message="You review.", llm_config={"config_list": config_list})
+user = UserProxyAgent(name="user", human_input_mode="NEVER")
+groupchat = GroupChat(agents=[user, writer, critic], messages=[], max_round=4)
+manager = GroupChatManager(groupchat=groupchat)
+'''
+
+_WARMUP_PROMPT = "Reply with the single word OK. Do not call any tools."
+# Delay before retrying a failed warm-up
+_RETRY_SECONDS = float(os.getenv("WARMUP_RETRY_SECONDS", "30"))
+
+
+class WarmupState:
+    """Readiness state shared between the warm-up task and the readiness probe."""
+
+    def __init__(self):
+        self.ready = False
+        self.error: str | None = None
+        self.stages: dict[str, float] = {}
+
+    def to_dict(self) -> dict:
+        status = "ready" if self.ready else ("failed" if self.error else "warming_up")
+        payload = {"status": status, "stages_ms": self.stages}
+        if self.error and not self.ready:
+            payload["error"] = self.error
+        return payload
+
+
+def warm_up_tools() -> None:
+    """Run every tool once on the bundled samples."""
+    from tools import analyze_code_patterns, generate_modernized_code, get_migration_guide
+
+    for framework, sample in (("semantic_kernel", SAMPLE_SEMANTIC_KERNEL), ("autogen", SAMPLE_AUTOGEN)):
+        analyze_code_patterns(sample)
+        generate_modernized_code(sample, framework)
+        get_migration_guide(framework)
+
+
+def _is_offline() -> bool:
+    return os.getenv("WARMUP_MODEL_CALL", "live").lower() in ("stub", "off", "offline")
+
+
+async def _stage(state: WarmupState, name: str, coro) -> None:
+    started = time.perf_counter()
+    await coro
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    state.stages[name] = round(elapsed_ms, 1)
+    metrics.histogram(f"warmup.{name}_ms").observe(elapsed_ms)
+
+
+async def run_warmup(agent, credential, state: WarmupState) -> None:
+    """Warm up tools, credential and model connection, then mark the state ready."""
+    await _stage(state, "tools", asyncio.to_thread(warm_up_tools))
+    await _stage(state, "credential", credential.prefetch())
+    if _is_offline():
+        await _stage(state, "model", asyncio.sleep(0))
+    else:
+        from response_cache import bypass_cache
+
+        # Minimal round trip: opens the connection pool and exercises the agent. A
+        # cached answer (e.g. from another replica's warm-up) would prove neither
+        token = bypass_cache.set(True)
+        try:
+            await _stage(state, "model", agent.run(_WARMUP_PROMPT))
+        finally:
+            bypass_cache.reset(token)
+    state.ready = True
+    state.error = None
+    logger.info("Warm-up complete: %s", state.stages)
+
+
+async def warm_up_until_ready(agent, credential, state: WarmupState) -> None:
+    """Run the warm-up, retrying until it succeeds."""
+    while True:
+        try:
+            await run_warmup(agent, credential, state)
+            return
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            state.error = f"{type(exc).__name__}: {exc}"
+            metrics.counter("warmup.failures").inc()
+            logger.warning("Warm-up failed, retrying in %.0f s", _RETRY_SECONDS, exc_info=True)
+            await asyncio.sleep(_RETRY_SECONDS)
+
+
+class ReadinessMiddleware:
+    """Raw ASGI middleware answering ``GET /readiness`` from the warm-up state."""
+
+    def __init__(self, app, state: WarmupState):
+        self.app = app
+        self.state = state
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope.get("method") == "GET" and scope.get("path") == "/readiness":
+            await send_json(send, 200 if self.state.ready else 503, self.state.to_dict())
+            return
+        await self.app(scope, receive, send)
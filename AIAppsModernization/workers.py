@@ -0,0 +1,164 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+"""
+Multi-worker HTTP Serving
+
+The tool functions are CPU-bound Python, so a single asyncio process caps the
+throughput of the HTTP server. This module pre-forks N worker processes that
+accept connections from one shared listening socket. Each worker warms up on
+its own (agent, tools, credential token and model connection, see warmup.py)
+before it starts accepting connections and reports ready.
+
+Signals handled by the supervisor:
+- SIGTERM / SIGINT: stop all workers, letting in-flight streams drain
+- SIGHUP: rolling restart, one worker at a time, new worker ready before the old one drains;
+  if a replacement does not become ready the old worker keeps serving and the restart stops
+
+A crashed worker is respawned after an exponential backoff, so a worker that
+fails at startup (bad configuration, missing credential) does not spin.
+"""
+
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import time
+
+logger = logging.getLogger("workers")
+
+# Seconds a replacement worker gets to warm up during a rolling restart
+_READY_TIMEOUT = 120.0
+# Backoff before respawning a crashed worker: doubles per crash, up to the maximum
+_RESPAWN_BASE_DELAY = 1.0
+_RESPAWN_MAX_DELAY = 60.0
+# A worker that ran this long before exiting resets the backoff
+_STABLE_SECONDS = 60.0
+
+
+def bind_socket(port: int, host: str = "0.0.0.0") -> socket.socket:
+    """Bind the shared listening socket in the supervisor."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+class WorkerSupervisor:
+    """Keeps N worker processes serving one socket, with graceful restarts."""
+
+    def __init__(self, target, workers: int, sock: socket.socket, drain_timeout: float = 30.0):
+        self.target = target
+        self.workers = workers
+        self.sock = sock
+        self.drain_timeout = drain_timeout
+        self._ctx = multiprocessing.get_context("spawn")
+        self._processes: list = []
+        self._started_at: list[float] = []
+        self._crashes: list[int] = []
+        self._respawn_at: list[float | None] = []
+        self._should_exit = False
+        self._should_restart = False
+
+    def run(self) -> None:
+        """Start the workers and supervise them until a stop signal arrives."""
+        signal.signal(signal.SIGINT, self._handle_exit)
+        signal.signal(signal.SIGTERM, self._handle_exit)
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, self._handle_restart)
+
+        for _ in range(self.workers):
+            self._processes.append(self._spawn())
+            self._started_at.append(time.monotonic())
+            self._crashes.append(0)
+            self._respawn_at.append(None)
+        print(f"Supervisor {os.getpid()} running {self.workers} workers")
+
+        while not self._should_exit:
+            time.sleep(0.5)
+            if self._should_restart:
+                self._should_restart = False
+                self._rolling_restart()
+            self._respawn_crashed()
+
+        for process, _ in self._processes:
+            process.terminate()
+        for process, _ in self._processes:
+            self._join(process)
+        self.sock.close()
+
+    def _spawn(self):
+        ready = self._ctx.Event()
+        process = self._ctx.Process(target=self.target, args=(self.sock, ready), daemon=False)
+        process.start()
+        return process, ready
+
+    def _replace(self, index: int, worker) -> None:
+        self._processes[index] = worker
+        self._started_at[index] = time.monotonic()
+        self._respawn_at[index] = None
+
+    def _respawn_crashed(self) -> None:
+        """Respawn workers that exited, after a backoff growing with repeated crashes."""
+        now = time.monotonic()
+        for index, (process, _) in enumerate(self._processes):
+            if process.is_alive() or self._should_exit:
+                continue
+            if self._respawn_at[index] is None:
+                stable = now - self._started_at[index] >= _STABLE_SECONDS
+                self._crashes[index] = 1 if stable else self._crashes[index] + 1
+                delay = min(_RESPAWN_MAX_DELAY, _RESPAWN_BASE_DELAY * 2 ** (self._crashes[index] - 1))
+                self._respawn_at[index] = now + delay
+                logger.warning("Worker %s exited with %s, respawning in %.0fs", process.pid, process.exitcode, delay)
+            elif now >= self._respawn_at[index]:
+                self._replace(index, self._spawn())
+
+    def _rolling_restart(self) -> None:
+        """Replace workers one by one; each old worker drains after its successor is ready.
+
+        Stops at the first replacement that does not become ready, keeping the
+        old worker, so a bad deploy never takes the serving workers down.
+        """
+        for index, (old_process, _) in enumerate(list(self._processes)):
+            if self._should_exit:
+                return
+            process, ready = self._spawn()
+            if not self._wait_ready(process, ready):
+                logger.error("Replacement worker %s did not become ready, aborting the rolling restart", process.pid)
+                process.kill()
+                process.join()
+                return
+            self._replace(index, (process, ready))
+            old_process.terminate()
+            self._join(old_process)
+        print("Rolling restart complete")
+
+    def _wait_ready(self, process, ready) -> bool:
+        """Wait until a new worker is ready; False if it exits or times out first."""
+        deadline = time.monotonic() + _READY_TIMEOUT
+        while time.monotonic() < deadline and process.is_alive():
+            if ready.wait(timeout=0.5):
+                return process.is_alive()
+        return False
+
+    def _join(self, process) -> None:
+        """Wait for a worker to drain its in-flight requests, killing it after the timeout."""
+        process.join(self.drain_timeout + 5)
+        if process.is_alive():
+            logger.warning("Worker %s did not drain in time, killing it", process.pid)
+            process.kill()
+            process.join()
+
+    def _handle_exit(self, signum, frame) -> None:
+        self._should_exit = True
+
+    def _handle_restart(self, signum, frame) -> None:
+        self._should_restart = True
+
+
+def serve_workers(target, workers: int, port: int) -> None:
+    """Bind the shared port and run `target(sock, ready_event)` in N worker processes."""
+    drain_timeout = float(os.getenv("AGENT_SERVER_DRAIN_TIMEOUT", "30"))
+    WorkerSupervisor(target, workers, bind_socket(port), drain_timeout).run()